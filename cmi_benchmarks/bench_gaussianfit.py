@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""Compare analytic and numeric derivatives in GaussianFit.refine.
+
+Usage:
+
+    python -m cmi_benchmarks.bench_gaussianfit [nfits]
+
+Refine the same set of noisy Gaussian peaks with both Jacobian options
+and print the number of residual and Jacobian evaluations and the wall
+time per fit.  The residual count for numeric derivatives includes
+the finite-difference evaluations made by the optimizer.
+"""
+
+from __future__ import print_function
+import sys
+import time
+import numpy
+
+from cmi_plugins.ipy_gaussianfit import GaussianFit
+
+
+def makeSpectra(nfits, seed=0):
+    '''Return x and a stack of nfits noisy Gaussian peaks.
+    '''
+    rng = numpy.random.RandomState(seed)
+    x = numpy.arange(-10, 10, 0.1)
+    x0 = rng.uniform(-3, 3, size=(nfits, 1))
+    sig = rng.uniform(0.8, 2, size=(nfits, 1))
+    Y = numpy.exp(-0.5 * (x - x0)**2 / sig**2)
+    Y += 0.05 * rng.standard_normal(Y.shape)
+    return x, Y
+
+
+def runGaussianFits(x, Y, derivatives):
+    '''Refine every spectrum in Y and collect evaluation statistics.
+
+    Return a dictionary with total residual calls, Jacobian calls,
+    wall time of the refinements and the final chi2 values.
+    '''
+    stats = dict(nresidual=0, njacobian=0, walltime=0.0, chi2=[])
+    for y in Y:
+        fit = GaussianFit(x, y, 0.05 * numpy.ones_like(x), verbose=False)
+        t0 = time.time()
+        fit.refine(derivatives=derivatives)
+        stats['walltime'] += time.time() - t0
+        stats['nresidual'] += fit.nfev
+        stats['njacobian'] += fit.njev
+        stats['chi2'].append(fit.results.chi2)
+    return stats
+
+
+def main(argv):
+    nfits = int(argv[0]) if argv else 50
+    x, Y = makeSpectra(nfits)
+    print("GaussianFit.refine over %i spectra of %i points" % Y.shape)
+    print("%-10s %12s %12s %14s" %
+          ("Jacobian", "residuals", "jacobians", "time/fit [ms]"))
+    results = {}
+    for derivatives in ('numeric', 'analytic'):
+        s = runGaussianFits(x, Y, derivatives)
+        results[derivatives] = s
+        print("%-10s %12i %12i %14.3f" % (derivatives,
+              s['nresidual'], s['njacobian'], 1e3 * s['walltime'] / nfits))
+    chi2n = numpy.array(results['numeric']['chi2'])
+    chi2a = numpy.array(results['analytic']['chi2'])
+    same = numpy.isclose(chi2n, chi2a, rtol=1e-6)
+    print("fits with the same chi2: %i of %i" % (same.sum(), nfits))
+    print("fits with lower chi2 for analytic Jacobian: %i" %
+          (chi2a < chi2n)[~same].sum())
+    return
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
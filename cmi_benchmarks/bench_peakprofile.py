@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""Compare PDF calculation speed for built-in and Python peak profiles.
+
+Usage:
+
+    python -m cmi_benchmarks.bench_peakprofile [rmax]
+
+Calculate the Ni PDF from cmi_scripts/pdfrectprofile up to rmax with
+the default gaussian profile of PDFCalculator, with RectangleProfile
+evaluated point-by-point by PDFCalculator and with RectangleProfile
+summed over numpy arrays by ArrayPDFCalculator.  The same two cases are
+timed for a Gaussian shape tabulated by TabulatedProfile.  Prints the
+wall time for each case and the largest difference between the two
+RectangleProfile curves.
+"""
+
+from __future__ import print_function
+import sys
+import time
+import numpy
+
+from cmi_benchmarks.workloads import scriptPath
+
+
+def timeCalculation(calc, stru, repeat=1):
+    '''Return the best wall time and the (r, G) result of calc(stru).
+    '''
+    times = []
+    for i in range(repeat):
+        t0 = time.time()
+        r, g = calc(stru)
+        times.append(time.time() - t0)
+    return min(times), r, g
+
+
+def main(argv):
+    rmax = float(argv[0]) if argv else 10.0
+    sys.path.insert(0, scriptPath('pdfrectprofile'))
+    from rectangleprofile import RectangleProfile
+    from arrayprofile import ArrayPDFCalculator
+    from tabulatedprofile import TabulatedProfile, gaussianShape
+    from diffpy.Structure import loadStructure
+    from diffpy.srreal.pdfcalculator import PDFCalculator
+    ni = loadStructure(scriptPath('pdfrectprofile', 'ni.cif'))
+    ni.Uisoequiv = 0.005
+    pcgauss = PDFCalculator(rmax=rmax)
+    pcrect = PDFCalculator(rmax=rmax)
+    pcrect.peakprofile = RectangleProfile()
+    pcarray = ArrayPDFCalculator(RectangleProfile(),
+                                 rmax=pcrect.rmax, rstep=pcrect.rstep)
+    tgauss = TabulatedProfile(gaussianShape, 'tabulatedgaussian')
+    pctab = PDFCalculator(rmax=rmax)
+    pctab.peakprofile = tgauss
+    pctabarray = ArrayPDFCalculator(tgauss,
+                                    rmax=pctab.rmax, rstep=pctab.rstep)
+    print("Ni PDF up to rmax=%g" % rmax)
+    print("%-40s %12s" % ("calculation", "time [ms]"))
+    results = {}
+    for name, calc, repeat in (
+            ('PDFCalculator gaussian', pcgauss, 5),
+            ('PDFCalculator RectangleProfile', pcrect, 1),
+            ('ArrayPDFCalculator RectangleProfile', pcarray, 5),
+            ('PDFCalculator TabulatedProfile', pctab, 1),
+            ('ArrayPDFCalculator TabulatedProfile', pctabarray, 5)):
+        t, r, g = timeCalculation(calc, ni, repeat)
+        results[name] = (r, g)
+        print("%-40s %12.2f" % (name, 1e3 * t))
+    r1, g1 = results['PDFCalculator RectangleProfile']
+    r2, g2 = results['ArrayPDFCalculator RectangleProfile']
+    if r1.shape == r2.shape and numpy.allclose(r1, r2):
+        print("max |G difference| for RectangleProfile: %g" %
+              numpy.max(numpy.fabs(g1 - g2)))
+    else:
+        print("RectangleProfile calculations use different r-grids.")
+    return
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
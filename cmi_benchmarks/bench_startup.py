@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""Measure time needed to load the cmi_plugins IPython extensions.
+
+Usage:
+
+    python -m cmi_benchmarks.bench_startup [--repeat=N] [--json=FILE]
+
+Every variant is loaded in a new Python process so that the import caches
+are empty.  The lazy variant uses the cmi_plugins.ipy_plugins loader, the
+eager variant imports every plugin module and calls its
+load_ipython_extension.  The first use case measures the lazy loader
+followed by the first GaussianFit call, which triggers the deferred
+imports.  Results can be saved in JSON format to track them across
+releases.
+"""
+
+from __future__ import print_function
+import sys
+import json
+import subprocess
+
+# Code snippets executed in a new process.  Each one must print
+# the elapsed time in seconds.
+_PRELUDE = '''
+import time
+class _Shell(object):
+    user_ns = {}
+ip = _Shell()
+t0 = time.time()
+'''
+
+VARIANTS = (
+    ('lazy', '''
+import cmi_plugins.ipy_plugins
+cmi_plugins.ipy_plugins.load_ipython_extension(ip)
+'''),
+    ('eager', '''
+from cmi_plugins.ipy_plugins import findPlugins
+import importlib
+for m in sorted(set(findPlugins().values())):
+    importlib.import_module(m).load_ipython_extension(ip)
+'''),
+    ('lazy+first-use', '''
+import cmi_plugins.ipy_plugins
+cmi_plugins.ipy_plugins.load_ipython_extension(ip)
+import numpy
+x = numpy.arange(-5, 5, 0.1)
+ip.user_ns['GaussianFit'](x, numpy.exp(-x**2), verbose=False)
+'''),
+)
+
+
+def timeVariant(code, repeat):
+    '''Run code snippet in new processes and return elapsed times.
+    '''
+    script = _PRELUDE + code + '\nprint(time.time() - t0)\n'
+    times = []
+    for i in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', script])
+        times.append(float(out.split()[-1]))
+    return times
+
+
+def main(argv):
+    repeat = 5
+    jsonfile = None
+    for a in argv:
+        if a.startswith('--repeat='):
+            repeat = int(a.split('=', 1)[1])
+        elif a.startswith('--json='):
+            jsonfile = a.split('=', 1)[1]
+        else:
+            sys.exit(__doc__)
+    results = {}
+    print("%-16s %12s %12s" % ("variant", "min [ms]", "median [ms]"))
+    for name, code in VARIANTS:
+        times = sorted(timeVariant(code, repeat))
+        results[name] = dict(times=times, min=times[0],
+                             median=times[len(times) // 2])
+        print("%-16s %12.1f %12.1f" % (name,
+              1e3 * results[name]['min'], 1e3 * results[name]['median']))
+    if jsonfile is not None:
+        with open(jsonfile, 'w') as fp:
+            json.dump(dict(benchmark='startup', python=sys.version,
+                           repeat=repeat, results=results), fp, indent=2)
+    return
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
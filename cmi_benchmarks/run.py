@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""Run benchmark workloads and record their performance.
+
+Usage:
+
+    python -m cmi_benchmarks.run [options] [pattern ...]
+
+Options:
+
+    --list          list available workloads and exit
+    --json=FILE     save the results to FILE in JSON format
+    --repeat=N      run each workload N times, default 1
+
+Patterns are shell-style wildcards for the workload names, for example
+"fitNi*" or "gaussian-batch-*".  All workloads are executed when no
+pattern is specified.
+
+Each workload runs headlessly in a new process.  The recorded metrics are
+the wall time, the number of FitRecipe residual evaluations and the peak
+resident memory of the process.  The residual evaluations include those
+in worker processes started by fork, such as the pools of multistartFit
+or ParallelJacobian.  With other start methods only the evaluations in
+the workload process are counted, which is marked in the nresidual_scope
+field of the JSON output and by an asterisk in the table.  Peak memory
+is that of the workload process.  Recipes that call clearFitHooks() get
+a TimingFitHook instead, and the times spent in their contributions and
+profile generators are saved in the JSON output.  Workloads with missing
+dependencies are reported as skipped.
+"""
+
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import fnmatch
+import multiprocessing
+
+from cmi_benchmarks.workloads import WORKLOADS
+
+
+def runWorkload(name, repeat=1):
+    '''Run named workload in a new process.
+
+    Return a dictionary of the recorded metrics.
+    '''
+    ctx = multiprocessing.get_context('spawn')
+    parent, child = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_workloadProcess, args=(name, repeat, child))
+    proc.start()
+    child.close()
+    try:
+        rv = parent.recv()
+    except EOFError:
+        rv = dict(name=name, status='failed',
+                  error='process exited with code %s' % proc.exitcode)
+    proc.join()
+    return rv
+
+
+def _workloadProcess(name, repeat, conn):
+    '''Execute workload and send its metrics through conn.
+    '''
+    os.environ['MPLBACKEND'] = 'Agg'
+    # the workload process is spawned, use forked workers where it is safe
+    # so that they share the residual counter
+    if sys.platform.startswith('linux'):
+        multiprocessing.set_start_method('fork', force=True)
+    rv = dict(name=name, status='ok')
+    func, kwargs = dict((w[0], w[1:]) for w in WORKLOADS)[name]
+    rv['params'] = kwargs
+    devnull = open(os.devnull, 'w')
+    savedstdout = sys.stdout
+    try:
+        counter = _instrumentRecipes()
+        rssbefore = _peakRSS()
+        walltimes = []
+        for i in range(repeat):
+            sys.stdout = devnull
+            t0 = time.time()
+            extra = func(**kwargs)
+            walltimes.append(time.time() - t0)
+            sys.stdout = savedstdout
+        rv.update(extra)
+        rv['walltime'] = min(walltimes)
+        rv['walltimes'] = walltimes
+        rv['nresidual'] = counter['count'].value // repeat
+        rv['nresidual_scope'] = counter['scope']
+        rv['components'] = _mergeComponents(counter['hooks'])
+        rv['peak_rss_kb'] = _peakRSS()
+        rv['rss_increase_kb'] = rv['peak_rss_kb'] - rssbefore
+    except ImportError as e:
+        rv.update(status='skipped', error=str(e))
+    except Exception as e:
+        rv.update(status='failed', error="%s: %s" % (type(e).__name__, e))
+    finally:
+        sys.stdout = savedstdout
+        devnull.close()
+    conn.send(rv)
+    conn.close()
+    return
+
+
+def _instrumentRecipes():
+    '''Count calls of FitRecipe.residual in this process and replace
+    the cleared fit hooks with TimingFitHook.
+
+    The count is kept in shared memory, so that the calls in worker
+    processes forked from this process are counted as well.
+
+    Return a dictionary with the shared call count under the 'count' key,
+    its scope, i.e., 'all' or 'parent' processes, under 'scope' and
+    a list of the created TimingFitHook objects under 'hooks'.
+    '''
+    forked = multiprocessing.get_start_method() == 'fork'
+    counter = dict(count=multiprocessing.Value('l', 0), hooks=[],
+                   scope=('all' if forked else 'parent'))
+    try:
+        from diffpy.srfit.fitbase import FitRecipe
+        from cmi_plugins.fittiming import TimingFitHook
+    except ImportError:
+        return counter
+    residual = FitRecipe.residual
+    clearFitHooks = FitRecipe.clearFitHooks
+    count = counter['count']
+    def countedResidual(self, p=[]):
+        with count.get_lock():
+            count.value += 1
+        return residual(self, p)
+    def timedClearFitHooks(self):
+        clearFitHooks(self)
+        hook = TimingFitHook()
+        counter['hooks'].append(hook)
+        self.pushFitHook(hook)
+        return
+    FitRecipe.residual = countedResidual
+    FitRecipe.clearFitHooks = timedClearFitHooks
+    return counter
+
+
+def _mergeComponents(hooks):
+    '''Sum the component timings from several TimingFitHook objects.
+    '''
+    rv = {}
+    for hook in hooks:
+        for name, c in hook.toDict()['components'].items():
+            r = rv.setdefault(name, dict(ncalls=0, total=0.0))
+            r['ncalls'] += c['ncalls']
+            r['total'] += c['total']
+    return rv
+
+
+def _peakRSS():
+    '''Return peak resident memory of this process in kilobytes.
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on Mac OS X
+    if sys.platform == 'darwin':
+        rss //= 1024
+    return rss
+
+
+def main(argv):
+    patterns = []
+    jsonfile = None
+    repeat = 1
+    for a in argv:
+        if a == '--list':
+            print('\n'.join(w[0] for w in WORKLOADS))
+            return
+        elif a.startswith('--json='):
+            jsonfile = a.split('=', 1)[1]
+        elif a.startswith('--repeat='):
+            repeat = int(a.split('=', 1)[1])
+        elif a.startswith('-'):
+            sys.exit(__doc__)
+        else:
+            patterns.append(a)
+    names = [w[0] for w in WORKLOADS
+             if not patterns or any(fnmatch.fnmatch(w[0], p)
+                                    for p in patterns)]
+    print("%-26s %8s %12s %12s %14s" % ("workload", "status",
+          "time [s]", "residuals", "peak RSS [MB]"))
+    results = []
+    for name in names:
+        rv = runWorkload(name, repeat)
+        results.append(rv)
+        if rv['status'] == 'ok':
+            rss = rv['peak_rss_kb']
+            rss = '-' if rss is None else '%.1f' % (rss / 1024.0)
+            nres = '%i' % rv['nresidual']
+            if rv['nresidual_scope'] != 'all':
+                nres += '*'
+            print("%-26s %8s %12.3f %12s %14s" % (name, rv['status'],
+                  rv['walltime'], nres, rss))
+        else:
+            print("%-26s %8s   %s" % (name, rv['status'], rv['error']))
+    if any(rv.get('nresidual_scope') == 'parent' for rv in results):
+        print("* residuals of the workload process only, worker "
+              "processes are not counted")
+    if jsonfile is not None:
+        import platform
+        with open(jsonfile, 'w') as fp:
+            json.dump(dict(python=sys.version, platform=platform.platform(),
+                           date=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                           repeat=repeat, results=results), fp, indent=2)
+    return
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,463 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""Benchmark workloads based on the cmi_scripts examples.
+
+There are two kinds of workloads.  Script workloads execute the unchanged
+example scripts from cmi_scripts in their directories with the bundled data
+files.  Scaling workloads rebuild the same calculations in functions with
+a size parameter, i.e., the r-range of the Ni fit, the size of a Ni
+nanoparticle in the Debye PDF calculation or the number of fitted spectra.
+
+Every workload function returns a dictionary of extra metrics, which may
+be empty.  WORKLOADS lists all workloads as (name, function, kwargs)
+tuples, see cmi_benchmarks.run for their execution.
+"""
+
+import os
+import numpy
+
+SCRIPTSDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          os.pardir, 'cmi_scripts')
+SCRIPTSDIR = os.path.normpath(SCRIPTSDIR)
+
+
+def scriptPath(*names):
+    '''Return full path to a file in the cmi_scripts directory.
+    '''
+    return os.path.join(SCRIPTSDIR, *names)
+
+
+def runScript(script):
+    '''Execute cmi_scripts example in its directory.
+
+    script -- path of the script relative to cmi_scripts
+
+    Plots are not displayed when the matplotlib backend is non-interactive,
+    e.g., when the MPLBACKEND environment variable is set to Agg.
+    '''
+    import sys
+    import runpy
+    filename = scriptPath(script)
+    scriptdir = os.path.dirname(filename)
+    savedcwd = os.getcwd()
+    os.chdir(scriptdir)
+    sys.path.insert(0, scriptdir)
+    try:
+        runpy.run_path(filename, run_name='__main__')
+    finally:
+        os.chdir(savedcwd)
+        sys.path.remove(scriptdir)
+    return {}
+
+# Scaling workloads ----------------------------------------------------------
+
+def makeNiRecipe(xmax=20, dx=0.01,
+                 dataFile='ni-q27r100-neutron.gr', qdamp=0.03):
+    '''Create FitRecipe for the Ni PDF as in the fitNiPDF/fitNi.py script.
+
+    xmax -- upper bound of the fitted r-range
+    dx   -- r-step of the calculation grid
+    dataFile -- name of the data file in the fitNiPDF directory
+    qdamp -- fixed value of the Qdamp instrumental parameter
+
+    Return a FitRecipe with fit hooks cleared.
+    '''
+    from diffpy.Structure import loadStructure
+    from diffpy.srfit.pdf import PDFContribution
+    from diffpy.srfit.fitbase import FitRecipe
+    from diffpy.srfit.structure import constrainAsSpaceGroup
+    niPDF = PDFContribution("nickel")
+    niPDF.loadData(scriptPath('fitNiPDF', dataFile))
+    niPDF.setCalculationRange(xmin=1, xmax=xmax, dx=dx)
+    niStructure = loadStructure(scriptPath('fitNiPDF', 'ni.cif'))
+    niPDF.addStructure("nickel", niStructure)
+    niFit = FitRecipe()
+    niFit.addContribution(niPDF)
+    spaceGroupParams = constrainAsSpaceGroup(niPDF.nickel.phase, "Fm-3m")
+    for par in spaceGroupParams.latpars:
+        niFit.addVar(par)
+    for par in spaceGroupParams.adppars:
+        niFit.addVar(par, value=0.005)
+    niFit.addVar(niPDF.scale, 1)
+    niFit.addVar(niPDF.nickel.delta2, 5)
+    niFit.addVar(niPDF.qdamp, qdamp, fixed=True)
+    niFit.clearFitHooks()
+    return niFit
+
+
+def fitNiRange(xmax):
+    '''Refine the Ni PDF recipe over r-range from 1 to xmax.
+    '''
+    from scipy.optimize import leastsq
+    recipe = makeNiRecipe(xmax=xmax)
+    leastsq(recipe.residual, recipe.values)
+    return dict(npoints=len(recipe.nickel.profile.x))
+
+
+def fitNiMultiresolution(xmax):
+    '''Refine the Ni PDF recipe from 1 to xmax with multiresolutionFit.
+
+    Use the default coarse stages, compare with the fitNi-rmax series.
+    '''
+    from cmi_plugins.multires import multiresolutionFit
+    recipe = makeNiRecipe(xmax=xmax)
+    res = multiresolutionFit(recipe)
+    return dict(npoints=int(res.npoints[-1]), cost=res.cost,
+                chi2=float(res.chi2[-1]))
+
+
+def multistartNi(nstarts):
+    '''Refine the Ni PDF recipe from nstarts points with multistartFit.
+
+    The lattice parameter is sampled from 3.4 to 3.7 A.
+    '''
+    from cmi_plugins.multistart import multistartFit
+    recipe = makeNiRecipe(xmax=20)
+    res = multistartFit(recipe, nstarts, bounds={'a' : (3.4, 3.7)}, seed=0)
+    return dict(chi2=float(numpy.nanmin(res.chi2)),
+                nfailed=len(res.failures))
+
+
+def fitNiJacobian(workers):
+    '''Refine the Ni PDF recipe up to 40 A with ParallelJacobian.
+
+    workers -- number of processes that evaluate the Jacobian.
+               Compare with the fitNi-rmax40 workload without Dfun.
+    '''
+    from scipy.optimize import leastsq
+    from cmi_plugins.fdjacobian import ParallelJacobian
+    recipe = makeNiRecipe(xmax=40)
+    with ParallelJacobian(recipe, workers=workers) as jac:
+        leastsq(recipe.residual, recipe.values, Dfun=jac)
+    return dict(chi2=float(numpy.sum(recipe.residual()**2)),
+                njev=jac.ncalls, jacnfev=jac.nfev)
+
+
+def fitNiJoint(shared):
+    '''Refine Ni structure jointly to the X-ray and neutron PDFs.
+
+    shared -- use generators with SharedPairList as in fitNiJoint.py.
+              When False, add the phase to both contributions with
+              the standard PDFGenerator.
+    '''
+    from scipy.optimize import leastsq
+    from diffpy.Structure import loadStructure
+    from diffpy.srfit.pdf import PDFContribution
+    from diffpy.srfit.fitbase import FitRecipe
+    from diffpy.srfit.structure import constrainAsSpaceGroup
+    from cmi_plugins.jointpdf import SharedPairList, addSharedPhase
+    niStructure = loadStructure(scriptPath('fitNiPDF', 'ni.cif'))
+    pairs = SharedPairList()
+    niFit = FitRecipe()
+    phase = niStructure
+    for name, dataFile in (('xray', 'ni-q27r60-xray.gr'),
+                           ('neutron', 'ni-q27r100-neutron.gr')):
+        con = PDFContribution(name)
+        con.loadData(scriptPath('fitNiPDF', dataFile))
+        con.setCalculationRange(xmin=1, xmax=20, dx=0.01)
+        if shared:
+            phase = addSharedPhase(con, "nickel", phase, pairs)
+        elif phase is niStructure:
+            phase = con.addStructure("nickel", niStructure)
+        else:
+            con.addPhase("nickel", phase)
+        niFit.addContribution(con)
+        niFit.addVar(con.scale, 1, name=name[0] + "scale")
+        niFit.addVar(con.qdamp, 0.03, name=name[0] + "qdamp", fixed=True)
+    spaceGroupParams = constrainAsSpaceGroup(phase, "Fm-3m")
+    for par in spaceGroupParams.latpars:
+        niFit.addVar(par)
+    for par in spaceGroupParams.adppars:
+        niFit.addVar(par, value=0.005)
+    delta2 = niFit.newVar("delta2", 5)
+    niFit.constrain(niFit.xray.nickel.delta2, delta2)
+    niFit.constrain(niFit.neutron.nickel.delta2, delta2)
+    niFit.clearFitHooks()
+    leastsq(niFit.residual, niFit.values)
+    rv = dict(chi2=float(numpy.sum(niFit.residual()**2)))
+    if shared:
+        rv.update(pairs.counts)
+    return rv
+
+
+def makeCdSeRecipe(incremental=False):
+    '''Create FitRecipe for CdSe nanoparticle as in fitCdSeNP.py.
+
+    incremental -- use IncrementalDebyePDFGenerator instead of
+                   the DebyePDFGenerator
+
+    Return a FitRecipe with fit hooks cleared.
+    '''
+    from diffpy.Structure import loadStructure
+    from diffpy.srfit.pdf import PDFContribution
+    from diffpy.srfit.fitbase import FitRecipe
+    cdsePDF = PDFContribution("CdSe")
+    cdsePDF.loadData(scriptPath('fitCdSeNP', 'cdse.gr'))
+    cdsePDF.setCalculationRange(xmin=1, xmax=20, dx=0.01)
+    cdseStructure = loadStructure(scriptPath('fitCdSeNP', 'cdse.xyz'))
+    if incremental:
+        from cmi_plugins.incrementalpdf import addIncrementalStructure
+        addIncrementalStructure(cdsePDF, "CdSe", cdseStructure)
+    else:
+        cdsePDF.addStructure("CdSe", cdseStructure, periodic=False)
+    cdseFit = FitRecipe()
+    cdseFit.addContribution(cdsePDF)
+    cdseFit.addVar(cdsePDF.scale, 1)
+    cdseFit.addVar(cdsePDF.CdSe.delta2, 5)
+    cdseFit.addVar(cdsePDF.qdamp, 0.06, fixed=True)
+    cdsePDF.CdSe.setQmin(1.0)
+    cdsePDF.CdSe.setQmax(20.0)
+    CdBiso = cdseFit.newVar("Cd_Biso", value=1.0)
+    SeBiso = cdseFit.newVar("Se_Biso", value=1.0)
+    for atom in cdsePDF.CdSe.phase.getScatterers():
+        if atom.element == 'Cd':
+            cdseFit.constrain(atom.Biso, CdBiso)
+        elif atom.element == 'Se':
+            cdseFit.constrain(atom.Biso, SeBiso)
+    cdseFit.clearFitHooks()
+    return cdseFit
+
+
+def fitCdSe(incremental):
+    '''Refine the CdSe nanoparticle recipe without the zoomscale variable.
+
+    The incremental variant also reports gdiff, the largest difference
+    between the initial PDFs of the incremental and standard generator
+    relative to the PDF maximum.
+    '''
+    from scipy.optimize import leastsq
+    recipe = makeCdSeRecipe(incremental=incremental)
+    rv = {}
+    if incremental:
+        reference = makeCdSeRecipe(incremental=False)
+        reference.residual()
+        recipe.residual()
+        gref = reference.CdSe.evaluate()
+        ginc = recipe.CdSe.evaluate()
+        rv['gdiff'] = float(numpy.fabs(ginc - gref).max() /
+                            numpy.fabs(gref).max())
+    leastsq(recipe.residual, recipe.values)
+    rv['chi2'] = float(numpy.sum(recipe.residual()**2))
+    if incremental:
+        rv.update(recipe.CdSe.CdSe._calc.counts)
+    return rv
+
+
+def makeNiClusterXYZ(radius, a=3.52387):
+    '''Return Cartesian coordinates of spherical fcc Ni nanoparticle.
+
+    radius -- radius of the particle in Angstroms
+    a    -- cubic lattice parameter of Ni
+    '''
+    n = int(numpy.ceil(radius / a))
+    cell = numpy.arange(-n, n + 1)
+    corners = numpy.array(numpy.meshgrid(cell, cell, cell)).reshape(3, -1).T
+    basis = numpy.array([[0, 0, 0], [0, .5, .5], [.5, 0, .5], [.5, .5, 0]])
+    xyz = a * (corners[:, numpy.newaxis, :] + basis).reshape(-1, 3)
+    xyz = xyz[numpy.sum(xyz**2, axis=1) <= radius**2]
+    return xyz
+
+
+def makeNiCluster(radius, a=3.52387):
+    '''Create spherical fcc Ni nanoparticle of the specified radius.
+
+    radius -- radius of the particle in Angstroms
+    a    -- cubic lattice parameter of Ni
+
+    Return diffpy.Structure in Cartesian coordinates.
+    '''
+    from diffpy.Structure import Structure, Atom
+    xyz = makeNiClusterXYZ(radius, a)
+    stru = Structure([Atom('Ni', xi) for xi in xyz])
+    stru.Uisoequiv = 0.005
+    return stru
+
+
+def debyeNiCluster(radius):
+    '''Calculate Debye PDF of Ni nanoparticle as in calcpdfc60/c60.py.
+    '''
+    from diffpy.srreal.pdfcalculator import DebyePDFCalculator
+    stru = makeNiCluster(radius)
+    dpc = DebyePDFCalculator()
+    dpc.qmax = 20
+    dpc.rmax = 20
+    dpc(stru, qmin=1)
+    return dict(natoms=len(stru))
+
+
+def debyeHistogramNiCluster(radius):
+    '''Calculate PDF of Ni nanoparticle from pair-distance histograms.
+
+    Uses the same settings as debyeNiCluster.
+    '''
+    from cmi_plugins.debyehistogram import DebyeHistogramCalculator
+    xyz = makeNiClusterXYZ(radius)
+    dhc = DebyeHistogramCalculator(qmin=1, qmax=20, rmax=20)
+    dhc.calculate(xyz, ['Ni'] * len(xyz), uiso=0.005)
+    return dict(natoms=len(xyz))
+
+
+def readNiClusterXYZ(radius):
+    '''Read xyz file of Ni nanoparticle with and without sidecar cache.
+
+    The file is written to a temporary directory.  Return the times of
+    the first load, which parses the text, and of the cached load.
+    '''
+    import time
+    import shutil
+    import tempfile
+    from cmi_plugins.fastread import readXYZ
+    xyz = makeNiClusterXYZ(radius)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'nicluster.xyz')
+        with open(filename, 'w') as fp:
+            fp.write('%i\nNi cluster r=%g\n' % (len(xyz), radius))
+            for x, y, z in xyz:
+                fp.write('Ni %.6f %.6f %.6f\n' % (x, y, z))
+        t0 = time.time()
+        readXYZ(filename)
+        t1 = time.time()
+        readXYZ(filename)
+        t2 = time.time()
+    finally:
+        shutil.rmtree(tmpdir)
+    return dict(natoms=len(xyz), parsetime=t1 - t0, cachedtime=t2 - t1)
+
+
+def sweepC60(npoints):
+    '''Calculate Debye PDFs of C60 from calcpdfc60 over a qmin sweep.
+
+    npoints -- number of qmin values from 0 to 2
+    '''
+    from diffpy.Structure import loadStructure
+    from diffpy.srreal.pdfcalculator import DebyePDFCalculator
+    from cmi_plugins.pdfsweep import sweepPDF
+    c60 = loadStructure(scriptPath('calcpdfc60', 'c60.stru'))
+    dpc = DebyePDFCalculator(qmax=20, rmax=20)
+    grid = dict(qmin=numpy.linspace(0, 2, npoints))
+    res = sweepPDF(c60, dpc, grid)
+    return dict(npoints=res.G.shape[1], nfailed=len(res.failures))
+
+
+def sequentialNi(ndatasets):
+    '''Refine the Ni PDF recipe to a synthetic thermal expansion series.
+
+    ndatasets -- number of data files, which are copies of the neutron
+                 Ni PDF with the r-axis stretched by 0.01% per dataset
+    '''
+    import shutil
+    import tempfile
+    from cmi_plugins.seqrefine import sequentialFit
+    with open(scriptPath('fitNiPDF', 'ni-q27r100-neutron.gr')) as fp:
+        header, data = fp.read().split('#L r G(r) dr dG(r)\n')
+    data = numpy.loadtxt(data.splitlines())
+    recipe = makeNiRecipe(xmax=20)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        datafiles = []
+        for k in range(ndatasets):
+            fname = os.path.join(tmpdir, 'ni-%04i.gr' % k)
+            rg = data * [1 + 1e-4 * k, 1]
+            with open(fname, 'w') as fp:
+                fp.write(header + '#L r G(r)\n')
+                numpy.savetxt(fp, rg, fmt='%.6f')
+            datafiles.append(fname)
+        res = sequentialFit(recipe, recipe.nickel, datafiles,
+                            os.path.join(tmpdir, 'results.tsv'))
+    finally:
+        shutil.rmtree(tmpdir)
+    a = res.values[:, res.names.index('a')]
+    return dict(nfev=int(res.nfev.sum()), nfailed=len(res.failures),
+                da=float(a[-1] - a[0]))
+
+
+def screenBundledCIFs(ncopies):
+    '''Screen bond valence sums of all CIF files in cmi_scripts.
+
+    ncopies -- number of times every CIF file is listed for screening
+    '''
+    import glob
+    from cmi_plugins.bvsscreen import screenBVS
+    cifs = sorted(glob.glob(scriptPath('*', '*.cif')))
+    res = screenBVS(cifs * ncopies)
+    return dict(nfiles=len(res), nfailed=len(res.failures))
+
+
+def fitGaussianSpectra(nspectra, method):
+    '''Fit stack of synthetic Gaussian spectra.
+
+    nspectra -- number of the fitted spectra
+    method   -- 'refit' for GaussianFit.refit loop over the spectra,
+                'batch' for fitGaussianBatch or 'many' for
+                fitGaussianMany with the default number of workers.
+    '''
+    from cmi_benchmarks.bench_gaussianfit import makeSpectra
+    from cmi_plugins.ipy_gaussianfit import (GaussianFit,
+            fitGaussianBatch, fitGaussianMany)
+    x, Y = makeSpectra(nspectra)
+    dy = 0.05
+    if method == 'refit':
+        fit = GaussianFit(x, Y[0], numpy.full_like(x, dy), verbose=False)
+        fit.refine()
+        for y in Y[1:]:
+            fit.refit(y, warm_start=False)
+    elif method == 'batch':
+        fitGaussianBatch(x, Y, dy)
+    elif method == 'many':
+        fitGaussianMany(x, Y, dy)
+    else:
+        raise ValueError("Unknown method %r." % method)
+    return dict(npoints=Y.shape[1])
+
+
+# List of all workloads ------------------------------------------------------
+
+WORKLOADS = [
+    ('fitNi', runScript, dict(script='fitNiPDF/fitNi.py')),
+    ('fitCdSeNP', runScript, dict(script='fitCdSeNP/fitCdSeNP.py')),
+    ('calcpdfc60', runScript, dict(script='calcpdfc60/c60.py')),
+    ('calcpdfcds', runScript, dict(script='calcpdfcds/CdS.py')),
+    ('pdfrectprofile', runScript, dict(script='pdfrectprofile/nirectpdf.py')),
+    ('mpdf-corefinement1', runScript,
+        dict(script='mpdf/example_corefinement1.py')),
+    ('mpdf-corefinement2', runScript,
+        dict(script='mpdf/example_corefinement2.py')),
+]
+WORKLOADS += [('fitNiJoint-separate', fitNiJoint, dict(shared=False)),
+              ('fitNiJoint-shared', fitNiJoint, dict(shared=True))]
+WORKLOADS += [('fitCdSe-debye', fitCdSe, dict(incremental=False)),
+              ('fitCdSe-incremental', fitCdSe, dict(incremental=True))]
+WORKLOADS += [('fitNi-rmax%i' % xmax, fitNiRange, dict(xmax=xmax))
+              for xmax in (10, 20, 40, 80)]
+WORKLOADS += [('multires-ni-rmax%i' % xmax, fitNiMultiresolution,
+               dict(xmax=xmax)) for xmax in (20, 40, 80)]
+WORKLOADS += [('multistart-ni-%i' % n, multistartNi, dict(nstarts=n))
+              for n in (4, 16, 64)]
+WORKLOADS += [('jacobian-ni-w%i' % n, fitNiJacobian, dict(workers=n))
+              for n in (1, 2, 4)]
+WORKLOADS += [('debye-nicluster-r%i' % r, debyeNiCluster, dict(radius=r))
+              for r in (10, 20, 30)]
+WORKLOADS += [('debyehist-nicluster-r%i' % r, debyeHistogramNiCluster,
+               dict(radius=r)) for r in (10, 20, 30, 60)]
+WORKLOADS += [('readxyz-nicluster-r%i' % r, readNiClusterXYZ,
+               dict(radius=r)) for r in (30, 60, 120)]
+WORKLOADS += [('pdfsweep-c60-%i' % n, sweepC60, dict(npoints=n))
+              for n in (20, 100, 500)]
+WORKLOADS += [('seqfit-ni-%i' % n, sequentialNi, dict(ndatasets=n))
+              for n in (10, 100)]
+WORKLOADS += [('bvsscreen-cifs-x%i' % n, screenBundledCIFs,
+               dict(ncopies=n)) for n in (1, 10, 100)]
+WORKLOADS += [('gaussian-%s-%i' % (m, n), fitGaussianSpectra,
+               dict(nspectra=n, method=m))
+              for m in ('refit', 'batch', 'many') for n in (100, 1000, 10000)]
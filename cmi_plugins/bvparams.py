@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""Dense matrices of bond valence parameters for indexed atom types.
+
+BVParametersTable.lookup resolves one pair of atom type strings at a time.
+BVParametersMatrix assigns an integer index to every atom type it has seen
+and keeps the Ro and B parameters of all pairs of indexed types in square
+arrays.  The table is consulted only once for every new pair of types,
+so the matrix can be shared by many structures with the same species,
+and the parameters of all atom pairs are obtained by numpy indexing:
+
+from cmi_plugins.bvparams import BVParametersMatrix
+bvm = BVParametersMatrix(bvsc.bvparamtable)
+bvm.setCustom('Na', +1, 'Cl', -1, Ro=1.6833, B=0.608)
+idx = bvm.indices(['Na+', 'Cl-', 'Cl-'])
+ro, b = bvm.Ro[idx[i0], idx[i1]], bvm.B[idx[i0], idx[i1]]
+"""
+
+import numpy
+
+
+class BVParametersMatrix(object):
+    '''Bond valence parameters for all pairs of the indexed atom types.
+
+    table    -- BVParametersTable that provides the parameters.
+                Use the standard table when None.
+
+    Attributes:
+
+    atomtypes -- list of the indexed atom types
+    Ro, B     -- square arrays of the bond valence parameters for all
+                 pairs of the indexed types, NaN for missing pairs
+    valid     -- square boolean array, True for pairs with parameters
+    '''
+
+    def __init__(self, table=None):
+        if table is None:
+            from diffpy.srreal.bvparameterstable import BVParametersTable
+            table = BVParametersTable()
+        self.table = table
+        self.reset()
+        return
+
+
+    def reset(self):
+        '''Forget all indexed atom types and their parameters.
+
+        This must be called when the table is changed directly and not
+        through the setCustom or resetCustom methods.
+        '''
+        self.atomtypes = []
+        self._index = {}
+        self.Ro = numpy.empty((0, 0))
+        self.B = numpy.empty((0, 0))
+        self.valid = numpy.empty((0, 0), dtype=bool)
+        return
+
+
+    def indices(self, atomtypes):
+        '''Return array of indices for a sequence of atom types.
+
+        New atom types are added to the matrices and the table is
+        looked up for their pairs with all indexed types.
+        '''
+        newtypes = []
+        for smbl in atomtypes:
+            if smbl not in self._index and smbl not in newtypes:
+                newtypes.append(smbl)
+        if newtypes:
+            self._addTypes(newtypes)
+        return numpy.array([self._index[smbl] for smbl in atomtypes],
+                           dtype=int)
+
+
+    def lookup(self, smbl0, smbl1):
+        '''Return a tuple of (Ro, B) for a pair of atom types.
+
+        Ro and B are NaN when the table has no parameters for the pair.
+        '''
+        i, j = self.indices([smbl0, smbl1])
+        return self.Ro[i, j], self.B[i, j]
+
+
+    def missingPairs(self, cations, anions):
+        '''Return sorted list of (cation, anion) pairs without parameters.
+        '''
+        cations = sorted(set(cations))
+        anions = sorted(set(anions))
+        ic = self.indices(cations)
+        ia = self.indices(anions)
+        valid = self.valid[ic[:, None], ia]
+        rv = [(c, a) for k, c in enumerate(cations)
+              for m, a in enumerate(anions) if not valid[k, m]]
+        return rv
+
+
+    def setCustom(self, *args, **kwargs):
+        '''Set custom bond valence parameters in the table.
+
+        Takes the same arguments as BVParametersTable.setCustom.
+        The matrices are looked up again for the next indexed types.
+        '''
+        self.table.setCustom(*args, **kwargs)
+        self.reset()
+        return
+
+
+    def resetCustom(self, *args, **kwargs):
+        '''Remove custom bond valence parameters from the table.
+
+        Takes the same arguments as BVParametersTable.resetCustom.
+        The matrices are looked up again for the next indexed types.
+        '''
+        self.table.resetCustom(*args, **kwargs)
+        self.reset()
+        return
+
+
+    def _addTypes(self, newtypes):
+        '''Extend the matrices with rows and columns for new atom types.
+        '''
+        n0 = len(self.atomtypes)
+        atomtypes = self.atomtypes + list(newtypes)
+        n = len(atomtypes)
+        ro = numpy.nan * numpy.ones((n, n))
+        b = numpy.nan * numpy.ones((n, n))
+        ro[:n0, :n0] = self.Ro
+        b[:n0, :n0] = self.B
+        none = self.table.none()
+        for i in range(n0, n):
+            for j in range(i + 1):
+                bp = self.table.lookup(atomtypes[i], atomtypes[j])
+                if bp == none:
+                    continue
+                ro[i, j] = ro[j, i] = bp.Ro
+                b[i, j] = b[j, i] = bp.B
+        # update state only after all lookups succeeded
+        for i in range(n0, n):
+            self._index[atomtypes[i]] = i
+        self.atomtypes = atomtypes
+        self.Ro = ro
+        self.B = b
+        self.valid = ~numpy.isnan(ro)
+        return
+
+# end of class BVParametersMatrix
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""Bond valence sum screening of many structure files in parallel.
+
+Usage:
+
+from cmi_plugins.bvsscreen import screenBVS
+bvsc = BVSCalculator()
+bvsc.bvparamtable.setCustom('Na', +1, 'Cl', -1, Ro=1.6833, B=0.608)
+bvsc.rmax = 6
+res = screenBVS('cifs/', bvsc, filename='bvsscreen.tsv')
+best = numpy.argsort(res.bvrmsdiff)[:10]
+[(res.filenames[i], res.bvrmsdiff[i]) for i in best]
+
+The structures are loaded and evaluated in a pool of worker processes,
+each of them gets a copy of the configured BVSCalculator at start.  The
+results are appended to a tab-separated table file as they arrive, so
+that a partial table is available while the screening runs.  Use
+loadBVSScreen to read the table back.
+"""
+
+import os
+import glob
+import numpy
+
+# Columns of the table file written by screenBVS.
+_COLUMNS = ('index', 'filename', 'bvrmsdiff', 'bvdiff', 'missing', 'error')
+
+
+class BVSScreenResults(object):
+    '''Bond valence sums evaluated for a list of structure files.
+
+    All attributes are in the order of the input files.
+
+    filenames  -- list of the screened structure files
+    bvrmsdiff  -- array of the root mean square BVS deviations
+    bvdiff     -- list of arrays of the per-site differences between
+                  the expected valences and the bond valence sums
+    missing    -- list of the sorted (cation, anion) atom type pairs,
+                  which have no bond valence parameters
+    failures   -- dictionary of error messages for files that could not
+                  be loaded or evaluated, the keys are file indices.
+    '''
+
+    def __init__(self, filenames):
+        '''Create results container for the files filled with NaN.
+        '''
+        n = len(filenames)
+        self.filenames = list(filenames)
+        self.bvrmsdiff = numpy.nan * numpy.ones(n)
+        self.bvdiff = [numpy.array([])] * n
+        self.missing = [[] for i in range(n)]
+        self.failures = {}
+        return
+
+
+    def __len__(self):
+        return len(self.filenames)
+
+# end of class BVSScreenResults
+
+
+def screenBVS(sources, bvsc=None, filename=None, workers=None,
+              chunksize=None, progress=None, pattern='*.cif'):
+    '''Evaluate bond valence sums for many structure files in parallel.
+
+    sources -- directory with structure files or a list of file paths
+    bvsc    -- configured BVSCalculator shared by all structures, for
+               example with custom bond valence parameters or rmax.
+               Use the default BVSCalculator when None.
+    filename -- optional path of a tab-separated table, where a row
+               is written as soon as a structure is evaluated.
+    workers -- number of worker processes.  Use all CPUs when None.
+               With workers=1 the structures are evaluated in the
+               calling process.
+    chunksize -- number of files sent to a worker at a time.
+               When None, split them to about 4 chunks per worker.
+    progress -- optional function called as progress(ndone, ntotal)
+               after each finished structure.
+    pattern -- glob pattern of the structure files in sources directory
+
+    Structures are loaded with diffpy.Structure.loadStructure.  Files
+    that cannot be loaded or evaluated do not abort the screening, they
+    are reported in the failures attribute and in the error column.
+
+    The sums are evaluated by the copies of bvsc, which look up their
+    bond valence parameters for every structure.  BVParametersMatrix
+    is used only to find the missing cation-anion pairs.
+
+    Return BVSScreenResults in the order of the files.
+    '''
+    from cmi_plugins.workerpool import WorkerPool
+    if isinstance(sources, str):
+        filenames = sorted(glob.glob(os.path.join(sources, pattern)))
+    else:
+        filenames = list(sources)
+    if bvsc is None:
+        from diffpy.srreal.bvscalculator import BVSCalculator
+        bvsc = BVSCalculator()
+    n = len(filenames)
+    res = BVSScreenResults(filenames)
+    fp = None
+    if filename is not None:
+        fp = open(filename, 'w')
+        fp.write('\t'.join(_COLUMNS) + '\n')
+    pool = WorkerPool(_makeBVSState, _screenBVSTask, (bvsc,), workers)
+    if chunksize is None:
+        chunksize = pool.chunkSize(n)
+    results = pool.imap_unordered(enumerate(filenames), chunksize)
+    try:
+        for ndone, rv in enumerate(results, 1):
+            i, rmsd, bvdiff, missing, emsg = rv
+            res.bvrmsdiff[i] = rmsd
+            res.bvdiff[i] = bvdiff
+            res.missing[i] = missing
+            if emsg is not None:
+                res.failures[i] = emsg
+            if fp is not None:
+                fp.write(_formatRow(i, filenames[i], rmsd, bvdiff,
+                                    missing, emsg))
+                fp.flush()
+            if progress is not None:
+                progress(ndone, n)
+    finally:
+        pool.close()
+        if fp is not None:
+            fp.close()
+    return res
+
+
+def loadBVSScreen(filename):
+    '''Load table file written by screenBVS.
+
+    Rows of an unfinished screening are loaded as well.
+
+    Return BVSScreenResults sorted by the file index.
+    '''
+    rows = []
+    with open(filename) as fp:
+        header = fp.readline().rstrip('\n').split('\t')
+        if tuple(header) != _COLUMNS:
+            emsg = "%s is not a BVS screening table." % filename
+            raise ValueError(emsg)
+        for line in fp:
+            w = line.rstrip('\n').split('\t')
+            if len(w) == len(_COLUMNS):
+                rows.append(w)
+    rows.sort(key=lambda w: int(w[0]))
+    res = BVSScreenResults([w[1] for w in rows])
+    for i, w in enumerate(rows):
+        res.bvrmsdiff[i] = float(w[2])
+        res.bvdiff[i] = numpy.array(w[3].split(), dtype=float)
+        res.missing[i] = [tuple(p.split(':')) for p in w[4].split()]
+        if w[5]:
+            res.failures[i] = w[5]
+    return res
+
+# Helpers --------------------------------------------------------------------
+
+def _makeBVSState(bvsc):
+    '''Return worker state for screenBVS as a dictionary.
+    '''
+    import copy
+    from cmi_plugins.bvparams import BVParametersMatrix
+    bvsc = copy.deepcopy(bvsc)
+    # parameter lookups of the missing pairs are shared by all structures
+    bvmatrix = BVParametersMatrix(bvsc.bvparamtable)
+    return dict(bvsc=bvsc, bvmatrix=bvmatrix)
+
+
+def _screenBVSTask(state, task):
+    '''Load one structure file and evaluate its bond valence sums.
+
+    state -- worker state from _makeBVSState
+    task  -- tuple of (index, filename)
+
+    Return a tuple of (index, bvrmsdiff, bvdiff, missing, emsg), where
+    emsg is None for successful evaluation.
+    '''
+    from diffpy.Structure import loadStructure
+    i, filename = task
+    bvsc = state['bvsc']
+    try:
+        stru = loadStructure(filename)
+        bvsc(stru)
+        bvdiff = numpy.array(bvsc.bvdiff, dtype=float)
+        rmsd = float(bvsc.bvrmsdiff)
+        missing = _missingPairs(bvsc, state['bvmatrix'], stru)
+    except Exception as e:
+        emsg = "%s: %s" % (type(e).__name__, e)
+        return (i, numpy.nan, numpy.array([]), [], emsg)
+    return (i, rmsd, bvdiff, missing, None)
+
+
+def _missingPairs(bvsc, bvmatrix, stru):
+    '''Return sorted list of cation-anion pairs without BV parameters.
+    '''
+    from diffpy.srreal.structureadapter import createStructureAdapter
+    adpt = createStructureAdapter(stru)
+    valences = bvsc.valences
+    cations = set()
+    anions = set()
+    for k in range(adpt.countSites()):
+        if valences[k] > 0:
+            cations.add(adpt.siteAtomType(k))
+        elif valences[k] < 0:
+            anions.add(adpt.siteAtomType(k))
+    return bvmatrix.missingPairs(cations, anions)
+
+
+def _formatRow(i, filename, rmsd, bvdiff, missing, emsg):
+    '''Return one line of the screening table.
+    '''
+    fields = [str(i), filename, repr(rmsd),
+              ' '.join(repr(float(v)) for v in bvdiff),
+              ' '.join('%s:%s' % p for p in missing),
+              (emsg or '').replace('\t', ' ').replace('\n', ' ')]
+    return '\t'.join(fields) + '\n'
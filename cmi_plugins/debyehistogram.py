@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""Debye PDF calculation from binned pair-distance histograms.
+
+The DebyePDFCalculator sums over all atom pairs for every Q point, which
+is too slow for nanoparticles with 10**5 or more atoms.  Here the pair
+distances are first counted in histograms per pair of atom species using
+a KD-tree, which visits only the neighbors within the cutoff distance.
+The Debye sum is then evaluated over the histogram bins, whose number
+does not depend on the cluster size.  Memory use is linear in the number
+of atoms.
+
+Usage:
+
+from cmi_plugins.debyehistogram import DebyeHistogramCalculator
+dhc = DebyeHistogramCalculator(qmax=20, rmax=20, maxerror=1e-4)
+r, g = dhc.calculate(xyz, elements, uiso=0.005)
+"""
+
+import numpy
+
+# Maximum slope of sin(x)/x used for the binning error bound.
+_SINC_MAX_SLOPE = 0.4362
+
+
+class PairHistograms(object):
+    '''Binned pair distances for every pair of atom species.
+
+    Species are atoms with the same element and Uiso class, see
+    DebyeHistogramCalculator.uisoclasses.
+
+    composition -- dictionary of atom counts per (element, uiso) species
+    bins     -- dictionary that maps (element0, uiso0, element1, uiso1)
+                keys to (rbins, counts) arrays of the nonzero histogram
+                bins.  The counts are for ordered pairs, i.e., every pair
+                of different atoms is counted twice.
+    binwidth -- width of the distance bins
+    rcut     -- maximum counted distance
+    '''
+
+    def __init__(self, composition, bins, binwidth, rcut):
+        self.composition = composition
+        self.bins = bins
+        self.binwidth = binwidth
+        self.rcut = rcut
+        return
+
+
+    @property
+    def natoms(self):
+        "Total number of atoms."
+        return sum(self.composition.values())
+
+# end of class PairHistograms
+
+
+class DebyeHistogramCalculator(object):
+    '''Calculate Debye PDF of large clusters from distance histograms.
+
+    Attributes follow the DebyePDFCalculator where possible:
+
+    qmin, qmax  -- range of the Fourier transformation
+    qstep       -- Q-grid step.  When None, use pi / (2 * rcut).
+    rmin, rmax, rstep -- r-grid of the calculated PDF
+    scale       -- scale factor of the PDF
+    binwidth    -- width of the pair-distance bins.  When None it is
+                   derived from maxerror.
+    maxerror    -- upper bound of the error of each pair term
+                   sin(Q r) / (Q r) due to binning of the distances
+                   for Q up to qmax
+    rextension  -- pairs are counted up to rcut = rmax + rextension and
+                   smoothly tapered above rmax to reduce the termination
+                   ripples.  When None, use 10 ripple periods 2 pi / qmax
+                   but at most 10 A.
+    scatteringfactortable -- type of srreal ScatteringFactorTable,
+                   e.g., "xray" or "neutron"
+    uisoclasses -- maximum number of distinct Uiso values per element.
+                   When the cluster has more, the Uiso range of each
+                   element is split into this number of equal intervals
+                   and the atoms get the mean Uiso of their interval.
+                   This bounds the number of species and therefore the
+                   cost of the Debye sum for per-atom Uiso.
+
+    Attributes set by the last calculation:
+
+    qgrid       -- Q-values of the calculated F(Q)
+    fq          -- the reduced structure function F(Q)
+    '''
+
+    def __init__(self, **kwargs):
+        self.qmin = 0.0
+        self.qmax = 25.0
+        self.qstep = None
+        self.rmin = 0.0
+        self.rmax = 10.0
+        self.rstep = 0.01
+        self.scale = 1.0
+        self.binwidth = None
+        self.maxerror = 1e-3
+        self.rextension = None
+        self.scatteringfactortable = 'xray'
+        self.uisoclasses = 16
+        self.qgrid = None
+        self.fq = None
+        for n, v in kwargs.items():
+            if not hasattr(self, n):
+                emsg = "Invalid keyword argument %r." % n
+                raise TypeError(emsg)
+            setattr(self, n, v)
+        return
+
+    # Properties
+
+    @property
+    def rgrid(self):
+        "Numpy array of r-points where the PDF is calculated."
+        i0 = int(numpy.ceil(self.rmin / self.rstep))
+        i1 = int(numpy.ceil(self.rmax / self.rstep))
+        return self.rstep * numpy.arange(max(0, i0), i1)
+
+    @property
+    def rcut(self):
+        "Maximum counted pair distance."
+        ext = self.rextension
+        if ext is None:
+            ext = min(10.0, 10 * 2 * numpy.pi / self.qmax)
+        return self.rmax + ext
+
+    @property
+    def effectiveBinWidth(self):
+        "Bin width used for the histograms."
+        if self.binwidth is not None:
+            return self.binwidth
+        return 2 * self.maxerror / (_SINC_MAX_SLOPE * self.qmax)
+
+    @property
+    def errorBound(self):
+        "Upper bound of the binning error of each pair term."
+        return _SINC_MAX_SLOPE * self.qmax * self.effectiveBinWidth / 2
+
+    # Methods
+
+    def __call__(self, stru):
+        '''Calculate PDF for a diffpy.Structure object.
+
+        Return a tuple of (r, G) numpy arrays.
+        '''
+        return self.calculate(stru.xyz_cartn, stru.element, stru.Uisoequiv)
+
+
+    def calculate(self, xyz, elements, uiso=0.0):
+        '''Calculate PDF of a cluster given as arrays.
+
+        xyz      -- Cartesian coordinates, array of shape (N, 3)
+        elements -- atom types, a sequence of N strings
+        uiso     -- isotropic displacement parameters, either a scalar
+                    or an array of N values
+
+        Return a tuple of (r, G) numpy arrays.
+        '''
+        hists = self.histograms(xyz, elements, uiso)
+        return self.calculateFromHistograms(hists)
+
+
+    def histograms(self, xyz, elements, uiso=0.0, chunksize=256):
+        '''Count pair distances for every pair of atom species.
+
+        The first three arguments are the same as for the calculate method.
+        Species are atoms with the same element and Uiso class.
+
+        chunksize -- number of atoms whose neighbors are found at once.
+                     The temporary pair list has about chunksize times
+                     the number of neighbors within rcut entries.
+
+        Only the histogram bins that occur in the cluster are stored,
+        therefore memory stays linear in the number of atoms.
+
+        Return PairHistograms.
+        '''
+        from scipy.spatial import cKDTree
+        xyz = numpy.asarray(xyz, dtype=float)
+        n = len(xyz)
+        uiso = numpy.broadcast_to(numpy.asarray(uiso, dtype=float), (n,))
+        # assign species codes to every atom
+        eunique, eidx = numpy.unique(numpy.asarray(elements),
+                                     return_inverse=True)
+        eidx = eidx.ravel()
+        uiso = _classifyUiso(uiso, eidx, self.uisoclasses)
+        uunique, uidx = numpy.unique(uiso, return_inverse=True)
+        code = eidx * len(uunique) + uidx.ravel()
+        codes, code, composition = numpy.unique(code,
+                return_inverse=True, return_counts=True)
+        code = code.ravel().astype(numpy.int64)
+        nsp = len(codes)
+        keys = [(str(eunique[c // len(uunique)]),
+                 float(uunique[c % len(uunique)])) for c in codes]
+        bw = self.effectiveBinWidth
+        rcut = self.rcut
+        nbins = int(numpy.ceil(rcut / bw))
+        # sorted bin indices and counts of the occupied histogram bins
+        binidx = numpy.zeros(0, dtype=numpy.int64)
+        counts = numpy.zeros(0)
+        tree = cKDTree(xyz)
+        # bin indices are collected and counted in large blocks
+        pending = []
+        npending = 0
+        for i0 in range(0, n, chunksize):
+            i1 = min(n, i0 + chunksize)
+            ctree = cKDTree(xyz[i0:i1])
+            pairs = ctree.sparse_distance_matrix(tree, rcut,
+                                                 output_type='ndarray')
+            d = pairs['v']
+            keep = (d > 0) & (d < nbins * bw)
+            ci = code[pairs['i'][keep] + i0]
+            cj = code[pairs['j'][keep]]
+            # species pairs are unordered, count them under a <= b
+            idx = ((numpy.minimum(ci, cj) * nsp + numpy.maximum(ci, cj)) *
+                   nbins + (d[keep] / bw).astype(numpy.int64))
+            pending.append(idx)
+            npending += len(idx)
+            if npending > max(len(binidx), 2**20) or i1 == n:
+                idx = numpy.concatenate([binidx] + pending)
+                c = numpy.concatenate([counts, numpy.ones(npending)])
+                binidx, inv = numpy.unique(idx, return_inverse=True)
+                counts = numpy.bincount(inv.ravel(), weights=c)
+                pending = []
+                npending = 0
+        rbins = bw * (binidx % nbins + 0.5)
+        spairs, first = numpy.unique(binidx // nbins, return_index=True)
+        bins = {}
+        for sp, lo, hi in zip(spairs, first, numpy.append(first[1:],
+                                                          len(binidx))):
+            a, b = divmod(int(sp), nsp)
+            bins[keys[a] + keys[b]] = (rbins[lo:hi], counts[lo:hi])
+        composition = dict(zip(keys, composition.tolist()))
+        return PairHistograms(composition, bins, bw, rcut)
+
+
+    def calculateFromHistograms(self, hists, chunksize=2**22):
+        '''Evaluate the Debye sum and Fourier transform from histograms.
+
+        hists    -- PairHistograms returned by the histograms method.
+                    These can be reused for different Q-ranges as long
+                    as rmax and rextension stay the same.
+        chunksize -- maximum number of bin-Q terms evaluated at once
+
+        Return a tuple of (r, G) numpy arrays.
+        '''
+        rcut = min(self.rcut, hists.rcut)
+        qstep = self.qstep or numpy.pi / (2 * rcut)
+        q = numpy.arange(int(numpy.ceil(self.qmax / qstep))) * qstep
+        q = q[q >= self.qmin]
+        fq = numpy.zeros_like(q)
+        sfq = self._scatteringFactors(
+                set(e for e, u in hists.composition), q)
+        for (e0, u0, e1, u1), (rb, cnt) in hists.bins.items():
+            w = cnt * self._taper(rb, rcut)
+            dw = numpy.exp(-0.5 * q**2 * (u0 + u1))
+            sincsum = numpy.zeros_like(q)
+            step = max(1, chunksize // max(1, len(rb)))
+            for k in range(0, len(q), step):
+                qk = q[k:k + step, numpy.newaxis]
+                sincsum[k:k + step] = numpy.dot(
+                        numpy.sinc(qk * rb / numpy.pi), w)
+            fq += sfq[e0] * sfq[e1] * dw * sincsum
+        natoms = hists.natoms
+        favg = sum(cnt * sfq[e] for (e, u), cnt in hists.composition.items())
+        favg = favg / natoms
+        fq *= q / (natoms * favg**2)
+        self.qgrid = q
+        self.fq = fq
+        r = self.rgrid
+        g = (2 / numpy.pi) * qstep * numpy.dot(numpy.sin(numpy.outer(r, q)), fq)
+        return r, self.scale * g
+
+
+    def _taper(self, r, rcut):
+        '''Smooth weights that go from 1 at rmax to 0 at rcut.
+        '''
+        if rcut <= self.rmax:
+            return numpy.where(r <= rcut, 1.0, 0.0)
+        t = numpy.clip((r - self.rmax) / (rcut - self.rmax), 0, 1)
+        return numpy.cos(0.5 * numpy.pi * t)**2
+
+
+    def _scatteringFactors(self, elements, q):
+        '''Return dictionary of scattering factor arrays on the Q-grid.
+        '''
+        from diffpy.srreal.scatteringfactortable import ScatteringFactorTable
+        sft = ScatteringFactorTable.createByType(self.scatteringfactortable)
+        rv = {}
+        for smbl in elements:
+            rv[smbl] = numpy.array([sft.lookup(smbl, qi) for qi in q])
+        return rv
+
+# end of class DebyeHistogramCalculator
+
+# Helpers --------------------------------------------------------------------
+
+def _classifyUiso(uiso, eidx, nclasses):
+    '''Replace Uiso of each element with the means of at most nclasses
+    equal Uiso intervals.
+
+    uiso     -- array of Uiso values
+    eidx     -- array of element indices for the atoms
+    nclasses -- maximum number of distinct Uiso values per element
+
+    Return array of Uiso values.
+    '''
+    rv = numpy.array(uiso, dtype=float)
+    for e in numpy.unique(eidx):
+        sel = (eidx == e)
+        u = rv[sel]
+        if len(numpy.unique(u)) <= nclasses:
+            continue
+        edges = numpy.linspace(u.min(), u.max(), nclasses + 1)
+        cls = numpy.clip(numpy.searchsorted(edges, u, side='right') - 1,
+                         0, nclasses - 1)
+        means = (numpy.bincount(cls, weights=u, minlength=nclasses) /
+                 numpy.maximum(1, numpy.bincount(cls, minlength=nclasses)))
+        rv[sel] = means[cls]
+    return rv
@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""Fast readers of large .xyz structure and .gr PDF data files.
+
+The loadStructure function and PDFParser convert the text files line by
+line to Python objects, which is slow for xyz snapshots with millions of
+atoms or finely sampled G(r) data.  The readers here parse the numbers
+to numpy arrays in large blocks and save them to a binary sidecar file next to
+the source, i.e., "cdse.xyz.cache.npy" with the metadata in
+"cdse.xyz.cache.json".  Later loads memory-map the sidecar file as long as
+the size and modification time of the source file did not change.
+
+Usage:
+
+from cmi_plugins.fastread import readXYZ, CachedPDFParser
+cluster = readXYZ('cdse.xyz')
+r, g = dhc.calculate(cluster.xyz, cluster.elements, uiso=0.005)
+
+parser = CachedPDFParser()
+parser.parseFile('cdse.gr')
+cdsePDF.profile.loadParsedData(parser)
+
+The PDF metadata such as stype, qmax or qdamp are obtained by PDFParser
+from the file header and are therefore the same as for loadData.  The
+xyz reader does not need diffpy.srfit, CachedPDFParser is defined when
+it is first imported from this module.
+"""
+
+import os
+import re
+import json
+import itertools
+import numpy
+
+# Version of the sidecar file format.  Change when incompatible.
+_CACHE_FORMAT = 'fastread-1'
+
+
+class XYZData(object):
+    '''Atoms of a structure read from an xyz file.
+
+    title    -- title from the second line of the file
+    elements -- numpy array of the atom type strings
+    xyz      -- array of Cartesian coordinates of shape (N, 3).  This is
+                a view of the memory-mapped sidecar file when cached.
+    filename -- path to the source file
+    '''
+
+    def __init__(self, title, elements, xyz, filename=None):
+        self.title = title
+        self.elements = elements
+        self.xyz = xyz
+        self.filename = filename
+        return
+
+
+    def __len__(self):
+        return len(self.xyz)
+
+
+    def toStructure(self):
+        '''Return diffpy.Structure with the atoms in a unit lattice.
+
+        This gives the same structure as loadStructure of the xyz file,
+        but takes a long time for very large files.
+        '''
+        from diffpy.Structure import Structure, Atom
+        atoms = [Atom(str(e), xi) for e, xi in zip(self.elements, self.xyz)]
+        stru = Structure(atoms, title=self.title, filename=self.filename)
+        return stru
+
+# end of class XYZData
+
+
+def readXYZ(filename, cache=True, chunksize=2**16):
+    '''Read atom types and coordinates from an xyz file.
+
+    filename -- path to the xyz file
+    cache    -- when True, use the sidecar cache file if it is up to date
+                or create it after parsing the source.  The cache is
+                skipped silently when its directory is not writable.
+    chunksize -- number of atom lines parsed at once.  The file is read
+                in blocks of this size, so that only the parsed arrays
+                grow with the number of atoms.
+
+    Return XYZData.
+    '''
+    sidecar = _loadSidecar(filename) if cache else None
+    if sidecar is not None:
+        data, meta = sidecar
+        elements = numpy.array(meta['symbols'])[data[:, 0].astype(int)]
+        return XYZData(meta['title'], elements, data[:, 1:4], filename)
+    with open(filename) as fp:
+        title, symbols, data = _readXYZData(fp, chunksize)
+    if cache:
+        meta = dict(title=title, symbols=symbols)
+        _saveSidecar(filename, data, meta)
+    elements = numpy.array(symbols)[data[:, 0].astype(int)]
+    return XYZData(title, elements, data[:, 1:4], filename)
+
+
+def loadXYZStructure(filename, cache=True):
+    '''Load diffpy.Structure from an xyz file using readXYZ.
+
+    Return diffpy.Structure object.
+    '''
+    return readXYZ(filename, cache=cache).toStructure()
+
+
+def __getattr__(name):
+    '''Define CachedPDFParser on the first access.
+
+    This keeps diffpy.srfit an optional dependency of the xyz reader.
+    '''
+    if name == 'CachedPDFParser':
+        cls = _defineCachedPDFParser()
+        globals()[name] = cls
+        return cls
+    emsg = "module %r has no attribute %r" % (__name__, name)
+    raise AttributeError(emsg)
+
+
+def _defineCachedPDFParser():
+    '''Return the CachedPDFParser class derived from srfit PDFParser.
+    '''
+    from diffpy.srfit.exceptions import ParseError
+    from diffpy.srfit.pdf.pdfparser import PDFParser
+
+    class CachedPDFParser(PDFParser):
+        '''PDFParser that reads files to numpy arrays with a sidecar cache.
+
+        cache    -- when True, use the sidecar cache file of the parsed file
+
+        The parsed banks and metadata are the same as from PDFParser,
+        except that the data arrays may be memory-mapped from the cache
+        file.
+        '''
+
+        def __init__(self, cache=True):
+            PDFParser.__init__(self)
+            self.cache = cache
+            return
+
+
+        def parseFile(self, filename):
+            '''Parse a file and set the _x, _y, _dx, _dy and _meta variables.
+
+            Raises IOError if the file cannot be read
+            Raises ParseError if the file cannot be parsed
+            '''
+            self._banks = []
+            self._meta = {}
+            sidecar = _loadSidecar(filename) if self.cache else None
+            if sidecar is not None:
+                data, meta = sidecar
+                self._meta.update(meta['meta'])
+                dr = data[2] if meta['hasdr'] else None
+                dg = data[3] if meta['hasdg'] else None
+                self._banks.append([data[0], data[1], dr, dg])
+            else:
+                with open(filename) as fp:
+                    text = fp.read()
+                self.parseString(text)
+                if self.cache and self._banks:
+                    self._saveBank(filename)
+            self._meta['filename'] = filename
+            if len(self._banks) < 1:
+                raise ParseError("There are no data in the banks")
+            self.selectBank(0)
+            return
+
+
+        def parseString(self, patstring):
+            '''Parse a string and set the _x, _y, _dx, _dy and _meta variables.
+
+            The data are converted in one numpy call.  Files with irregular
+            data lines are passed to PDFParser.parseString.
+
+            Raises ParseError if the string cannot be parsed
+            '''
+            header, body = _splitPDFText(patstring)
+            firstline = body.split('\n', 1)[0]
+            ncols = len(firstline.split())
+            values = []
+            if body:
+                values = numpy.fromstring(body, dtype=float, sep=' ')
+            nlines = body.count('\n') + 1
+            if ncols < 2 or len(values) != ncols * nlines:
+                PDFParser.parseString(self, patstring)
+                return
+            # let PDFParser extract metadata from the header and first line
+            PDFParser.parseString(self, header + firstline)
+            self._banks.pop()
+            columns = values.reshape(nlines, ncols).T.copy()
+            bank = [columns[0], columns[1], None, None]
+            for k in (2, 3):
+                if ncols > k:
+                    c = columns[k]
+                    if numpy.all(numpy.isfinite(c) & (c > 0)):
+                        bank[k] = c
+            self._banks.append(bank)
+            return
+
+
+        def _saveBank(self, filename):
+            '''Save the first bank and metadata to the sidecar cache.
+            '''
+            r, g, dr, dg = self._banks[0]
+            cols = [r, g, dr, dg]
+            data = numpy.array([c if c is not None else numpy.zeros_like(r)
+                                for c in cols], dtype=float)
+            meta = dict(meta=self._meta,
+                        hasdr=dr is not None, hasdg=dg is not None)
+            _saveSidecar(filename, data, meta)
+            return
+
+    # end of class CachedPDFParser
+
+    CachedPDFParser.__qualname__ = 'CachedPDFParser'
+    return CachedPDFParser
+
+# Helpers --------------------------------------------------------------------
+
+def _readXYZData(fp, chunksize):
+    '''Parse contents of an open xyz file in blocks of atom lines.
+
+    Return a tuple of (title, symbols, data), where data is an array
+    of shape (N, 4) with the index of the atom symbol and the Cartesian
+    coordinates of every atom.
+    '''
+    try:
+        natoms = int(fp.readline().split()[0])
+    except (IndexError, ValueError):
+        emsg = "Invalid number of atoms in the first line of xyz file."
+        raise ValueError(emsg)
+    title = fp.readline().strip()
+    data = numpy.empty((natoms, 4))
+    symbols = []
+    n = 0
+    while n < natoms:
+        lines = list(itertools.islice(fp, min(chunksize, natoms - n)))
+        if not lines:
+            break
+        words = ''.join(lines).split()
+        m = len(words) // 4
+        if len(words) != 4 * m or n + m > natoms:
+            break
+        # map the block atom types to indices of all symbols
+        bsymbols, bcodes = numpy.unique(words[0::4], return_inverse=True)
+        for smbl in bsymbols:
+            if smbl not in symbols:
+                symbols.append(smbl)
+        bindex = numpy.array([symbols.index(e) for e in bsymbols])
+        data[n:n + m, 0] = bindex[bcodes.ravel()]
+        del words[0::4]
+        data[n:n + m, 1:4] = numpy.array(words, dtype=float).reshape(m, 3)
+        n += m
+    if n != natoms or any(line.strip() for line in fp):
+        emsg = ("Expected %i atoms with 4 columns in xyz file, "
+                "could read only %i." % (natoms, n))
+        raise ValueError(emsg)
+    symbols = [str(e) for e in symbols]
+    return title, symbols, data
+
+
+def _splitPDFText(text):
+    '''Split PDF file contents to header and data body like PDFParser.
+    '''
+    res = re.search(r'^#+ start data\s*(?:#.*\s+)*', text, re.M)
+    if res:
+        start = res.end()
+    else:
+        fpat = r'[-+]?(\d+(\.\d*)?|\d*\.\d+)([eE][-+]?\d+)?'
+        res = re.search(r'^\s*' + fpat, text, re.M)
+        start = res.start() if res else 0
+    return text[:start], text[start:].strip()
+
+
+def _sidecarFilenames(filename):
+    return filename + '.cache.npy', filename + '.cache.json'
+
+
+def _sourceStamp(filename):
+    st = os.stat(filename)
+    return dict(format=_CACHE_FORMAT, size=st.st_size, mtime=st.st_mtime)
+
+
+def _loadSidecar(filename):
+    '''Return (data, meta) from an up-to-date sidecar cache or None.
+
+    The data array is memory-mapped read-only.
+    '''
+    npyname, jsonname = _sidecarFilenames(filename)
+    try:
+        with open(jsonname) as fp:
+            meta = json.load(fp)
+        if meta.get('source') != _sourceStamp(filename):
+            return None
+        data = numpy.load(npyname, mmap_mode='r')
+    except (IOError, OSError, ValueError):
+        return None
+    return data, meta
+
+
+def _saveSidecar(filename, data, meta):
+    '''Save data array and metadata to the sidecar cache of filename.
+
+    The cache is not written when its directory is not writable.
+    '''
+    npyname, jsonname = _sidecarFilenames(filename)
+    meta = dict(meta, source=_sourceStamp(filename))
+    try:
+        for fname, value in ((npyname, data), (jsonname, meta)):
+            tmpname = '%s.%i.tmp' % (fname, os.getpid())
+            if fname == npyname:
+                with open(tmpname, 'wb') as fp:
+                    numpy.save(fp, value)
+            else:
+                with open(tmpname, 'w') as fp:
+                    json.dump(value, fp)
+            # atomic replacement so that parallel runs never see partial files
+            if hasattr(os, 'replace'):
+                os.replace(tmpname, fname)
+            else:
+                if os.path.exists(fname):
+                    os.remove(fname)
+                os.rename(tmpname, fname)
+    except (IOError, OSError):
+        return False
+    return True
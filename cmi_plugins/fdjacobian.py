@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""Finite-difference Jacobian of a FitRecipe evaluated in parallel.
+
+Without Dfun the leastsq optimizer evaluates the residual once per free
+variable for every Jacobian, one call after another.  ParallelJacobian
+sends the perturbed variable values to a pool of worker processes, which
+hold their own replicas of the recipe, and assembles the Jacobian from
+the residuals they return:
+
+from cmi_plugins.fdjacobian import ParallelJacobian
+with ParallelJacobian(mnofit) as jac:
+    leastsq(mnofit.residual, mnofit.values, Dfun=jac)
+
+The replicas are copied from the recipe when the pool starts.  They are
+copied again when the set of free variables changes, other changes of
+the recipe, e.g., new values of fixed variables, require a call of the
+sync method.
+"""
+
+import numpy
+
+
+class ParallelJacobian(object):
+    '''Jacobian of FitRecipe residuals for the leastsq Dfun argument.
+
+    recipe   -- FitRecipe with the refined variables
+    workers  -- number of worker processes.  Use one per free variable,
+                but at most the number of CPUs when None.  With
+                workers=1 the residuals are evaluated in the calling
+                process.
+    epsfcn   -- relative step of the forward differences as in leastsq.
+                Use the machine precision when None.
+    central  -- use central differences, which need twice as many
+                residual evaluations
+
+    Attributes:
+
+    ncalls   -- number of evaluated Jacobians
+    nfev     -- number of residual evaluations in the replicas
+    '''
+
+    def __init__(self, recipe, workers=None, epsfcn=None, central=False):
+        self.recipe = recipe
+        self.workers = workers
+        self.epsfcn = epsfcn
+        self.central = central
+        self.ncalls = 0
+        self.nfev = 0
+        self._pool = None
+        self._names = None
+        return
+
+
+    def __call__(self, p, *args):
+        '''Return Jacobian of the recipe residual at the variable values p.
+
+        The Jacobian has one row per residual point and one column per
+        free variable as expected by leastsq with col_deriv=0.
+        '''
+        names = self.recipe.getNames()
+        if names != self._names:
+            self.sync()
+        p = numpy.array(p, dtype=float)
+        steps = _stepSizes(p, self.epsfcn)
+        tasks = [(0, p)]
+        for k in range(len(p)):
+            dp = numpy.zeros_like(p)
+            dp[k] = steps[k]
+            tasks.append((k + 1, p + dp))
+            if self.central:
+                tasks.append((-k - 1, p - dp))
+        results = dict(self._map(tasks))
+        self.ncalls += 1
+        self.nfev += len(tasks)
+        f0 = results[0]
+        if len(p) and all(numpy.array_equal(f0, r)
+                          for k, r in results.items() if k):
+            emsg = ("Residual of the recipe replicas does not change "
+                    "with the variables.")
+            raise RuntimeError(emsg)
+        jac = numpy.empty((len(f0), len(p)))
+        for k in range(len(p)):
+            if self.central:
+                jac[:, k] = (results[k + 1] - results[-k - 1]) / (2 * steps[k])
+            else:
+                jac[:, k] = (results[k + 1] - f0) / steps[k]
+        return jac
+
+
+    def sync(self):
+        '''Copy the current recipe to the worker replicas.
+
+        This restarts the worker pool.
+        '''
+        import multiprocessing
+        from cmi_plugins.workerpool import WorkerPool
+        self.close()
+        self._names = self.recipe.getNames()
+        workers = self.workers
+        if workers is None:
+            nt = len(self._names) * (2 if self.central else 1) + 1
+            workers = min(nt, multiprocessing.cpu_count())
+        self._pool = WorkerPool(_makeReplica, _jacobianTask,
+                                (self.recipe,), workers)
+        return
+
+
+    def close(self):
+        '''Stop the worker processes.
+
+        The pool is started again by the next Jacobian evaluation.
+        '''
+        if self._pool is not None:
+            self._pool.close()
+        self._pool = None
+        self._names = None
+        return
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return
+
+
+    def _map(self, tasks):
+        '''Evaluate residuals for a list of (key, values) tasks.
+
+        Return an iterator of (key, residual) pairs in arbitrary order.
+        '''
+        return self._pool.imap_unordered(tasks)
+
+# end of class ParallelJacobian
+
+# Helpers --------------------------------------------------------------------
+
+def _stepSizes(p, epsfcn):
+    '''Return finite-difference steps for the variables as in MINPACK.
+    '''
+    eps = numpy.finfo(float).eps
+    h = numpy.sqrt(max(epsfcn or 0.0, eps))
+    steps = h * numpy.fabs(p)
+    steps[steps == 0] = h
+    # use the exact difference of the represented values
+    steps = (p + steps) - p
+    return steps
+
+
+def _makeReplica(recipe):
+    '''Return a copy of the recipe for the residual evaluations.
+    '''
+    import copy
+    replica = copy.deepcopy(recipe)
+    # fit hooks of the replicas would report every perturbed evaluation
+    replica.clearFitHooks()
+    return replica
+
+
+def _jacobianTask(recipe, task):
+    '''Evaluate the residual of the worker recipe.
+
+    recipe -- replica of the recipe from _makeReplica
+    task   -- tuple of (key, variable values)
+
+    Return a tuple of (key, residual array).
+    '''
+    key, p = task
+    return (key, numpy.array(recipe.residual(p), dtype=float))
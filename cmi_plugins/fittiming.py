@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""FitHook that records timing of the FitRecipe residual evaluations.
+
+The example scripts use recipe.clearFitHooks() to silence the printout
+of iteration numbers.  TimingFitHook can be used in its place to collect
+the number and latency of the residual calls without writing anything to
+stdout.  The time is also split among the FitContributions and the
+profile generators and functions in their equations, for example the
+nucpdf generator and the mpdf function in the mPDF co-refinement:
+
+from cmi_plugins.fittiming import TimingFitHook
+mnofit.clearFitHooks()
+timing = TimingFitHook()
+mnofit.pushFitHook(timing)
+leastsq(mnofit.residual, mnofit.values)
+print(timing.summary())
+timing.save('timing.json')
+
+Times of the components are inclusive, i.e., the time of a contribution
+contains the time of its generators.  The generators and functions are
+timed only when they are actually evaluated, cached values that were
+not recalculated are not counted.  Only evaluations within the residual
+calls are recorded, but not those of the recipe validation.
+
+The timers are installed on the FitContribution and Operator classes
+and look up the hooks in the instrumented objects.  The methods of the
+objects are not replaced, therefore copies of a timed recipe, e.g.,
+the replicas in worker processes, evaluate their own parameters.
+"""
+
+from __future__ import print_function
+import time
+from collections import OrderedDict
+from diffpy.srfit.fitbase.fithook import FitHook
+
+# Use the most precise timer available.
+_timer = getattr(time, 'perf_counter', time.time)
+
+
+class TimingFitHook(FitHook):
+    '''FitHook that records the count and timing of residual calls.
+
+    ncalls     -- number of residual calls since the last clear
+    calltimes  -- list of the wall times of every residual call
+    components -- ordered dictionary of [ncalls, totaltime] lists
+                  for the instrumented contributions and their generators
+                  and functions.  The keys are "contribution" or
+                  "contribution.generator" names.
+    '''
+
+    def __init__(self):
+        self.ncalls = 0
+        self.calltimes = []
+        self.components = OrderedDict()
+        self._t0 = None
+        self._incall = False
+        self._instrumented = []
+        _installTimers()
+        return
+
+    # FitHook interface
+
+    def reset(self, recipe):
+        '''Instrument contributions and generators of the recipe.
+
+        This is called by FitRecipe whenever its configuration changes.
+        Objects that are already instrumented are skipped.
+        '''
+        self._incall = False
+        for con in recipe._contributions.values():
+            self._instrument(con, con.name)
+            for name, op in _equationOperators(con):
+                self._instrument(op, con.name + '.' + name)
+        return
+
+
+    def precall(self, recipe):
+        self._incall = True
+        self._t0 = _timer()
+        return
+
+
+    def postcall(self, recipe, chiv):
+        self.calltimes.append(_timer() - self._t0)
+        self.ncalls += 1
+        self._incall = False
+        return
+
+    # Reporting
+
+    def clear(self):
+        '''Reset all counters and recorded times.
+        '''
+        self.ncalls = 0
+        self.calltimes = []
+        for v in self.components.values():
+            v[:] = [0, 0.0]
+        return
+
+
+    def toDict(self):
+        '''Return dictionary with the recorded timing statistics.
+        '''
+        total = sum(self.calltimes)
+        rv = OrderedDict()
+        rv['ncalls'] = self.ncalls
+        rv['total'] = total
+        rv['mean'] = total / self.ncalls if self.ncalls else 0.0
+        rv['min'] = min(self.calltimes) if self.calltimes else 0.0
+        rv['max'] = max(self.calltimes) if self.calltimes else 0.0
+        comps = OrderedDict()
+        for name, (n, t) in self.components.items():
+            comps[name] = OrderedDict([('ncalls', n), ('total', t),
+                                       ('mean', t / n if n else 0.0)])
+        rv['components'] = comps
+        return rv
+
+
+    def summary(self):
+        '''Return the timing statistics formatted as a table.
+        '''
+        d = self.toDict()
+        lines = []
+        lines.append("%-32s %8s %12s %12s" %
+                     ("component", "ncalls", "total [s]", "mean [ms]"))
+        lines.append("%-32s %8i %12.4f %12.4f" % ("residual",
+                     d['ncalls'], d['total'], 1e3 * d['mean']))
+        for name, c in d['components'].items():
+            lines.append("%-32s %8i %12.4f %12.4f" % (name,
+                         c['ncalls'], c['total'], 1e3 * c['mean']))
+        return '\n'.join(lines)
+
+
+    def save(self, filename):
+        '''Save timing statistics to the specified file in JSON format.
+        '''
+        import json
+        with open(filename, 'w') as fp:
+            json.dump(self.toDict(), fp, indent=2)
+        return
+
+
+    def restore(self):
+        '''Remove the instrumentation from all timed objects.
+        '''
+        for obj in self._instrumented:
+            entries = [e for e in obj.__dict__.get('_timingstats', ())
+                       if e[0] is not self]
+            if entries:
+                obj._timingstats = entries
+            elif '_timingstats' in obj.__dict__:
+                del obj._timingstats
+        self._instrumented = []
+        return
+
+    # Helpers
+
+    def _instrument(self, obj, key):
+        '''Register obj for timing under the component key.
+        '''
+        entries = obj.__dict__.get('_timingstats')
+        if entries is None:
+            entries = []
+            obj._timingstats = entries
+        if any(e[0] is self for e in entries):
+            return
+        stats = self.components.setdefault(key, [0, 0.0])
+        entries.append((self, stats))
+        self._instrumented.append(obj)
+        return
+
+# End class TimingFitHook
+
+# Helpers --------------------------------------------------------------------
+
+def _installTimers():
+    '''Wrap FitContribution.residual and Operator.getValue with timers.
+
+    The wrappers call the original methods directly for objects that
+    are not instrumented.  This is done only once per process.
+    '''
+    from diffpy.srfit.fitbase.fitcontribution import FitContribution
+    from diffpy.srfit.equation.literals.operators import Operator
+    if getattr(FitContribution.residual, '_timed', False):
+        return
+    residual = FitContribution.residual
+    getValue = Operator.getValue
+    def timedResidual(self):
+        entries = _activeStats(self)
+        if not entries:
+            return residual(self)
+        return _timedCall(entries, residual, self)
+    def timedGetValue(self):
+        entries = _activeStats(self)
+        if not entries or self._value is not None:
+            return getValue(self)
+        # evaluate the arguments first so that only the operation is timed
+        for arg in self.args:
+            arg.value
+        return _timedCall(entries, getValue, self)
+    timedResidual._timed = timedGetValue._timed = True
+    FitContribution.residual = timedResidual
+    Operator.getValue = timedGetValue
+    return
+
+
+def _activeStats(obj):
+    '''Return [ncalls, totaltime] lists of the hooks that are timing obj.
+    '''
+    entries = obj.__dict__.get('_timingstats')
+    if not entries:
+        return None
+    return [stats for hook, stats in entries if hook._incall]
+
+
+def _timedCall(entries, f, obj):
+    '''Call f(obj) and add its wall time to the stats in entries.
+    '''
+    t0 = _timer()
+    try:
+        return f(obj)
+    finally:
+        dt = _timer() - t0
+        for stats in entries:
+            stats[0] += 1
+            stats[1] += dt
+
+
+def _equationOperators(con):
+    '''Generate (name, operator) pairs for objects used in contribution.
+
+    This yields the profile generators and the functions registered
+    with the contribution, but not the standard numpy functions.
+    The equation holds its own operators for the registered functions,
+    therefore they are collected from the equation tree.
+    '''
+    from diffpy.srfit.equation import builder
+    from diffpy.srfit.equation.literals.operators import Operator
+    names = set(name for name in con._eqfactory.builders
+                if name != 'eq' and name not in builder._builders)
+    eq = con._eq
+    stack = [eq.root] if eq is not None and eq.root is not None else []
+    seen = set()
+    while stack:
+        lit = stack.pop()
+        if id(lit) in seen or not isinstance(lit, Operator):
+            continue
+        seen.add(id(lit))
+        if lit.name in names:
+            yield lit.name, lit
+        stack.extend(lit.args)
+    return
@@ -0,0 +1,439 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""Debye PDF calculation with incremental updates for refinements.
+
+The DebyePDFGenerator recalculates all atom pairs on every residual call,
+even when the refined parameters change only a few atom positions or the
+Biso of one species.  IncrementalDebyePDFCalculator keeps pair-distance
+histograms for every pair of atom species and on each call compares the
+structure with the previous one:
+
+*   When some atoms moved, only their pairs are removed from and added
+    to the histograms, which costs O(N * changed) instead of O(N**2).
+*   When all atoms of a species change Uiso to a common value, e.g.,
+    due to a constrained Biso variable, the histograms are reused as
+    they are, because the displacement damping is applied to the whole
+    species pair in the Debye sum.
+*   Otherwise the histograms are rebuilt.
+
+The distances are distributed between the two nearest nodes of a fine
+r-grid so that the Debye sum is evaluated over the nodes.  The node
+spacing follows from maxerror, the bound of the interpolation error
+of each sin(Q r) / (Q r) term.
+
+Usage in the fitCdSeNP example:
+
+from cmi_plugins.incrementalpdf import addIncrementalStructure
+cdsePDF = PDFContribution("CdSe")
+cdsePDF.loadData(dataFile)
+cdsePDF.setCalculationRange(xmin=1, xmax=20, dx=0.01)
+addIncrementalStructure(cdsePDF, "CdSe", loadStructure(structureFile))
+"""
+
+import numpy
+from diffpy.srfit.pdf.basepdfgenerator import BasePDFGenerator
+from diffpy.srfit.pdf.debyepdfgenerator import DebyePDFGenerator
+
+
+class IncrementalDebyePDFCalculator(object):
+    '''Debye PDF calculator that updates pair histograms incrementally.
+
+    The attributes follow the DebyePDFCalculator, so this can be used
+    as a calculator in the srfit PDF generators.
+
+    qmin, qmax  -- range of the Fourier transformation
+    rmin, rmax, rstep -- r-grid of the calculated PDF
+    scale       -- scale factor of the PDF
+    qdamp       -- Gaussian damping of the PDF due to Q-resolution
+    delta1, delta2 -- coefficients of the 1/r and 1/r**2 sharpening
+                   of the correlated motion
+    qbroad      -- peak broadening due to Q-resolution
+    maxerror    -- upper bound of the interpolation error of each pair
+                   term sin(Q r) / (Q r) for Q up to qmax
+    rextension  -- pairs are counted up to rcut = rmax + rextension and
+                   smoothly tapered above rmax.  When None, use 10 ripple
+                   periods 2 pi / qmax but at most 10 A.
+    maxfraction -- rebuild the histograms when a larger fraction of atoms
+                   changed
+    rebuildinterval -- rebuild the histograms after this number of
+                   incremental updates to remove the rounding errors
+    counts      -- dictionary with the number of calls that were "full",
+                   "incremental", "relabel" or "unchanged"
+    qgrid       -- Q-values of F(Q) from the last calculation
+    fq          -- the reduced structure function from the last calculation
+    '''
+
+    def __init__(self, **kwargs):
+        self.qmin = 0.0
+        self.qmax = 25.0
+        self.rmin = 0.0
+        self.rmax = 10.0
+        self.rstep = 0.01
+        self.scale = 1.0
+        self.qdamp = 0.0
+        self.delta1 = 0.0
+        self.delta2 = 0.0
+        self.qbroad = 0.0
+        self.maxerror = 1e-3
+        self.rextension = None
+        self.maxfraction = 0.25
+        self.rebuildinterval = 1000
+        self.counts = dict(full=0, incremental=0, relabel=0, unchanged=0)
+        self.qgrid = None
+        self.fq = None
+        self._sfttype = 'X'
+        self._sfcache = {}
+        self._state = None
+        self._sinccache = None
+        for n, v in kwargs.items():
+            if not hasattr(self, n):
+                emsg = "Invalid keyword argument %r." % n
+                raise TypeError(emsg)
+            setattr(self, n, v)
+        return
+
+    # Properties
+
+    @property
+    def rgrid(self):
+        "Numpy array of r-points where the PDF is calculated."
+        i0 = int(numpy.ceil(self.rmin / self.rstep))
+        i1 = int(numpy.ceil(self.rmax / self.rstep))
+        return self.rstep * numpy.arange(max(0, i0), i1)
+
+    @property
+    def rcut(self):
+        "Maximum counted pair distance."
+        ext = self.rextension
+        if ext is None:
+            ext = min(10.0, 10 * 2 * numpy.pi / self.qmax)
+        return self.rmax + ext
+
+    @property
+    def nodestep(self):
+        "Spacing of the histogram nodes."
+        # linear interpolation error is at most h**2 / 8 * max|f''|
+        # where |f''| <= qmax**2 / 3 for f = sin(Q r) / (Q r)
+        return numpy.sqrt(24 * self.maxerror) / self.qmax
+
+    # Methods compatible with DebyePDFCalculator
+
+    def setScatteringFactorTableByType(self, tp):
+        '''Use scattering factor table of the specified type.
+
+        tp   -- registered type of the srreal ScatteringFactorTable,
+                e.g., "X" or "N"
+        '''
+        self._sfttype = tp
+        self._sfcache = {}
+        return
+
+
+    def getRadiationType(self):
+        '''Return radiation type of the scattering factor table.
+        '''
+        return self._getScatteringFactorTable().radiationType()
+
+
+    def __call__(self, stru):
+        '''Calculate PDF for a structure object supported by srreal.
+
+        stru -- structure object or StructureAdapter, such as the one
+                passed by the srfit PDF generators
+
+        Anisotropic displacements are approximated by the equivalent Uiso.
+
+        Return a tuple of (r, G) numpy arrays.
+        '''
+        from diffpy.srreal.structureadapter import createStructureAdapter
+        adpt = createStructureAdapter(stru)
+        n = adpt.countSites()
+        xyz = numpy.array([adpt.siteCartesianPosition(i) for i in range(n)],
+                          dtype=float).reshape(n, 3)
+        elements = [adpt.siteAtomType(i) for i in range(n)]
+        uiso = [numpy.trace(adpt.siteCartesianUij(i)) / 3.0
+                for i in range(n)]
+        return self.calculate(xyz, elements, uiso)
+
+
+    def calculate(self, xyz, elements, uiso=0.0):
+        '''Calculate PDF of a cluster given as arrays.
+
+        xyz      -- Cartesian coordinates, array of shape (N, 3)
+        elements -- atom types, a sequence of N strings
+        uiso     -- isotropic displacement parameters, either a scalar
+                    or an array of N values
+
+        The pair histograms are updated from the previous call.
+
+        Return a tuple of (r, G) numpy arrays.
+        '''
+        xyz = numpy.array(xyz, dtype=float)
+        elements = numpy.asarray(elements)
+        uiso = numpy.array(numpy.broadcast_to(
+            numpy.asarray(uiso, dtype=float), (len(xyz),)))
+        self._update(xyz, elements, uiso)
+        return self._evaluatePDF()
+
+
+    def clear(self):
+        '''Forget the cached histograms.
+        '''
+        self._state = None
+        return
+
+    # Histogram updates
+
+    def _update(self, xyz, elements, uiso):
+        '''Bring the cached histograms up to date with the structure.
+        '''
+        st = self._state
+        if (st is None or st['rcut'] != self.rcut or
+                st['nodestep'] != self.nodestep or
+                len(xyz) != len(st['xyz']) or
+                not numpy.array_equal(elements, st['elements']) or
+                st['nupdates'] >= self.rebuildinterval):
+            self._rebuild(xyz, elements, uiso)
+            return
+        # check for changes in Uiso
+        species = st['species']
+        code = st['code']
+        newspecies = list(species)
+        for c, (smbl, u) in enumerate(species):
+            unew = numpy.unique(uiso[code == c])
+            if len(unew) != 1:
+                self._rebuild(xyz, elements, uiso)
+                return
+            newspecies[c] = (smbl, float(unew[0]))
+        if len(set(newspecies)) != len(newspecies):
+            self._rebuild(xyz, elements, uiso)
+            return
+        relabeled = newspecies != species
+        st['species'] = newspecies
+        moved = numpy.any(xyz != st['xyz'], axis=1).nonzero()[0]
+        if len(moved) > self.maxfraction * len(xyz):
+            self._rebuild(xyz, elements, uiso)
+            return
+        if len(moved):
+            self._movePairs(moved, xyz)
+            st['nupdates'] += 1
+            self.counts['incremental'] += 1
+        elif relabeled:
+            self.counts['relabel'] += 1
+        else:
+            self.counts['unchanged'] += 1
+        return
+
+
+    def _rebuild(self, xyz, elements, uiso):
+        '''Count all pairs from scratch.
+        '''
+        from scipy.spatial import cKDTree
+        keys = list(zip(elements.tolist(), uiso.tolist()))
+        species = sorted(set(keys))
+        index = dict((k, i) for i, k in enumerate(species))
+        code = numpy.array([index[k] for k in keys], dtype=int)
+        h = self.nodestep
+        nnodes = int(numpy.ceil(self.rcut / h)) + 2
+        nsp = len(species)
+        st = dict(rcut=self.rcut, nodestep=h, nnodes=nnodes,
+                  xyz=xyz, elements=elements, species=species,
+                  code=code, tree=cKDTree(xyz), nupdates=0,
+                  hist=numpy.zeros(nsp * nsp * nnodes))
+        self._state = st
+        allatoms = numpy.arange(len(xyz))
+        self._addPairs(xyz, allatoms, st['tree'], 1.0)
+        self.counts['full'] += 1
+        return
+
+
+    def _movePairs(self, moved, xyz):
+        '''Replace pairs of the moved atoms with their new distances.
+
+        The affected ordered pairs are those with at least one moved atom.
+        Their sum is 2 * A - B, where A is a sum over pairs from the moved
+        atoms to all atoms and B is a sum over pairs of the moved atoms.
+        '''
+        from scipy.spatial import cKDTree
+        st = self._state
+        xyzold = st['xyz']
+        treeold = st['tree']
+        treenew = cKDTree(xyz)
+        self._addPairs(xyzold, moved, treeold, -2.0)
+        self._addPairs(xyzold, moved, cKDTree(xyzold[moved]), +1.0, moved)
+        self._addPairs(xyz, moved, treenew, +2.0)
+        self._addPairs(xyz, moved, cKDTree(xyz[moved]), -1.0, moved)
+        st['xyz'] = xyz
+        st['tree'] = treenew
+        return
+
+
+    def _addPairs(self, xyz, sources, tree, weight, targets=None,
+                  chunksize=256):
+        '''Add weighted pair distances to the species-pair histograms.
+
+        xyz      -- all atom positions
+        sources  -- indices of atoms at the pair origins
+        tree     -- KD-tree of the pair targets
+        weight   -- weight of every pair in the histogram
+        targets  -- indices of the atoms in the tree or None for all atoms
+        '''
+        from scipy.spatial import cKDTree
+        st = self._state
+        code = st['code']
+        nsp = len(st['species'])
+        h = st['nodestep']
+        nnodes = st['nnodes']
+        hist = st['hist']
+        for k in range(0, len(sources), chunksize):
+            src = sources[k:k + chunksize]
+            pairs = cKDTree(xyz[src]).sparse_distance_matrix(
+                    tree, st['rcut'], output_type='ndarray')
+            d = pairs['v']
+            keep = d > 0
+            d = d[keep]
+            c0 = code[src[pairs['i'][keep]]]
+            j = pairs['j'][keep]
+            c1 = code[j if targets is None else targets[j]]
+            # histograms are symmetric in the species pair
+            ipair = numpy.minimum(c0, c1) * nsp + numpy.maximum(c0, c1)
+            t = d / h
+            inode = t.astype(int)
+            frac = t - inode
+            idx = ipair * nnodes + inode
+            hist += weight * numpy.bincount(idx, weights=1 - frac,
+                                            minlength=len(hist))
+            hist += weight * numpy.bincount(idx + 1, weights=frac,
+                                            minlength=len(hist))
+        return
+
+    # PDF evaluation
+
+    def _evaluatePDF(self):
+        '''Evaluate F(Q) from the histograms and transform it to G(r).
+        '''
+        st = self._state
+        q, qstep, rnodes, sincmatrix = self._getSincMatrix()
+        nsp = len(st['species'])
+        hist = st['hist'].reshape(nsp, nsp, st['nnodes'])
+        weights = self._taper(rnodes)
+        corr = 1.0
+        if self.delta1 or self.delta2 or self.qbroad:
+            rpos = numpy.where(rnodes > 0, rnodes, 1.0)
+            corr = (1.0 - self.delta1 / rpos - self.delta2 / rpos**2 +
+                    self.qbroad**2 * rnodes**2)
+            corr = numpy.maximum(corr, 0.0)
+        elements = set(smbl for smbl, u in st['species'])
+        sfq = self._scatteringFactors(elements, q)
+        fq = numpy.zeros_like(q)
+        for a, (ea, ua) in enumerate(st['species']):
+            for b in range(a, nsp):
+                eb, ub = st['species'][b]
+                hw = hist[a, b] * weights
+                if not hw.any():
+                    continue
+                if numpy.isscalar(corr):
+                    dw = numpy.exp(-0.5 * q**2 * (ua + ub))
+                    s = dw * numpy.dot(sincmatrix, hw)
+                else:
+                    dw = numpy.exp(-0.5 * numpy.outer(q**2, (ua + ub) * corr))
+                    s = numpy.dot(sincmatrix * dw, hw)
+                fq += sfq[ea] * sfq[eb] * s
+        code = st['code']
+        natoms = len(code)
+        favg = sum(numpy.sum(code == c) * sfq[smbl]
+                   for c, (smbl, u) in enumerate(st['species'])) / natoms
+        fq *= q / (natoms * favg**2)
+        self.qgrid = q
+        self.fq = fq
+        r = self.rgrid
+        g = (2 / numpy.pi) * qstep * numpy.dot(numpy.sin(numpy.outer(r, q)), fq)
+        g *= self.scale * numpy.exp(-0.5 * (self.qdamp * r)**2)
+        return r, g
+
+
+    def _getSincMatrix(self):
+        '''Return Q-grid, Q-step, node r-values and sin(Q r) / (Q r) matrix.
+        '''
+        st = self._state
+        key = (self.qmin, self.qmax, st['rcut'], st['nodestep'], st['nnodes'])
+        if self._sinccache is None or self._sinccache[0] != key:
+            qstep = numpy.pi / (2 * st['rcut'])
+            q = numpy.arange(int(numpy.ceil(self.qmax / qstep))) * qstep
+            q = q[q >= self.qmin]
+            rnodes = st['nodestep'] * numpy.arange(st['nnodes'])
+            sincmatrix = numpy.sinc(numpy.outer(q, rnodes) / numpy.pi)
+            self._sinccache = (key, (q, qstep, rnodes, sincmatrix))
+        return self._sinccache[1]
+
+
+    def _taper(self, r):
+        '''Smooth weights that go from 1 at rmax to 0 at rcut.
+        '''
+        rcut = self._state['rcut']
+        if rcut <= self.rmax:
+            return numpy.where(r <= rcut, 1.0, 0.0)
+        t = numpy.clip((r - self.rmax) / (rcut - self.rmax), 0, 1)
+        return numpy.cos(0.5 * numpy.pi * t)**2
+
+
+    def _getScatteringFactorTable(self):
+        from diffpy.srreal.scatteringfactortable import ScatteringFactorTable
+        return ScatteringFactorTable.createByType(self._sfttype)
+
+
+    def _scatteringFactors(self, elements, q):
+        '''Return dictionary of scattering factor arrays on the Q-grid.
+        '''
+        if self._sfcache.get('q') is not q:
+            self._sfcache = dict(q=q)
+        missing = [smbl for smbl in elements if smbl not in self._sfcache]
+        if missing:
+            sft = self._getScatteringFactorTable()
+            for smbl in missing:
+                self._sfcache[smbl] = numpy.array(
+                        [sft.lookup(smbl, qi) for qi in q])
+        return dict((smbl, self._sfcache[smbl]) for smbl in elements)
+
+# end of class IncrementalDebyePDFCalculator
+
+
+class IncrementalDebyePDFGenerator(DebyePDFGenerator):
+    '''DebyePDFGenerator that uses IncrementalDebyePDFCalculator.
+
+    The calculator reads the structure through the srreal
+    StructureAdapter of the phase.  Anisotropic displacements are
+    approximated by the equivalent Uiso.
+    '''
+
+    def __init__(self, name="pdf"):
+        BasePDFGenerator.__init__(self, name)
+        self._setCalculator(IncrementalDebyePDFCalculator())
+        return
+
+# end of class IncrementalDebyePDFGenerator
+
+
+def addIncrementalStructure(contribution, name, stru):
+    '''Add non-periodic structure to PDFContribution with incremental
+    Debye PDF calculation.
+
+    This is an alternative to contribution.addStructure(name, stru,
+    periodic=False).
+
+    Return the new phase ParameterSet.
+    '''
+    gen = IncrementalDebyePDFGenerator(name)
+    gen.setStructure(stru, "phase", periodic=False)
+    contribution._setupGenerator(gen)
+    return gen.phase
@@ -43,11 +43,18 @@ x, y, dy are the data to be fitted with Gaussian peak (dy may be omitted)
 A, sig, and x0 are initial values.  If omitted the program will estimate
 their starting values.
 
+Many spectra sharing the same x grid can be fitted at once with
+
+Y = np.array([y, 2 * y, y + 0.1])
+res = fitGaussianBatch(x, Y, noise)
+res.A, res.sig, res.x0, res.converged
+
 This extension is based on the SrFit example gaussianrecipe.py
 """
 
 from __future__ import print_function
-from diffpy.srfit.fitbase import FitContribution, FitRecipe, Profile, FitResults
+import numpy
+from collections import namedtuple
 
 
 class GaussianFit(object):
@@ -71,10 +78,22 @@ class GaussianFit(object):
 
     results -- result report from the last refinement, refined values,
              and their estimated errors, parameter correlations, etc.
+             Calculated on first access after each refinement from
+             the cov matrix when it is available.
     recipe -- FitRecipe from SrFit that manages this refinement
+    cov    -- covariance matrix of the free variables obtained from
+             the optimizer Jacobian in the last refinement or None
+    dA, dsig, dx0 -- estimated standard deviations of A, sig and x0
+             from the cov matrix
+    verbose -- flag for printing the initial values and fit results
+    chi2   -- sum of squared weighted residuals after the last refinement
+    nfev   -- number of residual evaluations in the last refinement
+    njev   -- number of Jacobian evaluations in the last refinement
+    converged -- True if the last refinement reported convergence
     '''
 
-    def __init__(self, x, y, dy=None, A=None, sig=None, x0=None):
+    def __init__(self, x, y, dy=None, A=None, sig=None, x0=None,
+            verbose=True):
         '''Create new GaussianFit object
 
         x, y -- curve to be fitted with Gaussian peak.
@@ -82,18 +101,33 @@ class GaussianFit(object):
                 (may be omitted).
         A, sig, x0   -- optional initial parameters for the Gauss function.
                 Omitted parameters will be estimated from the input data.
+        verbose -- print initial values and fit results.  Use False
+                for quiet batch processing.
         '''
-        self.results = None
+        self.verbose = verbose
+        self.cov = None
+        self._results = None
+        self._refined = False
+        self.nfev = self.njev = 0
+        self.chi2 = numpy.nan
+        self.converged = False
         self._makeRecipe(x, y, dy)
         if None in (A, sig, x0):
             self._getStartingValues()
         if A is not None:  self.A = A
         if sig is not None:  self.sig = sig
         if x0 is not None:  self.x0 = x0
-        print('Initial parameter values:')
-        self.printValues()
+        if self.verbose:
+            print('Initial parameter values:')
+            self.printValues()
         return
 
+    @property
+    def results(self):
+        if self._refined and self._results is None:
+            self._results = _fitResultsFromCovariance(self.recipe, self.cov)
+        return self._results
+
     @property
     def x(self):
         return self.recipe.g1.profile.x
@@ -133,31 +167,48 @@ class GaussianFit(object):
         self.recipe.x0 = value
         return
 
+    @property
+    def dA(self):
+        return self._getUncertainty('A')
+
+    @property
+    def dsig(self):
+        return self._getUncertainty('sig')
+
+    @property
+    def dx0(self):
+        return self._getUncertainty('x0')
+
     @property
     def yg(self):
         return self.recipe.g1.evaluate()
 
+    def _getUncertainty(self, name):
+        '''Return standard deviation of the named variable from cov.
+
+        Return NaN when covariance is not available or when the
+        variable is not refined.
+        '''
+        names = self.recipe.names
+        if self.cov is None or name not in names:
+            return numpy.nan
+        i = names.index(name)
+        return numpy.sqrt(self.cov[i, i])
+
     def _getStartingValues(self):
         '''Estimate starting values for A, sig, and x0
         '''
-        from numpy import sqrt, log, pi
-        x, y = self.x, self.y
-        peakIndex = y.argmax()
-        peakValue = y[peakIndex]
-        self.x0 = x[peakIndex]
-        halfmaxlo = (y < peakValue/2) & (x < self.x0)
-        xhalflo = x[halfmaxlo][-1] if halfmaxlo.any() else x.min()
-        halfmaxhi = (y < peakValue/2) & (x > self.x0)
-        xhalfhi = x[halfmaxhi][0] if halfmaxhi.any() else x.max()
-        fwhm = xhalfhi - xhalflo
-        self.sig = fwhm / (2 * sqrt(2 * log(2)))
-        self.A = peakValue * sqrt(2 * pi) * self.sig
+        A, sig, x0 = _estimateStartingValues(self.x, self.y[numpy.newaxis])
+        self.x0 = x0[0]
+        self.sig = sig[0]
+        self.A = A[0]
         return
 
 
     def _makeRecipe(self, x, y, dy):
         '''Make a FitRecipe for fitting a Gaussian curve to data.
         '''
+        from diffpy.srfit.fitbase import FitContribution, FitRecipe, Profile
         profile = Profile()
         profile.setObservedProfile(x, y, dy)
         contribution = FitContribution("g1")
@@ -198,20 +249,84 @@ class GaussianFit(object):
         return
 
 
-    def refine(self):
+    def jacobian(self, p):
+        '''Calculate analytic Jacobian of the recipe residual.
+
+        p    -- values of the free recipe variables in the order
+                of self.recipe.names
+
+        Return array of shape (len(x), len(p)) with derivatives of
+        the weighted residual (yg - y) / dy for each free variable.
+        '''
+        pars = dict(A=self.A, sig=self.sig, x0=self.x0)
+        pars.update(zip(self.recipe.names, p))
+        g, dA, dsig, dx0 = _gaussianTerms(self.x, **pars)
+        columns = dict(A=dA, sig=dsig, x0=dx0)
+        J = numpy.array([columns[n] for n in self.recipe.names]).T
+        J /= self.dy[:, numpy.newaxis]
+        return J
+
+
+    def refine(self, derivatives='analytic'):
         '''Optimize the recipe created above using scipy.
+
+        derivatives -- use 'analytic' to pass the closed-form Jacobian
+                to the optimizer or 'numeric' to let it estimate
+                derivatives by finite differences.
         '''
-        from scipy.optimize.minpack import leastsq
-        leastsq(self.recipe.residual, self.recipe.values)
-        self.results = FitResults(self.recipe)
-        print("Fit results:\n")
-        print(self.results)
+        from scipy.optimize import leastsq
+        if derivatives not in ('analytic', 'numeric'):
+            emsg = "derivatives must be either 'analytic' or 'numeric'."
+            raise ValueError(emsg)
+        Dfun = self.jacobian if derivatives == 'analytic' else None
+        rv = leastsq(self.recipe.residual, self.recipe.values,
+                     Dfun=Dfun, full_output=True)
+        pbest, self.cov, infodict, ier = rv[0], rv[1], rv[2], rv[4]
+        # make sure the recipe is left at the optimum
+        if not numpy.array_equal(pbest, self.recipe.values):
+            self.recipe.residual(pbest)
+        self.nfev = infodict['nfev']
+        self.njev = infodict.get('njev', 0)
+        self.chi2 = numpy.sum(infodict['fvec']**2)
+        self.converged = (ier in (1, 2, 3, 4) and
+                          numpy.isfinite(self.recipe.values).all() and
+                          numpy.isfinite(infodict['fvec']).all())
+        self._results = None
+        self._refined = True
+        if self.verbose:
+            print("Fit results:\n")
+            print(self.results)
+        return
+
+
+    def refit(self, y, dy=None, warm_start=True, derivatives='analytic'):
+        '''Refine Gauss function for new y values on the same x grid.
+
+        The observed arrays are swapped in the existing profile so that
+        the recipe and its parsed equation are reused.
+
+        y    -- new y values at the same x points
+        dy   -- estimated standard deviations for the new y-values.
+                Keep the current standard deviations when omitted.
+        warm_start -- start from the current parameter values, i.e.,
+                the optimum of the previous refinement.  When False,
+                estimate the starting values from the new data.
+        derivatives -- 'analytic' or 'numeric' Jacobian, see refine
+        '''
+        profile = self.recipe.g1.profile
+        if dy is None:
+            dy = profile.dyobs
+        profile.setObservedProfile(profile.xobs, y, dy)
+        if not warm_start:
+            self._getStartingValues()
+        self.refine(derivatives=derivatives)
         return
 
 # end of class GaussianFit
 
 
-def fitGaussian(x, y, dy=None, A=None, sig=None, x0=None):
+def fitGaussian(x, y, dy=None, A=None, sig=None, x0=None,
+        derivatives='analytic', verbose=True):
     '''Fit Gaussian curve to the data and return calculated profile.
 
     x    -- input x values
@@ -220,17 +335,393 @@ def fitGaussian(x, y, dy=None, A=None, sig=None, x0=None):
     A, sig, x0 -- optional initial parameters for the area, width and
             center of the Gauss function.  Omitted parameters will be
             estimated from the input data.
+    derivatives -- 'analytic' or 'numeric' Jacobian, see
+            GaussianFit.refine
+    verbose -- print initial values and fit results
 
     Return a tuple of (yg, fit), where yg is the calculated Gaussian
     and fit and instance of the GaussianFit class with any details
     of the fit one could possible desire.
     '''
-    fit = GaussianFit(x, y, dy=dy, A=A, sig=sig, x0=x0)
-    fit.refine()
+    fit = GaussianFit(x, y, dy=dy, A=A, sig=sig, x0=x0, verbose=verbose)
+    fit.refine(derivatives=derivatives)
     return (fit.yg.copy(), fit)
 
 
+class GaussianBatchResults(object):
+    '''Gaussian parameters refined for a stack of spectra.
+
+    All attributes are arrays with one item per spectrum in the input
+    order.
+
+    A, sig, x0     -- refined area, width and center of the Gauss function
+    dA, dsig, dx0  -- estimated standard deviations of A, sig and x0
+    chi2       -- final sum of squared weighted residuals
+    niter      -- number of iterations used
+    converged  -- True for fits that met the convergence criteria
+    failures   -- dictionary of error messages for fits that raised
+                  an exception, the keys are spectrum indices.
+    '''
+
+    def __init__(self, n):
+        '''Create results container for n spectra filled with NaN.
+        '''
+        for name in ('A', 'sig', 'x0', 'dA', 'dsig', 'dx0', 'chi2'):
+            setattr(self, name, numpy.nan * numpy.ones(n))
+        self.niter = numpy.zeros(n, dtype=int)
+        self.converged = numpy.zeros(n, dtype=bool)
+        self.failures = {}
+        return
+
+
+    def __len__(self):
+        return len(self.A)
+
+# end of class GaussianBatchResults
+
+
+def fitGaussianBatch(x, Y, dY=None, A=None, sig=None, x0=None,
+        maxiter=100, ftol=1.49012e-8, xtol=1.49012e-8, chunksize=4096):
+    '''Fit Gaussian curves to a stack of spectra on a shared x grid.
+
+    x    -- input x values shared by all spectra
+    Y    -- 2D array of the y values, one spectrum per row
+    dY   -- estimated standard deviations for Y (optional).  Can be
+            a 2D array of the Y shape or one array for all spectra.
+    A, sig, x0 -- optional initial parameters, either scalars or arrays
+            with a value per spectrum.  Omitted parameters are estimated
+            from the input data.
+    maxiter -- maximum number of Levenberg-Marquardt iterations
+    ftol -- relative error desired in the sum of squares
+    xtol -- relative error desired in the approximate solution
+    chunksize -- number of spectra refined together.  This limits
+            the memory used by the Jacobian arrays.
+
+    The model and its Jacobian are evaluated for all spectra in a chunk
+    at once, without building a FitRecipe for each of them.
+
+    Return a GaussianBatchResults object.
+    '''
+    x = numpy.asarray(x, dtype=float)
+    Y = numpy.atleast_2d(numpy.asarray(Y, dtype=float))
+    if Y.shape[1] != x.size:
+        raise ValueError("Y rows must have the same length as x")
+    dY = (numpy.ones_like(Y) if dY is None else
+          numpy.broadcast_to(numpy.asarray(dY, dtype=float), Y.shape))
+    pinit = [None if p is None else
+             numpy.broadcast_to(numpy.asarray(p, dtype=float), Y.shape[:1])
+             for p in (A, sig, x0)]
+    res = GaussianBatchResults(len(Y))
+    for lo in range(0, len(Y), chunksize):
+        hi = lo + chunksize
+        p = numpy.array(_estimateStartingValues(x, Y[lo:hi]))
+        for i, pi in enumerate(pinit):
+            if pi is not None:  p[i] = pi[lo:hi]
+        _refineGaussianStack(x, Y[lo:hi], dY[lo:hi], p.T.copy(),
+                             res, slice(lo, hi), maxiter, ftol, xtol)
+    return res
+
+
+def fitGaussianMany(x, Y, dY=None, workers=None, chunksize=None,
+        warm_start=False, progress=None):
+    '''Refine GaussianFit for many independent spectra in parallel.
+
+    x    -- input x values shared by all spectra
+    Y    -- 2D array of the y values, one spectrum per row
+    dY   -- estimated standard deviations for Y (optional).  Can be
+            a 2D array of the Y shape or one array for all spectra.
+    workers -- number of worker processes.  Use all CPUs when None.
+            With workers=1 the fits run in the calling process.
+    chunksize -- number of spectra sent to a worker at a time.
+            When None, split the spectra to about 4 chunks per worker.
+    warm_start -- start each fit from the optimum of the previous fit
+            done in the same worker.  When False, estimate starting
+            values for every spectrum.
+    progress -- optional function called as progress(ndone, ntotal)
+            after each finished fit.
+
+    Every worker keeps one GaussianFit object and swaps the data with
+    GaussianFit.refit.  Failed fits do not abort the batch, they are
+    reported in the failures attribute of the returned results.  The
+    niter results are the numbers of Jacobian evaluations, i.e., the
+    Levenberg-Marquardt iterations of leastsq.
+
+    Return a GaussianBatchResults object in the order of Y rows.
+    '''
+    from cmi_plugins.workerpool import WorkerPool
+    x = numpy.asarray(x, dtype=float)
+    Y = numpy.atleast_2d(numpy.asarray(Y, dtype=float))
+    if Y.shape[1] != x.size:
+        raise ValueError("Y rows must have the same length as x")
+    dY = (numpy.ones_like(Y) if dY is None else
+          numpy.broadcast_to(numpy.asarray(dY, dtype=float), Y.shape))
+    n = len(Y)
+    res = GaussianBatchResults(n)
+    tasks = ((i, Y[i], dY[i]) for i in range(n))
+    pool = WorkerPool(_makeGaussianState, _fitGaussianTask,
+                      (x, warm_start), workers)
+    if chunksize is None:
+        chunksize = pool.chunkSize(n)
+    results = pool.imap_unordered(tasks, chunksize)
+    try:
+        for ndone, rv in enumerate(results, 1):
+            i, values, unc, chi2, niter, converged, emsg = rv
+            res.A[i], res.sig[i], res.x0[i] = values
+            res.dA[i], res.dsig[i], res.dx0[i] = unc
+            res.chi2[i] = chi2
+            res.niter[i] = niter
+            res.converged[i] = converged
+            if emsg is not None:
+                res.failures[i] = emsg
+            if progress is not None:
+                progress(ndone, n)
+    finally:
+        pool.close()
+    return res
+
+GaussianPeak = namedtuple('GaussianPeak',
+                          'A sig x0 dA dsig dx0 converged coldstart')
+
+
+def trackGaussian(x, frames, dy=None, derivatives='analytic'):
+    '''Track Gaussian peak over a stream of y frames.
+
+    x    -- input x values shared by all frames
+    frames -- iterable of y arrays, for example a generator that reads
+            detector frames as they arrive
+    dy   -- estimated standard deviations for the y-values (optional),
+            the same for all frames
+    derivatives -- 'analytic' or 'numeric' Jacobian, see
+            GaussianFit.refine
+
+    A single quiet GaussianFit is reused for the whole stream and each
+    fit starts from the optimum of the previous frame.  When such
+    refinement fails to converge or collapses the peak, i.e., moves its
+    center outside of x, makes it narrower than the x step or changes
+    the sign of its area, the frame is refined again from starting
+    values estimated from its data.  Frames are not kept after they
+    are fitted.
+
+    Yield GaussianPeak tuple of (A, sig, x0, dA, dsig, dx0, converged,
+    coldstart) for every frame, where coldstart is True when the
+    starting values were estimated from the frame data.
+    '''
+    x = numpy.asarray(x, dtype=float)
+    xu = numpy.unique(x)
+    if len(xu) < 2:
+        raise ValueError("x must have at least 2 distinct values.")
+    xlo, xhi = xu[0], xu[-1]
+    dxmin = numpy.diff(xu).min()
+    nans = (numpy.nan, numpy.nan, numpy.nan)
+    fit = None
+    for y in frames:
+        coldstart = fit is None
+        try:
+            if fit is None:
+                fit = GaussianFit(x, y, dy, verbose=False)
+                fit.refine(derivatives=derivatives)
+            else:
+                Aprev = fit.A
+                fit.refit(y, derivatives=derivatives)
+                collapsed = not (xlo <= fit.x0 <= xhi and
+                                 abs(fit.sig) >= dxmin and
+                                 fit.A * Aprev > 0)
+                if collapsed or not fit.converged:
+                    coldstart = True
+                    fit.refit(y, warm_start=False, derivatives=derivatives)
+        except Exception:
+            fit = None
+        if fit is None:
+            yield GaussianPeak(*(nans + nans + (False, coldstart)))
+            continue
+        yield GaussianPeak(fit.A, fit.sig, fit.x0, fit.dA, fit.dsig,
+                           fit.dx0, fit.converged, coldstart)
+    return
+
+def _makeGaussianState(x, warm_start):
+    '''Return worker state for fitGaussianMany as a dictionary.
+    '''
+    return dict(x=x, warm_start=warm_start, fit=None)
+
+
+def _fitGaussianTask(state, task):
+    '''Refine one spectrum in the worker GaussianFit object.
+
+    state -- worker state from _makeGaussianState
+    task  -- tuple of (index, y, dy)
+
+    Return a tuple of (index, (A, sig, x0), (dA, dsig, dx0), chi2,
+    niter, converged, emsg), where emsg is None for successful fits.
+    '''
+    i, y, dy = task
+    nans = (numpy.nan, numpy.nan, numpy.nan)
+    fit = state['fit']
+    try:
+        if fit is None:
+            fit = GaussianFit(state['x'], y, dy, verbose=False)
+            state['fit'] = fit
+            fit.refine()
+        else:
+            fit.refit(y, dy, warm_start=state['warm_start'])
+    except Exception as e:
+        # start over with a new GaussianFit for the next spectrum
+        state['fit'] = None
+        emsg = "%s: %s" % (type(e).__name__, e)
+        return (i, nans, nans, numpy.nan, 0, False, emsg)
+    values = (fit.A, fit.sig, fit.x0)
+    uncertainties = (fit.dA, fit.dsig, fit.dx0)
+    return (i, values, uncertainties, fit.chi2, fit.njev, fit.converged,
+            None)
+
+
+def _fitResultsFromCovariance(recipe, cov):
+    '''Create FitResults for the recipe with a known covariance matrix.
+
+    recipe -- FitRecipe at the optimum
+    cov    -- covariance matrix of the free variables from leastsq.
+              When None or of a wrong shape, FitResults calculates
+              the covariance from its own numerical Jacobian.
+
+    Return FitResults.
+    '''
+    from diffpy.srfit.fitbase import FitResults
+    n = len(recipe.names)
+    if cov is None or numpy.shape(cov) != (n, n):
+        return FitResults(recipe)
+
+    class CovarianceFitResults(FitResults):
+        # FitResults that takes the covariance matrix from the optimizer.
+        # When the overloaded method is not used by FitResults.update,
+        # the covariance is calculated as usual.
+
+        def _calculateCovariance(self):
+            self.cov = numpy.array(cov, dtype=float)
+            return
+
+    return CovarianceFitResults(recipe)
+
+
+def _gaussianTerms(x, A, sig, x0):
+    '''Evaluate Gauss function and its derivatives.
+
+    x    -- array of x values
+    A, sig, x0 -- Gauss function parameters, these are broadcast
+            against x so that arrays of shape (n, 1) give results
+            for n parameter sets.
+
+    Return a tuple of (g, dgdA, dgdsig, dgdx0).
+    '''
+    u = (x - x0) / sig
+    gunit = numpy.exp(-0.5 * u**2) / (numpy.sqrt(2 * numpy.pi) * sig)
+    g = A * gunit
+    dgdsig = g * (u**2 - 1) / sig
+    dgdx0 = g * u / sig
+    return (g, gunit, dgdsig, dgdx0)
+
+
+def _estimateStartingValues(x, Y):
+    '''Estimate Gauss function parameters for each row in Y.
+
+    The peak center is at the maximum of each row and the width is
+    obtained from the full width at half maximum.
+
+    Return a tuple of (A, sig, x0) arrays.
+    '''
+    from numpy import sqrt, log, pi
+    peakIndex = Y.argmax(axis=1)
+    peakValue = Y[numpy.arange(len(Y)), peakIndex]
+    x0 = x[peakIndex]
+    below = Y < peakValue[:, numpy.newaxis] / 2
+    halfmaxlo = below & (x < x0[:, numpy.newaxis])
+    xhalflo = numpy.where(halfmaxlo, x, -numpy.inf).max(axis=1)
+    xhalflo[~halfmaxlo.any(axis=1)] = x.min()
+    halfmaxhi = below & (x > x0[:, numpy.newaxis])
+    xhalfhi = numpy.where(halfmaxhi, x, numpy.inf).min(axis=1)
+    xhalfhi[~halfmaxhi.any(axis=1)] = x.max()
+    fwhm = xhalfhi - xhalflo
+    sig = fwhm / (2 * sqrt(2 * log(2)))
+    A = peakValue * sqrt(2 * pi) * sig
+    return (A, sig, x0)
+
+
+def _refineGaussianStack(x, Y, dY, p, res, index, maxiter, ftol, xtol):
+    '''Levenberg-Marquardt refinement of Gauss functions for a stack.
+
+    x, Y, dY -- shared x grid, spectra and their standard deviations
+    p    -- array of starting (A, sig, x0) values of shape (n, 3)
+    res  -- GaussianBatchResults object to be updated in place
+    index -- slice of the res arrays that corresponds to rows in Y
+
+    Spectra that have converged are dropped from further iterations.
+    '''
+    n = len(Y)
+    chi2 = numpy.inf * numpy.ones(n)
+    lam = 1e-3 * numpy.ones(n)
+    niter = numpy.zeros(n, dtype=int)
+    converged = numpy.zeros(n, dtype=bool)
+    wt = 1.0 / dY
+
+    def residualAndJacobian(rows, pr):
+        A, sig, x0 = (pr[:, i:i + 1] for i in range(3))
+        g, dA, dsig, dx0 = _gaussianTerms(x, A, sig, x0)
+        w = wt[rows]
+        chiv = (g - Y[rows]) * w
+        J = numpy.stack((dA * w, dsig * w, dx0 * w), axis=-1)
+        return chiv, J
+
+    active = numpy.arange(n)
+    chiv, J = residualAndJacobian(active, p)
+    chi2 = numpy.sum(chiv**2, axis=1)
+    for it in range(maxiter):
+        ok = numpy.isfinite(chi2[active]) & numpy.isfinite(J).all(axis=(1, 2))
+        active, chiv, J = active[ok], chiv[ok], J[ok]
+        if not len(active):
+            break
+        niter[active] += 1
+        JTJ = numpy.einsum('nmi,nmj->nij', J, J)
+        JTr = numpy.einsum('nmi,nm->ni', J, chiv)
+        diag = numpy.diagonal(JTJ, axis1=1, axis2=2)
+        damp = lam[active, numpy.newaxis] * numpy.maximum(diag, 1e-300)
+        M = JTJ + damp[:, :, numpy.newaxis] * numpy.eye(3)
+        delta = -numpy.linalg.solve(M, JTr[:, :, numpy.newaxis])[:, :, 0]
+        ptrial = p[active] + delta
+        chivtrial, Jtrial = residualAndJacobian(active, ptrial)
+        chi2trial = numpy.sum(chivtrial**2, axis=1)
+        accept = chi2trial < chi2[active]
+        smallf = accept & (chi2[active] - chi2trial <= ftol * chi2trial)
+        smallx = numpy.all(numpy.abs(delta) <=
+                           xtol * (numpy.abs(p[active]) + xtol), axis=1)
+        ia = active[accept]
+        p[ia] = ptrial[accept]
+        chi2[ia] = chi2trial[accept]
+        chiv[accept] = chivtrial[accept]
+        J[accept] = Jtrial[accept]
+        lam[active] = numpy.where(accept, lam[active] / 10, lam[active] * 10)
+        done = smallf | smallx
+        converged[active[done]] = True
+        keep = ~done
+        active, chiv, J = active[keep], chiv[keep], J[keep]
+    # standard deviations from the unscaled covariance matrix like FitResults
+    A, sig, x0 = (p[:, i:i + 1] for i in range(3))
+    g, dA, dsig, dx0 = _gaussianTerms(x, A, sig, x0)
+    J = numpy.stack((dA * wt, dsig * wt, dx0 * wt), axis=-1)
+    JTJ = numpy.einsum('nmi,nmj->nij', J, J)
+    unc = numpy.nan * numpy.ones_like(p)
+    finite = numpy.isfinite(JTJ).all(axis=(1, 2))
+    cov = numpy.linalg.pinv(JTJ[finite])
+    unc[finite] = numpy.sqrt(numpy.diagonal(cov, axis1=1, axis2=2))
+    res.A[index], res.sig[index], res.x0[index] = p.T
+    res.dA[index], res.dsig[index], res.dx0[index] = unc.T
+    res.chi2[index] = chi2
+    res.niter[index] = niter
+    res.converged[index] = converged & numpy.isfinite(chi2)
+    return
+
+
 def load_ipython_extension(ip):
     ip.user_ns['GaussianFit'] = GaussianFit
     ip.user_ns['fitGaussian'] = fitGaussian
+    ip.user_ns['fitGaussianBatch'] = fitGaussianBatch
+    ip.user_ns['fitGaussianMany'] = fitGaussianMany
+    ip.user_ns['trackGaussian'] = trackGaussian
     return
@@ -0,0 +1,453 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""IPython extension for SrFit fit of multiple Gaussian peaks.
+
+This is an extension of the ipy_gaussianfit plugin to patterns with many,
+possibly overlapping peaks.  Each peak is evaluated only at the x points
+within nsig standard deviations from its center and the Jacobian of the fit
+is assembled as a sparse matrix.  The cost of a refinement therefore scales
+with the number of points under the peaks rather than with the number of
+peaks times the size of the x grid.
+
+Usage in IPython shell:
+
+Activate this extension using
+
+    %load_ext cmi_plugins.ipy_multigaussianfit
+
+To try out the class execute the following commands:
+
+import numpy as np
+x = np.arange(0, 50, 0.05)
+centers = np.arange(3, 48, 3.5)
+noise = 0.02 * np.ones_like(x)
+y = sum(np.exp(-0.5*(x-c)**2/0.6**2) for c in centers)
+y += noise * np.random.randn(*x.shape)
+mfit = MultiGaussianFit(x, y, noise)
+mfit.refine()
+mfit.plot()
+
+When the peak centers x0 are omitted, the peaks are found as local maxima
+of y with height and prominence above threshold times the maximum of y.
+
+diffpy.srfit is imported only when a MultiGaussianFit is created or
+GaussianPeaksGenerator is first imported from this module.
+"""
+
+from __future__ import print_function
+import numpy
+from cmi_plugins.ipy_gaussianfit import _gaussianTerms
+from cmi_plugins.ipy_gaussianfit import _fitResultsFromCovariance
+
+
+def __getattr__(name):
+    '''Define GaussianPeaksGenerator on the first access.
+    '''
+    if name == 'GaussianPeaksGenerator':
+        return _defineGaussianPeaksGenerator()
+    emsg = "module %r has no attribute %r" % (__name__, name)
+    raise AttributeError(emsg)
+
+
+def _defineGaussianPeaksGenerator():
+    '''Return the GaussianPeaksGenerator class derived from srfit
+    ProfileGenerator.
+
+    The class is created once and then kept in the module namespace.
+    '''
+    if 'GaussianPeaksGenerator' in globals():
+        return globals()['GaussianPeaksGenerator']
+    from diffpy.srfit.fitbase import ProfileGenerator
+
+    class GaussianPeaksGenerator(ProfileGenerator):
+        '''Sum of Gaussian peaks evaluated within windows around centers.
+
+        The generator has parameters A_i, sig_i, x0_i for the area, width
+        and position of the i-th peak.
+
+        npeaks -- number of Gaussian peaks
+        nsig   -- half-width of the evaluation window in units of sig
+        '''
+
+        def __init__(self, name, npeaks, nsig=5):
+            '''Create generator for a sum of npeaks Gaussian peaks.
+
+            name   -- name of this ProfileGenerator
+            npeaks -- number of Gaussian peaks
+            nsig   -- half-width of the evaluation window in units of sig
+            '''
+            ProfileGenerator.__init__(self, name)
+            self.npeaks = npeaks
+            self.nsig = nsig
+            for i in range(npeaks):
+                self.newParameter('A_%i' % i, 1.0)
+                self.newParameter('sig_%i' % i, 1.0)
+                self.newParameter('x0_%i' % i, 0.0)
+            return
+
+
+        def peakValues(self, pars=None):
+            '''Return arrays of the A, sig and x0 values of all peaks.
+
+            pars -- optional dictionary of parameter values that override
+                    the current values of this generator.
+            '''
+            pars = {} if pars is None else pars
+            def values(prefix):
+                names = ['%s_%i' % (prefix, i) for i in range(self.npeaks)]
+                return numpy.array([pars[n] if n in pars else self.get(n).value
+                                    for n in names])
+            return (values('A'), values('sig'), values('x0'))
+
+
+        def peakTerms(self, x, pars=None):
+            '''Evaluate peaks and their derivatives at points within windows.
+
+            x    -- sorted array of x values
+            pars -- optional dictionary of parameter values, see peakValues
+
+            Return a tuple of (peak, idx, g, dgdA, dgdsig, dgdx0), where
+            peak and idx are the peak numbers and x indices of the evaluated
+            points and the other items the Gauss function terms at them.
+            '''
+            A, sig, x0 = self.peakValues(pars)
+            hw = self.nsig * numpy.fabs(sig)
+            lo = numpy.searchsorted(x, x0 - hw, side='left')
+            hi = numpy.searchsorted(x, x0 + hw, side='right')
+            counts = hi - lo
+            peak = numpy.repeat(numpy.arange(self.npeaks), counts)
+            start = numpy.repeat(numpy.cumsum(counts) - counts, counts)
+            idx = lo[peak] + numpy.arange(counts.sum()) - start
+            terms = _gaussianTerms(x[idx], A[peak], sig[peak], x0[peak])
+            return (peak, idx) + terms
+
+
+        def __call__(self, x):
+            '''Evaluate the sum of Gaussian peaks at sorted points x.
+            '''
+            peak, idx, g = self.peakTerms(x)[:3]
+            y = numpy.bincount(idx, weights=g, minlength=len(x))
+            return y
+
+    # end of class GaussianPeaksGenerator
+
+    GaussianPeaksGenerator.__qualname__ = 'GaussianPeaksGenerator'
+    globals()['GaussianPeaksGenerator'] = GaussianPeaksGenerator
+    return GaussianPeaksGenerator
+
+
+class MultiGaussianFit(object):
+    '''Least-squares fit of a sum of Gauss functions to the specified data.
+
+    Input and simulated data (read-only):
+
+    x    --  input x values, must be sorted in increasing order
+    y    --  input y values
+    dy   --  estimated standard deviations for the y-values
+    yg   --  sum of Gauss functions for the current A, sig, x0
+
+    Parameters of the Gauss functions as arrays with value per peak:
+
+    A    --  integrated areas of the fitted peaks
+    sig  --  widths of the peaks (sigma in the Gauss distribution function)
+    x0   --  x-positions of the peak centers
+
+    Fit-related objects:
+
+    npeaks -- number of the fitted peaks
+    results -- result report from the last refinement, refined values,
+             and their estimated errors, parameter correlations, etc.
+             Calculated on first access after each refinement.
+    recipe -- FitRecipe from SrFit that manages this refinement
+    cov    -- covariance matrix of the free variables obtained from
+             the optimizer Jacobian in the last refinement or None
+    verbose -- flag for printing the initial values and fit results
+    generator -- GaussianPeaksGenerator that calculates the peaks
+    nfev   -- number of residual evaluations in the last refinement
+    njev   -- number of Jacobian evaluations in the last refinement
+    converged -- True if the last refinement reported convergence
+    '''
+
+    def __init__(self, x, y, dy=None, x0=None, npeaks=None, threshold=0.1,
+            nsig=5, verbose=True):
+        '''Create new MultiGaussianFit object
+
+        x, y -- curve to be fitted with Gaussian peaks.
+        dy   -- estimated standard deviations for the y-values
+                (may be omitted).
+        x0   -- optional initial positions of the peaks.  When omitted,
+                the peaks are found with the findPeaks function.
+        npeaks -- maximum number of peaks to find when x0 is omitted.
+        threshold -- minimum height and prominence of the found peaks
+                relative to the maximum of y.
+        nsig -- half-width of the peak evaluation window in units of sig.
+        verbose -- print initial values and fit results.
+        '''
+        x = numpy.asarray(x, dtype=float)
+        if numpy.any(numpy.diff(x) <= 0):
+            raise ValueError("x must be sorted in increasing order.")
+        y = numpy.asarray(y, dtype=float)
+        if npeaks is not None and npeaks < 1:
+            raise ValueError("npeaks must be at least 1.")
+        if x0 is None:
+            A, sig, x0 = findPeaks(x, y, npeaks=npeaks, threshold=threshold)
+        else:
+            x0 = numpy.atleast_1d(x0)
+            A, sig, x0 = _estimatePeaks(x, y, numpy.searchsorted(x, x0))
+        if not len(x0):
+            emsg = "No peaks to fit, lower the threshold or specify x0."
+            raise ValueError(emsg)
+        self.verbose = verbose
+        self.cov = None
+        self._results = None
+        self._refined = False
+        self.nfev = self.njev = 0
+        self.converged = False
+        self._makeRecipe(x, y, dy, len(x0), nsig)
+        self.A, self.sig, self.x0 = A, sig, x0
+        if self.verbose:
+            print('Initial parameter values:')
+            self.printValues()
+        return
+
+    @property
+    def results(self):
+        if self._refined and self._results is None:
+            self._results = _fitResultsFromCovariance(self.recipe, self.cov)
+        return self._results
+
+    @property
+    def x(self):
+        return self.recipe.mg.profile.x
+
+    @property
+    def y(self):
+        return self.recipe.mg.profile.y
+
+    @property
+    def dy(self):
+        return self.recipe.mg.profile.dy
+
+    @property
+    def npeaks(self):
+        return self.generator.npeaks
+
+    @property
+    def A(self):
+        return self._getPeakValues('A')
+
+    @A.setter
+    def A(self, value):
+        self._setPeakValues('A', value)
+        return
+
+    @property
+    def sig(self):
+        return self._getPeakValues('sig')
+
+    @sig.setter
+    def sig(self, value):
+        self._setPeakValues('sig', value)
+        return
+
+    @property
+    def x0(self):
+        return self._getPeakValues('x0')
+
+    @x0.setter
+    def x0(self, value):
+        self._setPeakValues('x0', value)
+        return
+
+    @property
+    def yg(self):
+        return self.recipe.mg.evaluate()
+
+    def _getPeakValues(self, prefix):
+        '''Return array of the prefix_i recipe variables for all peaks.
+        '''
+        names = ['%s_%i' % (prefix, i) for i in range(self.npeaks)]
+        return numpy.array([self.recipe.get(n).value for n in names])
+
+
+    def _setPeakValues(self, prefix, value):
+        '''Set values of the prefix_i recipe variables for all peaks.
+        '''
+        value = numpy.broadcast_to(value, (self.npeaks,))
+        for i, v in enumerate(value):
+            self.recipe.get('%s_%i' % (prefix, i)).value = v
+        return
+
+
+    def _makeRecipe(self, x, y, dy, npeaks, nsig):
+        '''Make a FitRecipe for fitting npeaks Gaussian curves to data.
+        '''
+        from diffpy.srfit.fitbase import FitContribution, FitRecipe, Profile
+        GaussianPeaksGenerator = _defineGaussianPeaksGenerator()
+        profile = Profile()
+        profile.setObservedProfile(x, y, dy)
+        contribution = FitContribution("mg")
+        contribution.setProfile(profile, xname="x")
+        generator = GaussianPeaksGenerator("gpeaks", npeaks, nsig=nsig)
+        contribution.addProfileGenerator(generator)
+        recipe = FitRecipe()
+        recipe.addContribution(contribution)
+        for i in range(npeaks):
+            recipe.addVar(generator.get('A_%i' % i))
+            recipe.addVar(generator.get('sig_%i' % i))
+            recipe.addVar(generator.get('x0_%i' % i))
+        recipe.clearFitHooks()
+        self.recipe = recipe
+        self.generator = generator
+        return
+
+
+    def jacobian(self, p):
+        '''Calculate sparse Jacobian of the recipe residual.
+
+        p    -- values of the free recipe variables in the order
+                of self.recipe.names
+
+        Return scipy.sparse matrix of shape (len(x), len(p)) with
+        derivatives of the weighted residual (yg - y) / dy.  Only
+        the points within the evaluation window of each peak are
+        stored, hence the matrix is block-sparse.
+        '''
+        from scipy.sparse import csr_matrix
+        names = self.recipe.names
+        pars = {}
+        for prefix in ('A', 'sig', 'x0'):
+            pnames = ['%s_%i' % (prefix, i) for i in range(self.npeaks)]
+            pars.update(zip(pnames, self._getPeakValues(prefix)))
+        pars.update(zip(names, p))
+        x, dy = self.x, self.dy
+        peak, idx, g, dA, dsig, dx0 = self.generator.peakTerms(x, pars)
+        column = dict((n, i) for i, n in enumerate(names))
+        rows, cols, vals = [], [], []
+        for prefix, d in (('A', dA), ('sig', dsig), ('x0', dx0)):
+            pcol = numpy.array([column.get('%s_%i' % (prefix, i), -1)
+                                for i in range(self.npeaks)])
+            free = pcol[peak] >= 0
+            rows.append(idx[free])
+            cols.append(pcol[peak][free])
+            vals.append(d[free] / dy[idx[free]])
+        rows, cols, vals = map(numpy.concatenate, (rows, cols, vals))
+        J = csr_matrix((vals, (rows, cols)), shape=(len(x), len(names)))
+        return J
+
+
+    def printValues(self):
+        '''Print out values of Gaussian parameters
+        '''
+        print('%4s %14s %14s %14s' % ('peak', 'A', 'sig', 'x0'))
+        for i, (A, sig, x0) in enumerate(zip(self.A, self.sig, self.x0)):
+            print('%4i %14.6g %14.6g %14.6g' % (i, A, sig, x0))
+        return
+
+
+    def plot(self):
+        '''Plot the input data and the best fit.
+        '''
+        import matplotlib.pyplot as plt
+        plt.plot(self.x, self.y, 'b.', label="observed profile")
+        plt.plot(self.x, self.yg, 'g-', label="calculated Gaussians")
+        plt.legend()
+        plt.xlabel("x")
+        plt.ylabel("y")
+        plt.show()
+        return
+
+
+    def refine(self):
+        '''Optimize the recipe using scipy with the sparse Jacobian.
+        '''
+        from scipy.optimize import least_squares
+        rv = least_squares(self.recipe.residual, self.recipe.values,
+                           jac=self.jacobian, x_scale='jac')
+        self.recipe.residual(rv.x)
+        self.nfev = rv.nfev
+        self.njev = rv.njev
+        self.converged = rv.success and numpy.isfinite(rv.x).all()
+        J = rv.jac.toarray() if hasattr(rv.jac, 'toarray') else rv.jac
+        self.cov = numpy.linalg.pinv(numpy.dot(J.T, J))
+        self._results = None
+        self._refined = True
+        if self.verbose:
+            print("Fit results:\n")
+            print(self.results)
+        return
+
+# end of class MultiGaussianFit
+
+
+def findPeaks(x, y, npeaks=None, threshold=0.1):
+    '''Find peaks in y and estimate their Gaussian parameters.
+
+    x    -- sorted array of x values
+    y    -- array of y values
+    npeaks -- maximum number of returned peaks, the highest peaks are
+            kept.  Return all peaks when None.
+    threshold -- minimum height and prominence of the peaks relative
+            to the maximum of y.  The prominence criterion rejects
+            local maxima caused by noise.
+
+    Peaks are the local maxima of y, their widths are estimated from
+    the half-maximum crossing on the side closer to the peak.
+
+    Return a tuple of (A, sig, x0) arrays sorted by x0.
+    '''
+    from scipy.signal import find_peaks
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    ycut = threshold * y.max()
+    ipk = find_peaks(y, height=ycut, prominence=ycut)[0]
+    if npeaks is not None:
+        ipk = numpy.sort(ipk[numpy.argsort(y[ipk])[::-1][:npeaks]])
+    return _estimatePeaks(x, y, ipk)
+
+
+def _estimatePeaks(x, y, ipk):
+    '''Estimate Gauss function parameters for peaks at indices ipk.
+
+    This generalizes GaussianFit._getStartingValues to many peaks.
+    The half-width at half maximum is taken from the closer of the
+    half-maximum crossings at either side of the peak.
+
+    Return a tuple of (A, sig, x0) arrays.
+    '''
+    from numpy import sqrt, log, pi
+    ipk = numpy.clip(numpy.asarray(ipk, dtype=int), 0, len(x) - 1)
+    index = numpy.arange(len(x))
+    peakValue = y[ipk]
+    x0 = x[ipk]
+    below = y < peakValue[:, numpy.newaxis] / 2
+    ilo = numpy.where(below & (index < ipk[:, numpy.newaxis]), index, -1)
+    ilo = ilo.max(axis=1)
+    ihi = numpy.where(below & (index > ipk[:, numpy.newaxis]), index, len(x))
+    ihi = ihi.min(axis=1)
+    hwlo = numpy.where(ilo >= 0, x0 - x[ilo.clip(0)], numpy.inf)
+    hwhi = numpy.where(ihi < len(x), x[ihi.clip(None, len(x) - 1)] - x0,
+                       numpy.inf)
+    hwhm = numpy.minimum(hwlo, hwhi)
+    # fall back to a couple of grid steps for peaks without crossing
+    dxmean = (x[-1] - x[0]) / max(1, len(x) - 1)
+    hwhm[~numpy.isfinite(hwhm)] = 2 * dxmean
+    sig = hwhm / sqrt(2 * log(2))
+    A = peakValue * sqrt(2 * pi) * sig
+    return (A, sig, x0)
+
+
+def load_ipython_extension(ip):
+    ip.user_ns['MultiGaussianFit'] = MultiGaussianFit
+    ip.user_ns['findPeaks'] = findPeaks
+    return
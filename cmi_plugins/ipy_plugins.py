@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""IPython extension that registers all cmi_plugins with lazy imports.
+
+Usage in IPython shell:
+
+    %load_ext cmi_plugins.ipy_plugins
+
+This finds every ipy_* extension module in the cmi_plugins directory and
+adds the names it would define, e.g., GaussianFit or fitGaussian, to the
+user namespace without importing the plugin.  Each name is bound to
+a LazyPlugin proxy that imports the plugin module on its first use and
+then replaces itself in the namespace with the actual object.  Heavy
+dependencies such as diffpy.srfit are thus loaded only when needed,
+which keeps IPython startup fast when the extension is loaded every time.
+
+The plugin names are obtained from the source code of each module,
+they are the keys assigned to ip.user_ns in its load_ipython_extension
+function.
+"""
+
+import os
+import ast
+
+
+class LazyPlugin(object):
+    '''Proxy for an object defined in a plugin module.
+
+    The plugin module is imported on the first call or public attribute
+    access.
+
+    modulename -- full name of the plugin module
+    name       -- name of the proxied object in the plugin namespace
+    namespace  -- optional dictionary, where the proxy should be replaced
+                  with the actual object once it is imported
+    '''
+
+    def __init__(self, modulename, name, namespace=None):
+        self.__dict__.update(modulename=modulename, name=name,
+                             namespace=namespace, _target=None)
+        return
+
+
+    def resolve(self):
+        '''Import the plugin module and return the proxied object.
+        '''
+        if self._target is None:
+            import importlib
+            module = importlib.import_module(self.modulename)
+            target = self._getPluginNamespace(module)[self.name]
+            self.__dict__['_target'] = target
+            ns = self.namespace
+            if ns is not None and ns.get(self.name) is self:
+                ns[self.name] = target
+        return self._target
+
+
+    def _getPluginNamespace(self, module):
+        '''Collect names the plugin module defines in IPython namespace.
+        '''
+        class _Shell(object):
+            user_ns = {}
+        shell = _Shell()
+        module.load_ipython_extension(shell)
+        return shell.user_ns
+
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+
+    def __getattr__(self, name):
+        # do not import the plugin for IPython display and other probes
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.resolve(), name)
+
+
+    def __setattr__(self, name, value):
+        setattr(self.resolve(), name, value)
+        return
+
+
+    def __repr__(self):
+        rv = "<LazyPlugin %s from %s>" % (self.name, self.modulename)
+        return rv
+
+# end of class LazyPlugin
+
+
+def findPlugins(package='cmi_plugins', exclude=('ipy_plugins',)):
+    '''Find IPython extension modules and the names they register.
+
+    package -- name of the plugins package to be searched
+    exclude -- module names that should be skipped
+
+    The modules are not imported, their source files are parsed to find
+    all ip.user_ns[name] assignments in load_ipython_extension.
+
+    Return a dictionary that maps registered names to full module names.
+    '''
+    import importlib
+    import pkgutil
+    pkgdir = os.path.dirname(importlib.import_module(package).__file__)
+    rv = {}
+    for finder, modname, ispkg in pkgutil.iter_modules([pkgdir]):
+        if ispkg or not modname.startswith('ipy_') or modname in exclude:
+            continue
+        filename = os.path.join(pkgdir, modname + '.py')
+        if not os.path.isfile(filename):
+            continue
+        fullname = package + '.' + modname
+        for name in _extensionNames(filename):
+            rv[name] = fullname
+    return rv
+
+
+def _extensionNames(filename):
+    '''Return names assigned to ip.user_ns in load_ipython_extension.
+    '''
+    with open(filename) as fp:
+        tree = ast.parse(fp.read(), filename)
+    names = []
+    for node in tree.body:
+        if not (isinstance(node, ast.FunctionDef) and
+                node.name == 'load_ipython_extension'):
+            continue
+        for n in ast.walk(node):
+            if not isinstance(n, ast.Assign):
+                continue
+            for t in n.targets:
+                if not (isinstance(t, ast.Subscript) and
+                        isinstance(t.value, ast.Attribute) and
+                        t.value.attr == 'user_ns'):
+                    continue
+                key = t.slice
+                # Python < 3.9 wraps the subscript in ast.Index
+                key = getattr(key, 'value', key)
+                key = getattr(key, 's', key)
+                if isinstance(key, ast.Constant):
+                    key = key.value
+                if isinstance(key, str):
+                    names.append(key)
+    return names
+
+
+def load_ipython_extension(ip):
+    ns = ip.user_ns
+    for name, modulename in findPlugins().items():
+        ns[name] = LazyPlugin(modulename, name, namespace=ns)
+    return
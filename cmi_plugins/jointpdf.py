@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""PDF generators that share the pair list of a phase in joint fits.
+
+In a joint refinement of X-ray and neutron data every PDFContribution
+has its own PDFGenerator, which enumerates the atom pairs of the common
+phase and evaluates all their peaks on its own.  SharedPairsPDFGenerator
+obtains the pairs from a SharedPairList, which rebuilds the PairList only
+when the atom positions or lattice change and refreshes the site
+displacements when only those change.  The pairs are grouped to shells
+of equal distance and displacement, which are shared as well.  Each
+generator then only applies its radiation-specific weights, peak width
+corrections, qmax termination and envelopes.
+
+Usage for the fitNiPDF data:
+
+from cmi_plugins.jointpdf import SharedPairList, addSharedPhase
+pairs = SharedPairList()
+xrayPDF = PDFContribution("xray")
+xrayPDF.loadData("ni-q27r60-xray.gr")
+xrayPDF.setCalculationRange(xmin=1, xmax=20, dx=0.01)
+phase = addSharedPhase(xrayPDF, "nickel", niStructure, pairs)
+neutronPDF = PDFContribution("neutron")
+neutronPDF.loadData("ni-q27r100-neutron.gr")
+neutronPDF.setCalculationRange(xmin=1, xmax=20, dx=0.01)
+addSharedPhase(neutronPDF, "nickel", phase, pairs)
+"""
+
+import numpy
+from diffpy.srfit.pdf.basepdfgenerator import BasePDFGenerator
+from diffpy.srfit.pdf.pdfgenerator import PDFGenerator
+
+from cmi_plugins.pairlist import PairList
+
+
+class SharedPairList(object):
+    '''Pair list of a structure shared by several PDF calculators.
+
+    counts   -- dictionary with the number of calls that were "build",
+                "update" for changed site properties or "reuse"
+    '''
+
+    def __init__(self):
+        self.counts = dict(build=0, update=0, reuse=0)
+        self._pairs = None
+        self._geometry = None
+        self._sites = None
+        return
+
+
+    def pairs(self, stru, rmax):
+        '''Return PairList for the current state of the structure.
+
+        stru -- structure object supported by srreal
+        rmax -- minimum pair distance in the returned PairList
+
+        Return PairList, which may be shared with other callers.
+        '''
+        from diffpy.srreal.structureadapter import createStructureAdapter
+        adpt = createStructureAdapter(stru)
+        geometry = _geometryKey(stru, adpt)
+        sites = _sitesKey(adpt)
+        if (self._pairs is None or geometry != self._geometry or
+                self._pairs.rmax < rmax):
+            rmax = max(rmax, self._pairs.rmax if self._pairs else 0)
+            self._pairs = PairList(stru, rmax)
+            self.counts['build'] += 1
+        elif sites != self._sites:
+            self._pairs.updateSites(stru)
+            self.counts['update'] += 1
+        else:
+            self.counts['reuse'] += 1
+        self._geometry = geometry
+        self._sites = sites
+        return self._pairs
+
+
+    def clear(self):
+        '''Forget the cached pair list.
+        '''
+        self._pairs = None
+        self._geometry = None
+        self._sites = None
+        return
+
+# end of class SharedPairList
+
+
+class SharedPairsPDFCalculator(object):
+    '''PDF calculator that evaluates peaks from a SharedPairList.
+
+    The attributes follow the PDFCalculator, so this can be used as
+    a calculator in the srfit PDF generators.
+
+    pairsource  -- SharedPairList that provides the pairs
+    qmin, qmax  -- Q-range for the termination of the PDF peaks
+    rmin, rmax, rstep -- r-grid of the calculated PDF
+    scale       -- scale factor of the PDF
+    qdamp       -- Gaussian damping of the PDF due to Q-resolution
+    delta1, delta2 -- coefficients of the 1/r and 1/r**2 sharpening
+                   of the correlated motion
+    qbroad      -- peak broadening due to Q-resolution
+    anisotropy  -- use anisotropic displacements of the sites
+    nsigma      -- peaks are evaluated within nsigma standard deviations
+    '''
+
+    def __init__(self, pairsource=None, **kwargs):
+        self.pairsource = pairsource
+        if pairsource is None:
+            self.pairsource = SharedPairList()
+        self.qmin = 0.0
+        self.qmax = 100.0
+        self.rmin = 0.0
+        self.rmax = 10.0
+        self.rstep = 0.01
+        self.scale = 1.0
+        self.qdamp = 0.0
+        self.delta1 = 0.0
+        self.delta2 = 0.0
+        self.qbroad = 0.0
+        self.anisotropy = True
+        self.nsigma = 5
+        self._sfttype = 'X'
+        self._sft = None
+        for n, v in kwargs.items():
+            if not hasattr(self, n):
+                emsg = "Invalid keyword argument %r." % n
+                raise TypeError(emsg)
+            setattr(self, n, v)
+        return
+
+    # Properties
+
+    @property
+    def rgrid(self):
+        "Numpy array of r-points where the PDF is calculated."
+        i0 = int(numpy.ceil(self.rmin / self.rstep))
+        i1 = int(numpy.ceil(self.rmax / self.rstep))
+        return self.rstep * numpy.arange(max(0, i0), i1)
+
+    @property
+    def scatteringfactortable(self):
+        "ScatteringFactorTable of the current radiation type."
+        if self._sft is None:
+            from diffpy.srreal.scatteringfactortable import \
+                    ScatteringFactorTable
+            self._sft = ScatteringFactorTable.createByType(self._sfttype)
+        return self._sft
+
+    # Methods compatible with PDFCalculator
+
+    def setScatteringFactorTableByType(self, tp):
+        '''Use scattering factor table of the specified type.
+
+        tp   -- registered type of the srreal ScatteringFactorTable,
+                e.g., "X" or "N"
+        '''
+        from diffpy.srreal.scatteringfactortable import ScatteringFactorTable
+        self._sft = ScatteringFactorTable.createByType(tp)
+        self._sfttype = tp
+        return
+
+
+    def getRadiationType(self):
+        '''Return radiation type of the scattering factor table.
+        '''
+        return self.scatteringfactortable.radiationType()
+
+
+    def __call__(self, stru):
+        '''Calculate PDF for the current state of a structure.
+
+        Return a tuple of (r, G) numpy arrays.
+        '''
+        # the first guess of rmax assumes typical peak widths
+        rmax = self.rmax + 10 * 2 * numpy.pi / self.qmax + 2.0
+        pairs = self.pairsource.pairs(stru, rmax)
+        rneed = pairs.requiredRmax(self, self.anisotropy, self.nsigma)
+        if rneed > pairs.rmax:
+            pairs = self.pairsource.pairs(stru, rneed + 1.0)
+        return pairs.pdf(self, self.anisotropy, self.nsigma)
+
+# end of class SharedPairsPDFCalculator
+
+
+class SharedPairsPDFGenerator(PDFGenerator):
+    '''PDFGenerator that uses SharedPairsPDFCalculator.
+
+    pairsource -- SharedPairList of the phase shared with other
+                  generators
+    '''
+
+    def __init__(self, name="pdf", pairsource=None):
+        BasePDFGenerator.__init__(self, name)
+        self._setCalculator(SharedPairsPDFCalculator(pairsource))
+        return
+
+# end of class SharedPairsPDFGenerator
+
+
+def addSharedPhase(contribution, name, phase, pairsource):
+    '''Add periodic phase to PDFContribution with a shared pair list.
+
+    contribution -- PDFContribution of one dataset
+    name         -- name of the new PDF generator in the contribution
+    phase        -- structure object or the phase ParameterSet returned
+                    by addSharedPhase for another contribution
+    pairsource   -- SharedPairList used for all contributions of the phase
+
+    This is an alternative to contribution.addStructure(name, stru) or
+    contribution.addPhase(name, phase).
+
+    Return the phase ParameterSet.
+    '''
+    gen = SharedPairsPDFGenerator(name, pairsource)
+    if hasattr(phase, '_getSrRealStructure'):
+        gen.setPhase(phase)
+    else:
+        gen.setStructure(phase, "phase")
+    contribution._setupGenerator(gen)
+    return gen.phase
+
+# Helpers --------------------------------------------------------------------
+
+def _geometryKey(stru, adpt):
+    '''Return bytes that identify atom types, positions and lattice.
+    '''
+    n = adpt.countSites()
+    xyz = numpy.array([adpt.siteCartesianPosition(i) for i in range(n)],
+                      dtype=float)
+    types = '\0'.join(adpt.siteAtomType(i) for i in range(n))
+    lattice = getattr(stru, 'lattice', None)
+    abcabg = ()
+    if lattice is not None and hasattr(lattice, 'abcABG'):
+        abcabg = tuple(lattice.abcABG())
+    return (types, xyz.tobytes(), abcabg)
+
+
+def _sitesKey(adpt):
+    '''Return bytes that identify occupancies and displacements.
+    '''
+    n = adpt.countSites()
+    occ = numpy.array([adpt.siteOccupancy(i) for i in range(n)], dtype=float)
+    uij = numpy.array([adpt.siteCartesianUij(i) for i in range(n)],
+                      dtype=float)
+    return occ.tobytes() + uij.tobytes()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""Coarse-to-fine refinement of a FitRecipe on growing calculation grids.
+
+Usage for the fitNi.py recipe with a target range 1-20 A and dx=0.01:
+
+from cmi_plugins.multires import multiresolutionFit
+stages = [dict(xmax=10, dx=0.05, ftol=1e-4),
+          dict(dx=0.02, ftol=1e-6)]
+res = multiresolutionFit(niFit, stages)
+print(res.table())
+
+Every stage sets the calculation range of all contributions and refines
+the recipe from the values of the previous stage.  Stage keys xmin, xmax
+and dx are passed to setCalculationRange, missing keys keep the target
+range.  Other keys are leastsq options, such as ftol, xtol or maxfev,
+which are the convergence criteria of the stage.  The final stage always
+refines on the calculation points the recipe had before the call.
+"""
+
+import numpy
+
+# Keys of a stage dictionary that define the calculation range.
+_RANGEKEYS = ('xmin', 'xmax', 'dx')
+
+
+class MultiresolutionResults(object):
+    '''Optima of the stages of a coarse-to-fine refinement.
+
+    Array attributes have one item or row per stage, the last one is
+    the refinement on the target grid.
+
+    names     -- list of the refined variable names
+    stages    -- list of the stage dictionaries including the final one
+    values    -- 2D array of the values refined in each stage
+    chi2      -- sum of squared residuals at the end of each stage
+    nfev      -- number of residual evaluations in each stage
+    npoints   -- total number of calculation points in each stage
+    converged -- True for stages where leastsq reported success
+    '''
+
+    def __init__(self, names, stages):
+        self.names = list(names)
+        self.stages = [dict(s) for s in stages]
+        n = len(self.stages)
+        self.values = numpy.nan * numpy.ones((n, len(self.names)))
+        self.chi2 = numpy.nan * numpy.ones(n)
+        self.nfev = numpy.zeros(n, dtype=int)
+        self.npoints = numpy.zeros(n, dtype=int)
+        self.converged = numpy.zeros(n, dtype=bool)
+        return
+
+
+    def __len__(self):
+        return len(self.stages)
+
+
+    @property
+    def cost(self):
+        "Number of calculated points summed over all residual evaluations."
+        return int(numpy.sum(self.nfev * self.npoints))
+
+
+    def table(self):
+        '''Return table of the stage optima as a string.
+        '''
+        lines = []
+        header = ['stage', 'npoints', 'nfev', 'chi2', 'conv'] + self.names
+        lines.append(' '.join('%12s' % h for h in header))
+        for i in range(len(self)):
+            row = ['%12i' % i, '%12i' % self.npoints[i],
+                   '%12i' % self.nfev[i], '%12.6g' % self.chi2[i],
+                   '%12s' % self.converged[i]]
+            row += ['%12.6g' % v for v in self.values[i]]
+            lines.append(' '.join(row))
+        return '\n'.join(lines)
+
+# end of class MultiresolutionResults
+
+
+def multiresolutionFit(recipe, stages=None, **kwargs):
+    '''Refine FitRecipe on coarse calculation grids before the target.
+
+    recipe  -- FitRecipe with the free variables to be refined.  The
+               current calculation points of its contributions are
+               the target grid.
+    stages  -- list of dictionaries for the coarse stages with optional
+               xmin, xmax and dx range keys and leastsq options.
+               When None, use defaultStages(recipe).
+    kwargs  -- leastsq options for the final stage on the target grid
+
+    When a Dfun with a sync method is passed, such as ParallelJacobian,
+    it is synchronized after every change of the calculation range.
+    The calculation points are restored when the refinement fails.
+
+    Return MultiresolutionResults.
+    '''
+    from scipy.optimize import leastsq
+    if stages is None:
+        stages = defaultStages(recipe)
+    stages = list(stages) + [kwargs]
+    res = MultiresolutionResults(recipe.getNames(), stages)
+    contributions = list(recipe._contributions.values())
+    targets = [numpy.array(con.profile.x, dtype=float)
+               for con in contributions]
+    try:
+        for i, stage in enumerate(stages):
+            options = dict(stage)
+            rng = dict((k, options.pop(k)) for k in _RANGEKEYS
+                       if k in options)
+            for con, x in zip(contributions, targets):
+                con.profile.setCalculationPoints(x)
+                if rng:
+                    con.profile.setCalculationRange(**rng)
+            Dfun = options.get('Dfun')
+            if hasattr(Dfun, 'sync'):
+                Dfun.sync()
+            rv = leastsq(recipe.residual, recipe.getValues(),
+                         full_output=True, **options)
+            values = numpy.atleast_1d(rv[0])
+            res.values[i] = values
+            res.chi2[i] = numpy.sum(recipe.residual(values)**2)
+            res.nfev[i] = rv[2]['nfev']
+            res.npoints[i] = sum(len(con.profile.x) for con in contributions)
+            res.converged[i] = rv[4] in (1, 2, 3, 4)
+    finally:
+        for con, x in zip(contributions, targets):
+            con.profile.setCalculationPoints(x)
+    return res
+
+
+def defaultStages(recipe, nstages=2, factor=2.0, ftol=1e-4):
+    '''Return coarse stages for the target grid of a recipe.
+
+    recipe  -- FitRecipe with the target calculation points
+    nstages -- number of coarse stages
+    factor  -- ratio of the r-steps of subsequent stages.  The first
+               stage covers also only the first half of the target range.
+    ftol    -- relative tolerance of chi2 for the coarse stages
+
+    The coarse stages of contributions with different grids use the
+    r-step and range of the first contribution.
+
+    Return a list of stage dictionaries.
+    '''
+    con = list(recipe._contributions.values())[0]
+    x = con.profile.x
+    dx = float(x[-1] - x[0]) / max(1, len(x) - 1)
+    stages = []
+    for k in range(nstages, 0, -1):
+        stages.append(dict(dx=dx * factor**k, ftol=ftol))
+    stages[0]['xmax'] = 0.5 * float(x[0] + x[-1])
+    return stages
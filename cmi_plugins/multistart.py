@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""Multistart refinement of a FitRecipe in a pool of worker processes.
+
+Usage:
+
+from cmi_plugins.multistart import multistartFit
+res = multistartFit(niFit, 32, bounds={'a' : (3.4, 3.6)}, seed=0)
+print(res.table(10))
+
+The first refinement starts from the current values of the recipe, the
+other ones from values drawn uniformly within the bounds.  Every worker
+refines its own copy of the recipe with leastsq.  The refinements are
+ranked by their final chi2 and the recipe is set to the best optimum.
+"""
+
+import numpy
+
+
+class MultistartResults(object):
+    '''Optima of the refinements started from different values.
+
+    Array attributes have one item or row per refinement in the order
+    of the starting points.
+
+    names     -- list of the refined variable names
+    starts    -- 2D array of the starting values
+    values    -- 2D array of the refined values
+    chi2      -- final sum of squared residuals, NaN for failed fits
+    nfev      -- number of residual evaluations
+    converged -- True for fits where leastsq reported success
+    failures  -- dictionary of error messages for refinements that
+                 raised an exception, the keys are refinement indices.
+    '''
+
+    def __init__(self, names, starts):
+        self.names = list(names)
+        self.starts = numpy.array(starts, dtype=float)
+        n = len(self.starts)
+        self.values = numpy.nan * numpy.ones_like(self.starts)
+        self.chi2 = numpy.nan * numpy.ones(n)
+        self.nfev = numpy.zeros(n, dtype=int)
+        self.converged = numpy.zeros(n, dtype=bool)
+        self.failures = {}
+        return
+
+
+    def __len__(self):
+        return len(self.starts)
+
+
+    @property
+    def ranking(self):
+        "Indices of the refinements sorted by chi2, failed fits last."
+        chi2 = numpy.where(numpy.isnan(self.chi2), numpy.inf, self.chi2)
+        return numpy.argsort(chi2, kind='stable')
+
+
+    @property
+    def best(self):
+        "Dictionary of the variable values with the lowest chi2."
+        return dict(zip(self.names, self.values[self.ranking[0]].tolist()))
+
+
+    def table(self, n=None):
+        '''Return ranked table of the optima as a string.
+
+        n    -- number of the best optima in the table, all when None.
+        '''
+        lines = []
+        header = ['rank', 'start', 'chi2', 'conv'] + self.names
+        lines.append(' '.join('%12s' % h for h in header))
+        for rank, i in enumerate(self.ranking[:n], 1):
+            row = ['%12i' % rank, '%12i' % i, '%12.6g' % self.chi2[i],
+                   '%12s' % self.converged[i]]
+            row += ['%12.6g' % v for v in self.values[i]]
+            lines.append(' '.join(row))
+        return '\n'.join(lines)
+
+# end of class MultistartResults
+
+
+def multistartFit(recipe, nstarts, bounds=None, spread=0.2, seed=None,
+                  workers=None, chunksize=1, progress=None, **kwargs):
+    '''Refine FitRecipe from many starting points in parallel.
+
+    recipe  -- FitRecipe with the free variables to be refined
+    nstarts -- total number of refinements
+    bounds  -- optional dictionary of (lower, upper) sampling bounds
+               for the variable names.  Other variables are sampled
+               within their recipe bounds if they are finite, otherwise
+               within the relative spread around their current values.
+    spread  -- relative range of the values sampled around the current
+               values.  Variables with zero value are sampled within
+               plus or minus spread.
+    seed    -- seed of the random number generator for the starts
+    workers -- number of worker processes.  Use all CPUs when None.
+               With workers=1 the refinements run in the calling process.
+    chunksize -- number of refinements sent to a worker at a time
+    progress -- optional function called as progress(ndone, ntotal)
+               after each finished refinement.
+    kwargs  -- extra keyword arguments for scipy.optimize.leastsq,
+               e.g., maxfev
+
+    Each worker refines its own deep copy of the recipe.  Failed fits do
+    not abort the run, they are reported in the failures attribute of the
+    returned results.  When done, the recipe is set to the best optimum.
+
+    Return MultistartResults.
+    '''
+    from cmi_plugins.workerpool import WorkerPool
+    names = recipe.getNames()
+    starts = _sampleStarts(recipe, nstarts, bounds or {}, spread, seed)
+    res = MultistartResults(names, starts)
+    tasks = ((i, starts[i]) for i in range(len(starts)))
+    pool = WorkerPool(_makeMultistartState, _multistartTask,
+                      (recipe, kwargs), workers)
+    results = pool.imap_unordered(tasks, chunksize)
+    try:
+        for ndone, rv in enumerate(results, 1):
+            i, values, chi2, nfev, converged, emsg = rv
+            res.values[i] = values
+            res.chi2[i] = chi2
+            res.nfev[i] = nfev
+            res.converged[i] = converged
+            if emsg is not None:
+                res.failures[i] = emsg
+            if progress is not None:
+                progress(ndone, len(res))
+    finally:
+        pool.close()
+    ibest = res.ranking[0]
+    if not numpy.isnan(res.chi2[ibest]):
+        recipe.residual(res.values[ibest])
+    return res
+
+# Helpers --------------------------------------------------------------------
+
+def _sampleStarts(recipe, nstarts, bounds, spread, seed):
+    '''Return 2D array of starting values, the first row are the current.
+    '''
+    names = recipe.getNames()
+    unknown = set(bounds).difference(names)
+    if unknown:
+        emsg = "Unknown variables %s." % ', '.join(sorted(unknown))
+        raise ValueError(emsg)
+    x0 = numpy.array(recipe.getValues(), dtype=float)
+    lo = x0 - spread * numpy.where(x0 == 0, 1.0, numpy.fabs(x0))
+    hi = x0 + spread * numpy.where(x0 == 0, 1.0, numpy.fabs(x0))
+    for k, (n, rb) in enumerate(zip(names, recipe.getBounds())):
+        b = bounds.get(n, rb)
+        if numpy.all(numpy.isfinite(b)):
+            lo[k], hi[k] = b
+    rng = numpy.random.RandomState(seed)
+    starts = lo + (hi - lo) * rng.random_sample((nstarts, len(x0)))
+    starts[:1] = x0
+    return starts[:nstarts]
+
+
+def _makeMultistartState(recipe, kwargs):
+    '''Return worker state for multistartFit as a dictionary.
+    '''
+    import copy
+    replica = copy.deepcopy(recipe)
+    # fit hooks of the copies would report the evaluations of every start
+    replica.clearFitHooks()
+    return dict(recipe=replica, kwargs=kwargs)
+
+
+def _multistartTask(state, task):
+    '''Refine the worker recipe from one starting point.
+
+    state -- worker state from _makeMultistartState
+    task  -- tuple of (index, starting values)
+
+    Return a tuple of (index, values, chi2, nfev, converged, emsg),
+    where emsg is None for successful refinements.
+    '''
+    from scipy.optimize import leastsq
+    i, x0 = task
+    recipe = state['recipe']
+    nans = numpy.nan * numpy.ones_like(x0)
+    try:
+        rv = leastsq(recipe.residual, x0, full_output=True,
+                     **state['kwargs'])
+        values = numpy.atleast_1d(rv[0])
+        chi2 = float(numpy.sum(recipe.residual(values)**2))
+        nfev = rv[2]['nfev']
+        converged = rv[4] in (1, 2, 3, 4)
+    except Exception as e:
+        emsg = "%s: %s" % (type(e).__name__, e)
+        return (i, nans, numpy.nan, 0, False, emsg)
+    return (i, values, chi2, nfev, converged, None)
@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""Pair list that is shared by several PDF and BVS calculator setups.
+
+Every srreal calculator enumerates the atom pairs of the structure on its
+own.  When the same structure is evaluated with several settings, e.g.,
+with different scattering factors, peak widths or bond valence parameters,
+the pair enumeration is repeated for each of them.  PairList finds the
+pairs once up to a given distance and keeps the site properties, so that
+other settings need only a new weighting of the stored pairs:
+
+from cmi_plugins.pairlist import PairList
+pairs = PairList(cds, rmax=30)
+r1, g1 = pairs.pdf(pc1)
+r2, g2 = pairs.pdf(pc1, anisotropy=False)
+vsim = pairs.bvs(bvsc)
+"""
+
+import re
+import numpy
+
+from cmi_plugins.pdfpeaks import (collectPairs, rippleExtension,
+                                  terminatePDF, sumPeaks)
+
+
+class PairList(object):
+    '''Atom pairs of a structure up to the maximum distance.
+
+    stru     -- structure object supported by srreal
+    rmax     -- maximum pair distance
+
+    Attributes:
+
+    sites0, sites1 -- site indices of the pair atoms
+    distances  -- pair distances
+    directions -- unit vectors from the site0 to the site1 atom
+    atomtypes  -- list of atom types of the sites
+    occupancies, multiplicities -- arrays of the site properties
+    uij        -- array of Cartesian displacement tensors of the sites
+    numberdensity -- number density of the periodic structure or zero
+
+    Every pair of sites is listed in both directions like in the srreal
+    BondCalculator.  For structures with symmetry-equivalent sites, i.e.,
+    sites with multiplicity larger than one, the displacement tensors
+    of the partner atoms are rotated by the symmetry operations and
+    are kept for every pair.
+    '''
+
+    def __init__(self, stru, rmax):
+        self.rmax = float(rmax)
+        self.uij = None
+        self._uijsum = None
+        self.updateSites(stru)
+        self._readPairs(stru)
+        return
+
+
+    def updateSites(self, stru):
+        '''Read atom types, occupancies and displacements of the sites.
+
+        stru -- structure with the same atom positions and lattice
+                as the one used for the pair list.
+
+        This is cheaper than a new PairList when only the site
+        properties have changed.  Structures with symmetry-equivalent
+        sites need to enumerate the pairs again for new displacement
+        tensors, because they are rotated for every pair.
+        '''
+        from diffpy.srreal.structureadapter import createStructureAdapter
+        adpt = createStructureAdapter(stru)
+        n = adpt.countSites()
+        uijold = self.uij
+        self.atomtypes = [adpt.siteAtomType(i) for i in range(n)]
+        self.occupancies = numpy.array(
+            [adpt.siteOccupancy(i) for i in range(n)], dtype=float)
+        self.multiplicities = numpy.array(
+            [adpt.siteMultiplicity(i) for i in range(n)], dtype=float)
+        self.uij = numpy.array(
+            [adpt.siteCartesianUij(i) for i in range(n)], dtype=float)
+        self.uij = self.uij.reshape(n, 3, 3)
+        self.numberdensity = adpt.numberDensity()
+        self._shells = {}
+        if (uijold is not None and self._uijsum is not None and
+                not numpy.array_equal(uijold, self.uij)):
+            self._readPairs(stru)
+        return
+
+
+    def __len__(self):
+        return len(self.distances)
+
+
+    def _readPairs(self, stru):
+        '''Enumerate the pairs in both directions.
+        '''
+        pairs = collectPairs(stru, self.rmax)
+        rev = pairs.sumscale > 1
+        self.sites0 = numpy.concatenate([pairs.sites0, pairs.sites1[rev]])
+        self.sites1 = numpy.concatenate([pairs.sites1, pairs.sites0[rev]])
+        self.distances = numpy.concatenate([pairs.distances,
+                                            pairs.distances[rev]])
+        self.directions = numpy.concatenate([pairs.directions,
+                                             -pairs.directions[rev]])
+        self._uijsum = None
+        if numpy.any(self.multiplicities > 1):
+            self._uijsum = numpy.concatenate([pairs.uijsum,
+                                              pairs.uijsum[rev]])
+        self._shells = {}
+        return
+
+    # PDF
+
+    def msd(self, anisotropy=True):
+        '''Return mean square displacements along the pair directions.
+
+        anisotropy -- when False, use the isotropic equivalent of
+                      the site displacement tensors
+        '''
+        uij = self.uij
+        if not anisotropy:
+            uiso = numpy.trace(uij, axis1=1, axis2=2) / 3.0
+            return uiso[self.sites0] + uiso[self.sites1]
+        u = self.directions
+        if self._uijsum is not None:
+            return numpy.einsum('ki,kij,kj->k', u, self._uijsum, u)
+        rv = (numpy.einsum('ki,kij,kj->k', u, uij[self.sites0], u) +
+              numpy.einsum('ki,kij,kj->k', u, uij[self.sites1], u))
+        return rv
+
+
+    def shells(self, anisotropy=True):
+        '''Return pairs grouped to shells of the same distance and msd.
+
+        anisotropy -- use anisotropic displacements of the sites,
+                      see the msd method
+
+        Pairs of the same atom types with equal distance and mean square
+        displacement give the same PDF peak.  In crystals there are
+        many of them, so the peaks are evaluated much faster per shell.
+
+        Return a tuple of (atomtypes, c0, c1, d, msd, w), where atomtypes
+        are the sorted unique types, c0, c1 their indices for every shell,
+        d and msd the shell distance and mean square displacement and w
+        the sum of mult0 * occ0 * occ1 over the shell pairs.
+        '''
+        anisotropy = bool(anisotropy)
+        if anisotropy in self._shells:
+            return self._shells[anisotropy]
+        tnames, tcode = numpy.unique(self.atomtypes, return_inverse=True)
+        tcode = tcode.ravel()
+        i0, i1 = self.sites0, self.sites1
+        msd = self.msd(anisotropy)
+        w = self.multiplicities[i0] * self.occupancies[i0] * \
+            self.occupancies[i1]
+        key = numpy.column_stack((tcode[i0], tcode[i1],
+                                  numpy.round(self.distances, 8),
+                                  numpy.round(msd, 10)))
+        ukey, inv = numpy.unique(key, axis=0, return_inverse=True)
+        inv = inv.ravel()
+        wsum = numpy.bincount(inv, weights=w, minlength=len(ukey))
+        dsum = numpy.bincount(inv, weights=self.distances,
+                              minlength=len(ukey))
+        msum = numpy.bincount(inv, weights=msd, minlength=len(ukey))
+        cnt = numpy.bincount(inv, minlength=len(ukey))
+        rv = (list(tnames), ukey[:, 0].astype(int), ukey[:, 1].astype(int),
+              dsum / cnt, msum / cnt, wsum)
+        self._shells[anisotropy] = rv
+        return rv
+
+
+    def requiredRmax(self, pc, anisotropy=True, nsigma=5):
+        '''Return pair distance needed for the PDF with pc settings.
+
+        pc, anisotropy, nsigma -- same as for the pdf method
+
+        This includes the ripple extension above the r-grid and
+        the width of the broadest peak.
+        '''
+        r = numpy.asarray(pc.rgrid, dtype=float)
+        if not len(r):
+            return 0.0
+        qmax = getattr(pc, 'qmax', numpy.inf)
+        rhi = r[-1] + rippleExtension(qmax, pc.rstep)
+        msdmax = 2 * numpy.trace(self.uij, axis1=1, axis2=2).max()
+        if not anisotropy:
+            msdmax /= 3.0
+        corrmax = 1.0 + (pc.qbroad * rhi)**2
+        return rhi + nsigma * numpy.sqrt(max(msdmax * corrmax, 0.0))
+
+
+    def pdf(self, pc, anisotropy=True, nsigma=5):
+        '''Calculate PDF with the settings of a PDFCalculator.
+
+        pc   -- PDFCalculator that provides the r-grid, scale, qdamp,
+                delta1, delta2, qbroad, qmin, qmax and the scattering
+                factor table
+        anisotropy -- use anisotropic displacements of the sites.
+                When False, use their isotropic equivalents, which is
+                the same as setting stru.anisotropy = False.
+        nsigma -- Gaussian peaks are evaluated within nsigma standard
+                deviations from the pair distance
+
+        The peaks use the Gaussian profile and the Jeong peak width
+        model of PDFCalculator.  The PDF is terminated at qmin and qmax
+        by a sine transformation over an r-grid extended by 10 ripple
+        periods.
+
+        Return a tuple of (r, G) numpy arrays.
+        '''
+        r = numpy.array(pc.rgrid, dtype=float)
+        if len(r) and self.requiredRmax(pc, anisotropy, nsigma) > self.rmax:
+            emsg = ("PairList rmax=%g is too small for PDF up to %g." %
+                    (self.rmax, r[-1]))
+            raise ValueError(emsg)
+        tnames, c0, c1, d, msd, w = self.shells(anisotropy)
+        corr = (1.0 - pc.delta1 / d - pc.delta2 / d**2 +
+                pc.qbroad**2 * d**2)
+        sigma = numpy.sqrt(msd * numpy.maximum(corr, 0.0))
+        sft = pc.scatteringfactortable
+        sftype = dict((t, sft.lookup(t)) for t in tnames)
+        sf = numpy.array([sftype[t] for t in self.atomtypes])
+        tsf = numpy.array([sftype[t] for t in tnames])
+        weight = w * tsf[c0] * tsf[c1]
+        occ = self.occupancies
+        mult = self.multiplicities
+        totocc = numpy.sum(mult * occ)
+        sfavg = numpy.sum(mult * occ * sf) / totocc
+        # evaluate peaks on a grid from zero with the ripple extension
+        qmax = getattr(pc, 'qmax', numpy.inf)
+        qmin = getattr(pc, 'qmin', 0.0)
+        dr = pc.rstep
+        terminate = len(r) and (qmax < numpy.pi / dr or qmin > 0)
+        rcalc = r
+        if terminate:
+            rext = rippleExtension(qmax, dr)
+            rcalc = dr * numpy.arange(int(numpy.ceil((r[-1] + rext) / dr)) + 1)
+        ok = sigma > 0
+        d, sigma, weight = d[ok], sigma[ok], weight[ok]
+        def gaussian(x, k):
+            s = sigma[k]
+            return numpy.exp(-0.5 * (x / s)**2) / numpy.sqrt(2 * numpy.pi) / s
+        rdf = sumPeaks(rcalc, d, -nsigma * sigma, nsigma * sigma, weight,
+                       gaussian)
+        rdf /= totocc * sfavg**2
+        g = numpy.zeros_like(rcalc)
+        rpos = rcalc > 0
+        g[rpos] = rdf[rpos] / rcalc[rpos]
+        g -= 4 * numpy.pi * self.numberdensity * rcalc
+        if terminate:
+            g = terminatePDF(g, dr, qmin, qmax)
+            g = numpy.interp(r, rcalc, g)
+        g *= pc.scale * numpy.exp(-0.5 * (pc.qdamp * r)**2)
+        return r, g
+
+    # Bond valence sums
+
+    def valences(self):
+        '''Return array of the site valences from the atom types.
+
+        Valences are parsed from the type suffix, e.g., "O2-" or "Na+".
+        Neutral atom types have zero valence.
+        '''
+        return numpy.array([_atomValence(t) for t in self.atomtypes])
+
+
+    def bvs(self, bvsc, bvmatrix=None):
+        '''Calculate bond valence sums with the settings of BVSCalculator.
+
+        bvsc -- BVSCalculator that provides the bond valence parameters
+                table, rmax and valenceprecision
+        bvmatrix -- optional BVParametersMatrix of the bvsc parameters
+                table, which can be reused for many structures.  When
+                None, a temporary matrix is created.
+
+        Return an array of the signed valence sums per site, which is
+        comparable with the BVSCalculator value.
+        '''
+        from cmi_plugins.bvparams import BVParametersMatrix
+        if bvmatrix is None:
+            bvmatrix = BVParametersMatrix(bvsc.bvparamtable)
+        idx = bvmatrix.indices(self.atomtypes)
+        t0 = idx[self.sites0]
+        t1 = idx[self.sites1]
+        # bonds weaker than valenceprecision are ignored
+        # like in the BVSCalculator
+        vprec = bvsc.valenceprecision
+        with numpy.errstate(invalid='ignore'):
+            dcutm = numpy.minimum(bvsc.rmax,
+                                  bvmatrix.Ro - bvmatrix.B * numpy.log(vprec))
+        dcutm[~bvmatrix.valid] = -1.0
+        dcut = dcutm[t0, t1]
+        if len(dcut) and dcut.max() > self.rmax:
+            k = numpy.argmax(dcut)
+            tt = (self.atomtypes[self.sites0[k]],
+                  self.atomtypes[self.sites1[k]])
+            emsg = ("PairList rmax=%g is smaller than BVS cutoff "
+                    "%g for %s-%s." % ((self.rmax, dcut[k]) + tt))
+            raise ValueError(emsg)
+        d = self.distances
+        use = d <= dcut
+        i0 = self.sites0[use]
+        i1 = self.sites1[use]
+        bv = numpy.exp((bvmatrix.Ro[t0[use], t1[use]] - d[use]) /
+                       bvmatrix.B[t0[use], t1[use]])
+        sign = numpy.sign(self.valences())
+        rv = numpy.bincount(i0, weights=sign[i0] * self.occupancies[i1] * bv,
+                            minlength=len(self.atomtypes))
+        return rv
+
+# end of class PairList
+
+# Helpers --------------------------------------------------------------------
+
+def _atomValence(atomtype):
+    '''Return valence from atom type string such as "Na+" or "O2-".
+    '''
+    mx = re.search(r'(\d*)([+-])$', atomtype)
+    if not mx:
+        return 0
+    n = int(mx.group(1) or 1)
+    return n if mx.group(2) == '+' else -n
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""On-disk cache of PDFs simulated by the srreal calculators.
+
+Usage:
+
+from cmi_plugins.pdfcache import PDFCache
+cache = PDFCache()
+dpc = DebyePDFCalculator(qmax=20, rmax=20)
+r3, g3 = cache(dpc, c60, qmin=0)
+r4, g4 = cache(dpc, c60, qmin=1)
+
+The cached results are identified by a SHA1 hash of the structure
+contents and of the calculator configuration, i.e., its class, all
+its numerical attributes such as qmin, qmax or rmax, the peak profile,
+peak width model, baseline and envelopes and the scattering factors of
+the atom types in the structure.  The r and G arrays are stored in numpy
+binary files in the cache directory.  When the total size of the cache
+exceeds its limit, the least recently used files are removed.
+"""
+
+import os
+import hashlib
+import numpy
+
+# Version of the key and file format.  Change when incompatible.
+_CACHE_FORMAT = 'pdfcache-1'
+
+
+class PDFCache(object):
+    '''Size-bounded on-disk cache of the (r, G) PDF curves.
+
+    cachedir -- directory for the cached files.  When not specified, use
+                the CMI_PDFCACHE environment variable or ~/.cache/cmi_pdfcache
+    maxsize  -- maximum total size of the cached files in bytes
+    hits     -- number of calculations loaded from the cache
+    misses   -- number of calculations that had to be done
+    '''
+
+    def __init__(self, cachedir=None, maxsize=256 * 2**20):
+        if cachedir is None:
+            cachedir = os.environ.get('CMI_PDFCACHE',
+                    os.path.join('~', '.cache', 'cmi_pdfcache'))
+        self.cachedir = os.path.abspath(os.path.expanduser(cachedir))
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        return
+
+
+    def __call__(self, calc, stru, **kwargs):
+        '''Return PDF of the structure from the cache or calculate it.
+
+        calc     -- PDFCalculator or DebyePDFCalculator object
+        stru     -- structure object supported by the srreal calculators
+        kwargs   -- calculator attributes to be set before the calculation,
+                    same as in the calculator call
+
+        Return a tuple of (r, G) numpy arrays.
+        '''
+        for n, v in kwargs.items():
+            setattr(calc, n, v)
+        key = self.hashKey(calc, stru)
+        rv = self.load(key)
+        if rv is not None:
+            self.hits += 1
+            return rv
+        self.misses += 1
+        r, g = calc(stru)
+        self.save(key, r, g)
+        return r, g
+
+
+    def hashKey(self, calc, stru):
+        '''Return hash string for the calculator and structure.
+        '''
+        h = hashlib.sha1()
+        _hashUpdate(h, _CACHE_FORMAT)
+        _hashStructure(h, stru)
+        _hashCalculator(h, calc, stru)
+        return h.hexdigest()
+
+
+    def filename(self, key):
+        '''Return path to the cache file for the specified hash key.
+        '''
+        return os.path.join(self.cachedir, key + '.npy')
+
+
+    def load(self, key):
+        '''Load cached (r, G) arrays for the hash key.
+
+        Return None if the key is not in the cache.
+        '''
+        fname = self.filename(key)
+        try:
+            rg = numpy.load(fname)
+        except (IOError, OSError, ValueError):
+            return None
+        # mark as recently used
+        try:
+            os.utime(fname, None)
+        except OSError:
+            pass
+        return rg[0], rg[1]
+
+
+    def save(self, key, r, g):
+        '''Store (r, G) arrays for the hash key and evict old entries.
+        '''
+        if not os.path.isdir(self.cachedir):
+            os.makedirs(self.cachedir)
+        fname = self.filename(key)
+        tmpname = '%s.%i.tmp' % (fname, os.getpid())
+        rg = numpy.array([r, g], dtype=float)
+        with open(tmpname, 'wb') as fp:
+            numpy.save(fp, rg)
+        # atomic replacement so that parallel runs never see partial files
+        if hasattr(os, 'replace'):
+            os.replace(tmpname, fname)
+        else:
+            if os.path.exists(fname):
+                os.remove(fname)
+            os.rename(tmpname, fname)
+        self.evict()
+        return
+
+
+    def evict(self):
+        '''Remove least recently used files to fit in the maxsize.
+        '''
+        entries = self._cacheFiles()
+        total = sum(sz for mt, sz, f in entries)
+        for mt, sz, f in sorted(entries):
+            if total <= self.maxsize:
+                break
+            try:
+                os.remove(f)
+            except OSError:
+                continue
+            total -= sz
+        return
+
+
+    def clear(self):
+        '''Remove all cached files.
+        '''
+        for mt, sz, f in self._cacheFiles():
+            try:
+                os.remove(f)
+            except OSError:
+                pass
+        return
+
+
+    @property
+    def size(self):
+        "Total size of the cached files in bytes."
+        return sum(sz for mt, sz, f in self._cacheFiles())
+
+
+    def _cacheFiles(self):
+        '''Return a list of (mtime, size, path) tuples for the cached files.
+        '''
+        if not os.path.isdir(self.cachedir):
+            return []
+        rv = []
+        for n in os.listdir(self.cachedir):
+            if not n.endswith('.npy'):
+                continue
+            f = os.path.join(self.cachedir, n)
+            try:
+                st = os.stat(f)
+            except OSError:
+                continue
+            rv.append((st.st_mtime, st.st_size, f))
+        return rv
+
+# end of class PDFCache
+
+# Helpers --------------------------------------------------------------------
+
+def _hashUpdate(h, value):
+    '''Add string, number or numpy array to the hash object.
+    '''
+    if isinstance(value, numpy.ndarray):
+        h.update(str(value.dtype).encode())
+        h.update(str(value.shape).encode())
+        h.update(numpy.ascontiguousarray(value).tobytes())
+    else:
+        h.update(repr(value).encode())
+    h.update(b'\0')
+    return
+
+
+def _hashStructure(h, stru):
+    '''Add atom types, positions, displacements and lattice to the hash.
+    '''
+    from diffpy.srreal.structureadapter import createStructureAdapter
+    adpt = createStructureAdapter(stru)
+    _hashUpdate(h, type(adpt).__name__)
+    n = adpt.countSites()
+    _hashUpdate(h, n)
+    for i in range(n):
+        _hashUpdate(h, adpt.siteAtomType(i))
+        _hashUpdate(h, numpy.asarray(adpt.siteCartesianPosition(i), float))
+        _hashUpdate(h, numpy.asarray(adpt.siteCartesianUij(i), float))
+        _hashUpdate(h, adpt.siteAnisotropy(i))
+        _hashUpdate(h, adpt.siteOccupancy(i))
+        _hashUpdate(h, adpt.siteMultiplicity(i))
+    _hashUpdate(h, adpt.numberDensity())
+    lattice = getattr(stru, 'lattice', None)
+    if lattice is not None and hasattr(lattice, 'abcABG'):
+        _hashUpdate(h, lattice.abcABG())
+    return
+
+
+def _hashCalculator(h, calc, stru):
+    '''Add calculator class, attributes and used components to the hash.
+    '''
+    from diffpy.srreal.structureadapter import createStructureAdapter
+    _hashUpdate(h, type(calc).__name__)
+    _hashAttributes(h, calc)
+    for name in ('peakprofile', 'peakwidthmodel', 'baseline'):
+        obj = getattr(calc, name, None)
+        if obj is not None:
+            _hashUpdate(h, name)
+            _hashComponent(h, obj)
+    getenvs = getattr(calc, 'getEnvelopeTypes', None)
+    if getenvs is not None:
+        _hashUpdate(h, sorted(getenvs()))
+    # scattering factors of the atom types present in the structure
+    sft = getattr(calc, 'scatteringfactortable', None)
+    if sft is not None:
+        _hashComponent(h, sft)
+        adpt = createStructureAdapter(stru)
+        smbls = sorted(set(adpt.siteAtomType(i)
+                           for i in range(adpt.countSites())))
+        for smbl in smbls:
+            _hashUpdate(h, smbl)
+            _hashUpdate(h, sft.lookup(smbl))
+    return
+
+
+def _hashAttributes(h, obj):
+    '''Add all double attributes of srreal Attributes object to the hash.
+    '''
+    names = getattr(obj, '_namesOfDoubleAttributes', None)
+    if names is None:
+        return
+    for n in sorted(names()):
+        _hashUpdate(h, n)
+        _hashUpdate(h, obj._getDoubleAttr(n))
+    return
+
+
+def _hashComponent(h, obj):
+    '''Add type and state of a calculator component to the hash.
+
+    This handles the Python-defined components, such as peak profiles,
+    by hashing the numbers, strings and arrays in their instance dictionary.
+    '''
+    _hashUpdate(h, obj.type())
+    _hashAttributes(h, obj)
+    state = getattr(obj, '__dict__', {})
+    for n in sorted(state):
+        v = state[n]
+        if isinstance(v, (numpy.ndarray, float, int, str, bool, tuple)):
+            _hashUpdate(h, n)
+            _hashUpdate(h, v)
+    return
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""Pair enumeration, peak summation and termination for array PDFs.
+
+These are the common steps of the PDF calculators that evaluate peaks
+for all atom pairs with numpy, i.e., PairList and the ArrayPDFCalculator
+in cmi_scripts/pdfrectprofile:
+
+from cmi_plugins.pdfpeaks import collectPairs, sumPeaks, terminatePDF
+pairs = collectPairs(stru, rmax=20)
+rdf = sumPeaks(r, d, xlo, xhi, weight, profile)
+g = terminatePDF(g, rstep, qmin, qmax)
+"""
+
+import numpy
+
+
+class PairArrays(object):
+    '''Atom pairs of a structure as returned by collectPairs.
+
+    Every pair of sites is listed once as enumerated by srreal.
+
+    sites0, sites1 -- site indices of the pair atoms
+    distances  -- pair distances
+    directions -- unit vectors from the site0 to the site1 atom
+    uijsum     -- sums of the Cartesian displacement tensors of the two
+                  atoms.  The tensor of the site1 atom is transformed by
+                  the symmetry operation that generated its position.
+    sumscale   -- summation scale, 2 for pairs that stand also for
+                  the reversed pair, otherwise 1
+    multiplicities -- multiplicities of the pairs in the structure
+    '''
+
+    def __init__(self, pairs):
+        a = numpy.array(pairs, dtype=float).reshape(-1, 17)
+        self.sites0 = a[:, 0].astype(int)
+        self.sites1 = a[:, 1].astype(int)
+        self.distances = a[:, 2]
+        self.directions = a[:, 3:6]
+        self.uijsum = a[:, 6:15].reshape(-1, 3, 3)
+        self.sumscale = a[:, 15]
+        self.multiplicities = a[:, 16]
+        return
+
+
+    def __len__(self):
+        return len(self.distances)
+
+
+    def msd(self):
+        '''Return mean square displacements along the pair directions.
+        '''
+        u = self.directions
+        return numpy.einsum('ki,kij,kj->k', u, self.uijsum, u)
+
+# end of class PairArrays
+
+
+def collectPairs(stru, rmax, rmin=0.0):
+    '''Enumerate atom pairs of a structure within the distance range.
+
+    stru -- structure object supported by srreal
+    rmax -- maximum pair distance
+    rmin -- minimum pair distance.  Pairs of zero length are skipped.
+
+    Return PairArrays.
+    '''
+    from diffpy.srreal.pairquantity import PairQuantity
+
+    class PairCollector(PairQuantity):
+
+        def __init__(self):
+            PairQuantity.__init__(self)
+            self.pairs = []
+            return
+
+        def _addPairContribution(self, bnds, sumscale):
+            d = bnds.distance()
+            if not d > 0:
+                return
+            u = (numpy.array(bnds.r1()) - numpy.array(bnds.r0())) / d
+            uij = (numpy.array(bnds.Ucartesian0()) +
+                   numpy.array(bnds.Ucartesian1()))
+            self.pairs.append((bnds.site0(), bnds.site1(), d) + tuple(u) +
+                              tuple(uij.ravel()) +
+                              (sumscale, bnds.multiplicity()))
+            return
+
+    pc = PairCollector()
+    pc.rmin = rmin
+    pc.rmax = rmax
+    pc.eval(stru)
+    return PairArrays(pc.pairs)
+
+
+def rippleExtension(qmax, rstep):
+    '''Return r-range of 10 termination ripples but at most 10 A.
+
+    The range is zero when qmax does not terminate the PDF sampled
+    with rstep.
+    '''
+    if not qmax < numpy.pi / rstep:
+        return 0.0
+    return min(10.0, 10 * 2 * numpy.pi / qmax)
+
+
+def terminatePDF(g, dr, qmin, qmax):
+    '''Remove Q-components outside of [qmin, qmax] from G on r-grid.
+
+    g    -- G values on r-grid dr * arange(len(g)) starting at zero
+
+    This uses the discrete sine transformation, which is the exact
+    Fourier transformation of an odd band-limited function.
+
+    Return the terminated G as a new array.
+    '''
+    from scipy.fft import dst, idst
+    n = len(g)
+    if n < 3:
+        return g
+    fq = dst(g[1:], type=1)
+    q = numpy.pi * numpy.arange(1, n) / (n * dr)
+    fq[(q < qmin) | (q > qmax)] = 0.0
+    rv = numpy.zeros_like(g)
+    rv[1:] = idst(fq, type=1)
+    return rv
+
+
+def sumPeaks(r, d, xlo, xhi, weight, profile, chunksize=2**20):
+    '''Sum weighted peak profiles over the r-grid.
+
+    r        -- sorted r-grid
+    d        -- array of the peak positions
+    xlo, xhi -- arrays of the profile bounds relative to the peak
+                positions, the profiles are zero outside
+    weight   -- array of the peak weights
+    profile  -- function profile(x, ipeak) that returns the profile
+                values at offsets x from the positions of the peaks
+                with indices ipeak
+    chunksize -- maximum number of profile values evaluated at once
+
+    Return array of the summed peaks on the r-grid.
+    '''
+    rdf = numpy.zeros_like(r)
+    if not len(d) or not len(r):
+        return rdf
+    lo = numpy.searchsorted(r, d + xlo, side='left')
+    hi = numpy.searchsorted(r, d + xhi, side='right')
+    npts = numpy.maximum(hi - lo, 0)
+    # split peaks into chunks with about chunksize profile points
+    cnt = numpy.cumsum(npts)
+    bounds = numpy.searchsorted(cnt,
+            numpy.arange(chunksize, cnt[-1], chunksize))
+    bounds = numpy.unique(numpy.r_[0, bounds, len(d)])
+    for b0, b1 in zip(bounds[:-1], bounds[1:]):
+        n = npts[b0:b1]
+        ntot = n.sum()
+        if not ntot:
+            continue
+        ipeak = numpy.repeat(numpy.arange(b0, b1), n)
+        # offsets of every point within its window
+        offset = numpy.arange(ntot) - numpy.repeat(numpy.cumsum(n) - n, n)
+        ir = lo[ipeak] + offset
+        y = profile(r[ir] - d[ipeak], ipeak)
+        rdf += numpy.bincount(ir, weights=weight[ipeak] * y,
+                              minlength=len(r))
+    return rdf
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""Parallel PDF simulations over a grid of calculator and structure settings.
+
+Usage:
+
+from cmi_plugins.pdfsweep import sweepPDF
+dpc = DebyePDFCalculator(qmax=20, rmax=20)
+grid = dict(qmin=numpy.linspace(0, 2, 21),
+            Uiso=numpy.linspace(0.002, 0.02, 25))
+sweep = sweepPDF(c60, dpc, grid, filename='c60sweep.npy')
+plot(sweep.r, sweep.G[sweep.index(qmin=1, Uiso=0.005)])
+
+The calculations run in a pool of worker processes, each of them gets
+a copy of the structure and calculator at start.  The PDFs are written to
+one preallocated 2D array, which can be a memory-mapped numpy file for
+sweeps that do not fit in memory.
+"""
+
+import copy
+import itertools
+from collections import OrderedDict
+import numpy
+
+
+def _setUiso(stru, value):
+    stru.Uisoequiv = value
+    return
+
+
+def _setLatticeScale(stru, value):
+    a, b, c, alpha, beta, gamma = stru.lattice.abcABG()
+    stru.lattice.setLatPar(value * a, value * b, value * c)
+    return
+
+# Settings that modify a copy of the structure.  The values are functions
+# of (structure, value).  Other settings are set as calculator attributes.
+STRUCTURE_SETTINGS = {
+    'Uiso' : _setUiso,
+    'latscale' : _setLatticeScale,
+}
+
+
+class PDFSweepResults(object):
+    '''PDFs calculated over a grid of settings.
+
+    names    -- list of the swept setting names
+    values   -- 2D array of the setting values, one row per calculation
+    r        -- r-grid shared by all calculations
+    G        -- 2D array of the PDFs, one row per calculation.  Rows of
+                failed calculations are filled with NaN.
+    failures -- dictionary of error messages for failed calculations
+    filename -- path to the memory-mapped G array or None
+    '''
+
+    def __init__(self, names, values, r, G, filename=None):
+        self.names = list(names)
+        self.values = numpy.asarray(values, dtype=float)
+        self.r = numpy.asarray(r, dtype=float)
+        self.G = G
+        self.failures = {}
+        self.filename = filename
+        return
+
+
+    def settings(self, i):
+        '''Return ordered dictionary of settings for calculation i.
+        '''
+        return OrderedDict(zip(self.names, self.values[i].tolist()))
+
+
+    def index(self, **settings):
+        '''Return index of the calculation closest to the given settings.
+
+        Settings that are not specified are ignored.
+        '''
+        cols = [self.names.index(n) for n in settings]
+        target = numpy.array(list(settings.values()), dtype=float)
+        dist = numpy.sum((self.values[:, cols] - target)**2, axis=1)
+        return int(numpy.argmin(dist))
+
+
+    def saveMetadata(self, filename=None):
+        '''Save names, values, r and failures to a .npz file.
+
+        filename -- path of the metadata file.  By default use the
+                    G file name with the ".meta.npz" suffix.
+        '''
+        if filename is None:
+            if self.filename is None:
+                raise ValueError("Metadata filename must be specified.")
+            filename = _metadataFilename(self.filename)
+        failed = numpy.array(sorted(self.failures), dtype=int)
+        messages = numpy.array([self.failures[i] for i in failed], dtype=str)
+        with open(filename, 'wb') as fp:
+            numpy.savez(fp, names=numpy.array(self.names, dtype=str),
+                        values=self.values, r=self.r,
+                        failed=failed, messages=messages)
+        return
+
+# end of class PDFSweepResults
+
+
+def loadPDFSweep(filename, mmap_mode='r'):
+    '''Load sweep results saved by sweepPDF with memory-mapped output.
+
+    filename -- path to the .npy file with the G array
+    mmap_mode -- memory-map mode for the G array, None to read it
+                 to memory
+
+    Return PDFSweepResults.
+    '''
+    G = numpy.load(filename, mmap_mode=mmap_mode)
+    meta = numpy.load(_metadataFilename(filename))
+    rv = PDFSweepResults(meta['names'].tolist(), meta['values'],
+                         meta['r'], G, filename=filename)
+    rv.failures = dict(zip(meta['failed'].tolist(),
+                           meta['messages'].tolist()))
+    return rv
+
+
+def sweepPDF(stru, calc, grid, workers=None, filename=None,
+             chunksize=None, progress=None):
+    '''Calculate PDFs for all combinations of settings in parallel.
+
+    stru -- structure object supported by the calculator
+    calc -- PDFCalculator or DebyePDFCalculator object
+    grid -- dictionary or list of (name, values) pairs.  Names are
+            calculator attributes, e.g., qmin, qmax or qdamp, or the
+            structure settings "Uiso" for isotropic displacement of all
+            atoms and "latscale" for the scale of lattice parameters.
+            All combinations of the values are calculated.
+    workers -- number of worker processes.  Use all CPUs when None.
+            With workers=1 the calculations run in the calling process.
+    filename -- optional path to a .npy file for memory-mapped PDF array.
+            The metadata are saved next to it with a ".meta.npz" suffix
+            and the results can be reopened with loadPDFSweep.
+    chunksize -- number of calculations sent to a worker at a time.
+            When None, split them to about 4 chunks per worker.
+    progress -- optional function called as progress(ndone, ntotal)
+            after each finished calculation.
+
+    The r-grid must be the same for all calculations, therefore rmin,
+    rmax and rstep cannot be swept.
+
+    Return PDFSweepResults with the calculations in the row-major order
+    of the grid, i.e., the last setting changes fastest.
+    '''
+    from cmi_plugins.workerpool import WorkerPool
+    grid = OrderedDict(grid)
+    names = list(grid.keys())
+    for n in names:
+        if n in ('rmin', 'rmax', 'rstep'):
+            emsg = "Cannot sweep %r, r-grid must be fixed." % n
+            raise ValueError(emsg)
+        if n not in STRUCTURE_SETTINGS and not hasattr(calc, n):
+            emsg = "Unknown setting %r." % n
+            raise ValueError(emsg)
+    values = numpy.array(list(itertools.product(*grid.values())),
+                         dtype=float).reshape(-1, len(names))
+    n = len(values)
+    r = numpy.array(calc.rgrid)
+    shape = (n, len(r))
+    if filename is None:
+        G = numpy.empty(shape)
+    else:
+        G = numpy.lib.format.open_memmap(filename, mode='w+',
+                                         dtype=float, shape=shape)
+    res = PDFSweepResults(names, values, r, G, filename=filename)
+    tasks = ((i, values[i]) for i in range(n))
+    pool = WorkerPool(_makeSweepState, _sweepTask,
+                      (stru, calc, names, filename, len(r)), workers)
+    if chunksize is None:
+        chunksize = pool.chunkSize(n)
+    results = pool.imap_unordered(tasks, chunksize)
+    try:
+        for ndone, rv in enumerate(results, 1):
+            i, g, emsg = rv
+            if emsg is not None:
+                res.failures[i] = emsg
+                G[i] = numpy.nan
+            elif g is not None:
+                G[i] = g
+            if progress is not None:
+                progress(ndone, n)
+    finally:
+        pool.close()
+    if filename is not None:
+        G.flush()
+        res.saveMetadata()
+    return res
+
+# Helpers --------------------------------------------------------------------
+
+def _metadataFilename(filename):
+    base = filename[:-4] if filename.endswith('.npy') else filename
+    return base + '.meta.npz'
+
+
+def _makeSweepState(stru, calc, names, filename, npts):
+    '''Return worker state for sweepPDF as a dictionary.
+    '''
+    state = dict(stru=stru, calc=calc.copy(), names=names,
+                 npts=npts, G=None)
+    if filename is not None:
+        state['G'] = numpy.load(filename, mmap_mode='r+')
+    return state
+
+
+def _sweepTask(state, task):
+    '''Calculate PDF for one combination of settings.
+
+    state -- worker state from _makeSweepState
+    task  -- tuple of (index, values)
+
+    Return tuple of (index, G, errormessage).  G is None when it was
+    written to the memory-mapped array.
+    '''
+    i, values = task
+    calc = state['calc']
+    stru = state['stru']
+    try:
+        if any(n in STRUCTURE_SETTINGS for n in state['names']):
+            stru = copy.deepcopy(stru)
+        for n, v in zip(state['names'], values):
+            if n in STRUCTURE_SETTINGS:
+                STRUCTURE_SETTINGS[n](stru, v)
+            else:
+                setattr(calc, n, v)
+        r, g = calc(stru)
+        if len(g) != state['npts']:
+            raise ValueError("Calculated PDF has a different r-grid.")
+    except Exception as e:
+        return (i, None, "%s: %s" % (type(e).__name__, e))
+    G = state['G']
+    if G is None:
+        return (i, numpy.asarray(g), None)
+    G[i] = g
+    return (i, None, None)
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""Sequential refinement of one FitRecipe to a series of datasets.
+
+Usage for a temperature series refined with the fitNi.py recipe:
+
+from cmi_plugins.seqrefine import sequentialFit
+datafiles = sorted(glob.glob('ramp/ni-*.gr'))
+res = sequentialFit(niFit, niPDF, datafiles, 'ni-ramp.tsv')
+plot(res.values[:, res.names.index('a')])
+
+The recipe is built only once.  For every dataset sequentialFit loads
+the data to the observed profile of the contribution and keeps its
+calculation points, structure and calculators.  Each refinement starts
+from the optimum of the previous dataset.  The results are appended
+to a tab-separated table with one column per variable and uncertainty.
+The table is also the checkpoint of the run.  When the run is started
+again with the same table file, datasets that already have a row are
+skipped and the refinement continues from the last optimum.
+"""
+
+import os
+import numpy
+
+# Leading columns of the table file written by sequentialFit.
+_COLUMNS = ('index', 'filename', 'chi2', 'rw', 'nfev', 'converged')
+
+
+class SequentialFitResults(object):
+    '''Optima of the refinements to a series of datasets.
+
+    Array attributes have one item or row per dataset in the order of
+    the data files.
+
+    names      -- list of the refined variable names
+    filenames  -- list of the data files
+    values     -- 2D array of the refined values, NaN for failed fits
+    uncertainties -- 2D array of the estimated standard uncertainties
+    chi2       -- final sum of squared residuals
+    rw         -- Rw goodness of fit
+    nfev       -- number of residual evaluations
+    converged  -- True for fits where leastsq reported success
+    failures   -- dictionary of error messages for datasets that could
+                  not be loaded or refined, the keys are file indices.
+    '''
+
+    def __init__(self, names, filenames):
+        self.names = list(names)
+        self.filenames = list(filenames)
+        n = len(self.filenames)
+        m = len(self.names)
+        self.values = numpy.nan * numpy.ones((n, m))
+        self.uncertainties = numpy.nan * numpy.ones((n, m))
+        self.chi2 = numpy.nan * numpy.ones(n)
+        self.rw = numpy.nan * numpy.ones(n)
+        self.nfev = numpy.zeros(n, dtype=int)
+        self.converged = numpy.zeros(n, dtype=bool)
+        self.failures = {}
+        return
+
+
+    def __len__(self):
+        return len(self.filenames)
+
+# end of class SequentialFitResults
+
+
+def sequentialFit(recipe, contribution, datafiles, filename=None,
+                  warmstart=True, parser=None, progress=None, **kwargs):
+    '''Refine FitRecipe to a series of datasets one after another.
+
+    recipe   -- FitRecipe with the free variables to be refined
+    contribution -- FitContribution of the recipe, which gets the data
+    datafiles -- list of the data files in the order of refinement
+    filename -- optional path of a tab-separated table, where a row is
+                written after each dataset.  When the table exists,
+                the datasets it contains are loaded from it and skipped.
+    warmstart -- start each refinement from the optimum of the previous
+                dataset.  When False, start from the recipe values at
+                the time of the call.
+    parser   -- class of the parser for the data files, for example
+                cmi_plugins.fastread.CachedPDFParser.
+                Use PDFParser when None.
+    progress -- optional function called as progress(ndone, ntotal)
+                after each refined dataset.
+    kwargs   -- extra keyword arguments for scipy.optimize.leastsq,
+                e.g., maxfev
+
+    Datasets that fail to load or refine do not abort the series, they
+    are reported in the failures attribute and in the error column.
+    The next refinement then starts from the last successful optimum.
+    When done, the recipe has the values from the last dataset.
+
+    Return SequentialFitResults.
+    '''
+    if parser is None:
+        from diffpy.srfit.pdf.pdfparser import PDFParser
+        parser = PDFParser
+    names = recipe.getNames()
+    res = SequentialFitResults(names, datafiles)
+    x0 = numpy.array(recipe.getValues(), dtype=float)
+    xlast = x0
+    start = 0
+    if filename is not None and os.path.exists(filename):
+        done = loadSequentialFit(filename)
+        _checkResumed(done, res)
+        start = len(done)
+        res.values[:start] = done.values
+        res.uncertainties[:start] = done.uncertainties
+        res.chi2[:start] = done.chi2
+        res.rw[:start] = done.rw
+        res.nfev[:start] = done.nfev
+        res.converged[:start] = done.converged
+        res.failures.update(done.failures)
+        good = [i for i in range(start) if i not in res.failures]
+        if good:
+            xlast = res.values[good[-1]]
+        # drop an incomplete row of an interrupted run
+        _writeTable(filename, res, start)
+    elif filename is not None:
+        _writeTable(filename, res, 0)
+    # keep calculation points of the recipe for all datasets
+    profile = contribution.profile
+    xcalc = numpy.array(profile.x, dtype=float)
+    fp = None
+    if filename is not None:
+        fp = open(filename, 'a')
+    try:
+        for i in range(start, len(res)):
+            p0 = xlast if warmstart else x0
+            rv = _refineDataset(recipe, contribution, xcalc,
+                                res.filenames[i], parser, p0, kwargs)
+            (res.values[i], res.uncertainties[i], res.chi2[i], res.rw[i],
+             res.nfev[i], res.converged[i], emsg) = rv
+            if emsg is None:
+                xlast = res.values[i]
+            else:
+                res.failures[i] = emsg
+            if fp is not None:
+                fp.write(_formatRow(res, i))
+                fp.flush()
+                os.fsync(fp.fileno())
+            if progress is not None:
+                progress(i + 1, len(res))
+    finally:
+        if fp is not None:
+            fp.close()
+    return res
+
+
+def loadSequentialFit(filename):
+    '''Load table file written by sequentialFit.
+
+    Rows of an unfinished run are loaded as well.
+
+    Return SequentialFitResults for the datasets in the table.
+    '''
+    rows = []
+    with open(filename) as fp:
+        header = fp.readline().rstrip('\n').split('\t')
+        m = (len(header) - len(_COLUMNS) - 1) // 2
+        if (tuple(header[:len(_COLUMNS)]) != _COLUMNS or m < 0 or
+                header[-1] != 'error'):
+            emsg = "%s is not a sequential refinement table." % filename
+            raise ValueError(emsg)
+        for line in fp:
+            if not line.endswith('\n'):
+                break
+            w = line.rstrip('\n').split('\t')
+            if len(w) == len(header):
+                rows.append(w)
+    n0 = len(_COLUMNS)
+    res = SequentialFitResults(header[n0:n0 + m], [w[1] for w in rows])
+    for i, w in enumerate(rows):
+        res.chi2[i] = float(w[2])
+        res.rw[i] = float(w[3])
+        res.nfev[i] = int(w[4])
+        res.converged[i] = (w[5] == 'True')
+        res.values[i] = numpy.array(w[n0:n0 + m], dtype=float)
+        res.uncertainties[i] = numpy.array(w[n0 + m:n0 + 2 * m], dtype=float)
+        if w[-1]:
+            res.failures[i] = w[-1]
+    return res
+
+# Helpers --------------------------------------------------------------------
+
+def _refineDataset(recipe, contribution, xcalc, datafile, parser, p0,
+                   kwargs):
+    '''Load one dataset to the contribution and refine the recipe.
+
+    Return a tuple of (values, uncertainties, chi2, rw, nfev, converged,
+    emsg), where emsg is None for successful refinements.
+    '''
+    from scipy.optimize import leastsq
+    from cmi_plugins.ipy_gaussianfit import _fitResultsFromCovariance
+    nans = numpy.nan * numpy.ones_like(p0)
+    try:
+        prs = parser()
+        prs.parseFile(datafile)
+        profile = contribution.profile
+        profile.loadParsedData(prs)
+        profile.setCalculationPoints(xcalc)
+        # update generators for the metadata, e.g., qmax of the dataset
+        for gen in _profileGenerators(contribution):
+            gen.setProfile(profile)
+        rv = leastsq(recipe.residual, p0, full_output=True, **kwargs)
+        values = numpy.atleast_1d(rv[0])
+        recipe.residual(values)
+        # uncertainties from the leastsq covariance, no extra Jacobian
+        results = _fitResultsFromCovariance(recipe, rv[1])
+        unc = numpy.array(results.varunc, dtype=float)
+        nfev = rv[2]['nfev']
+        converged = rv[4] in (1, 2, 3, 4)
+    except Exception as e:
+        emsg = "%s: %s" % (type(e).__name__, e)
+        return (nans, nans, numpy.nan, numpy.nan, 0, False, emsg)
+    return (values, unc, results.chi2, results.rw, nfev, converged, None)
+
+
+def _profileGenerators(contribution):
+    '''Return list of the ProfileGenerators used by a FitContribution.
+    '''
+    if hasattr(contribution, 'getGenerators'):
+        return list(contribution.getGenerators())
+    from diffpy.srfit.fitbase import ProfileGenerator
+    return [obj for obj in vars(contribution).values()
+            if isinstance(obj, ProfileGenerator)]
+
+
+def _checkResumed(done, res):
+    '''Verify that a loaded table matches the variables and data files.
+    '''
+    if done.names != res.names:
+        emsg = "Table variables %s do not match the recipe %s." % (
+            ', '.join(done.names), ', '.join(res.names))
+        raise ValueError(emsg)
+    if done.filenames != res.filenames[:len(done)]:
+        emsg = "Table data files do not match the datafiles argument."
+        raise ValueError(emsg)
+    return
+
+
+def _writeTable(filename, res, n):
+    '''Write table header and the first n rows to a file atomically.
+    '''
+    columns = (list(_COLUMNS) + res.names +
+               [nm + '_unc' for nm in res.names] + ['error'])
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'w') as fp:
+        fp.write('\t'.join(columns) + '\n')
+        for i in range(n):
+            fp.write(_formatRow(res, i))
+    if hasattr(os, 'replace'):
+        os.replace(tmpname, filename)
+    else:
+        if os.path.exists(filename):
+            os.remove(filename)
+        os.rename(tmpname, filename)
+    return
+
+
+def _formatRow(res, i):
+    '''Return one line of the sequential refinement table.
+    '''
+    emsg = res.failures.get(i, '')
+    fields = [str(i), res.filenames[i], repr(float(res.chi2[i])),
+              repr(float(res.rw[i])), str(res.nfev[i]),
+              str(bool(res.converged[i]))]
+    fields += [repr(float(v)) for v in res.values[i]]
+    fields += [repr(float(v)) for v in res.uncertainties[i]]
+    fields.append(emsg.replace('\t', ' ').replace('\n', ' '))
+    return '\t'.join(fields) + '\n'
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+########################################################################
+#
+# cmi_exchange      Complex Modeling Initiative
+#                   (c) 2013 Brookhaven National Laboratory,
+#                   Upton, New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+########################################################################
+
+"""Pool of worker processes that keep their own state between tasks.
+
+This is the common machinery of the parallel functions in cmi_plugins,
+such as screenBVS, sweepPDF or multistartFit.  Every worker creates its
+state once, e.g., a copy of a calculator or recipe, and then applies a
+task function to the items it receives:
+
+from cmi_plugins.workerpool import WorkerPool
+with WorkerPool(makeState, runTask, (recipe,), workers=4) as pool:
+    for rv in pool.imap_unordered(tasks):
+        ...
+
+makeState and runTask must be module-level functions, so that they can
+be sent to the worker processes.  With workers=1 the tasks run in the
+calling process and the state is kept by the WorkerPool object.
+"""
+
+# state and task function of the current worker process
+_workerState = None
+
+
+class WorkerPool(object):
+    '''Worker processes or the calling process with a task state.
+
+    makestate -- function that returns the worker state when called
+                 as makestate(*args)
+    task      -- function that evaluates one item as task(state, item)
+    args      -- tuple of arguments for makestate
+    workers   -- number of worker processes.  Use all CPUs when None.
+                 With workers=1 the tasks run in the calling process.
+
+    Attributes:
+
+    workers  -- actual number of the worker processes
+    '''
+
+    def __init__(self, makestate, task, args=(), workers=None):
+        import multiprocessing
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.workers = workers
+        self._task = task
+        self._state = None
+        self._pool = None
+        if workers == 1:
+            self._state = makestate(*args)
+        else:
+            self._pool = multiprocessing.Pool(workers,
+                    initializer=_initWorker, initargs=(makestate, task, args))
+        return
+
+
+    def imap_unordered(self, items, chunksize=1):
+        '''Apply the task function to the items.
+
+        items    -- iterable of the task items
+        chunksize -- number of items sent to a worker at a time
+
+        Return an iterator of the task results in arbitrary order.
+        '''
+        if self._pool is None:
+            return (self._task(self._state, item) for item in items)
+        return self._pool.imap_unordered(_runTask, items, chunksize)
+
+
+    def chunkSize(self, n):
+        '''Return chunk size that splits n items to 4 chunks per worker.
+        '''
+        return max(1, n // (4 * self.workers))
+
+
+    def close(self):
+        '''Stop the worker processes and release the state.
+        '''
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+        self._pool = None
+        self._state = None
+        return
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return
+
+# end of class WorkerPool
+
+# Helpers --------------------------------------------------------------------
+
+def _initWorker(makestate, task, args):
+    '''Create the state of a worker process.
+    '''
+    global _workerState
+    _workerState = (makestate(*args), task)
+    return
+
+
+def _runTask(item):
+    '''Apply the task function of a worker process to one item.
+    '''
+    state, task = _workerState
+    return task(state, item)
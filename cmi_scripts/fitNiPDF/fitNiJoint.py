@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+# We'll need numpy and matplotlib for plotting our results
+import numpy as np
+import matplotlib.pyplot as plt
+
+# A least squares fitting algorithm from scipy
+from scipy.optimize.minpack import leastsq
+
+# DiffPy-CMI modules for building a fitting recipe
+from diffpy.Structure import loadStructure
+from diffpy.srfit.pdf import PDFContribution
+from diffpy.srfit.fitbase import FitRecipe, FitResults
+
+# Generators that share the atom pairs of a phase, see cmi_plugins/README.md
+# for the setup of the Python path.
+from cmi_plugins.jointpdf import SharedPairList, addSharedPhase
+
+# Files containing our experimental data and structure file
+xrayDataFile = "ni-q27r60-xray.gr"
+neutronDataFile = "ni-q27r100-neutron.gr"
+structureFile = "ni.cif"
+spaceGroup = "Fm-3m"
+
+# This example refines one Ni structure against the X-ray and neutron PDFs
+# at the same time.  Each dataset gets its own contribution.  The metadata
+# in the data files set the scattering type and Q-range for each of them.
+xrayPDF = PDFContribution("xray")
+xrayPDF.loadData(xrayDataFile)
+xrayPDF.setCalculationRange(xmin=1, xmax=20, dx=0.01)
+
+neutronPDF = PDFContribution("neutron")
+neutronPDF.loadData(neutronDataFile)
+neutronPDF.setCalculationRange(xmin=1, xmax=20, dx=0.01)
+
+# Both contributions use the same phase.  The SharedPairList finds the atom
+# pairs of the phase once per change of the structure, both contributions
+# then only weight the pairs with their own scattering factors and
+# instrument parameters.
+niStructure = loadStructure(structureFile)
+pairs = SharedPairList()
+niPhase = addSharedPhase(xrayPDF, "nickel", niStructure, pairs)
+addSharedPhase(neutronPDF, "nickel", niPhase, pairs)
+
+# The FitRecipe optimizes both contributions together.
+niFit = FitRecipe()
+niFit.addContribution(xrayPDF)
+niFit.addContribution(neutronPDF)
+
+# The lattice and ADP parameters of the shared phase are constrained by the
+# Fm-3m space group.  They are added only once, because both contributions
+# refer to the same phase.
+from diffpy.srfit.structure import constrainAsSpaceGroup
+spaceGroupParams = constrainAsSpaceGroup(niPhase, spaceGroup)
+for par in spaceGroupParams.latpars:
+    niFit.addVar(par)
+for par in spaceGroupParams.adppars:
+    niFit.addVar(par, value=0.005)
+
+# The PDF scale and the Qdamp instrument resolution are specific to each
+# dataset.  The correlated motion parameter delta2 describes the structure,
+# so it is shared by both generators.
+niFit.addVar(xrayPDF.scale, 1, name="xscale")
+niFit.addVar(neutronPDF.scale, 1, name="nscale")
+niFit.addVar(xrayPDF.qdamp, 0.06, name="xqdamp")
+niFit.addVar(neutronPDF.qdamp, 0.03, name="nqdamp", fixed=True)
+delta2 = niFit.newVar("delta2", 5)
+niFit.constrain(xrayPDF.nickel.delta2, delta2)
+niFit.constrain(neutronPDF.nickel.delta2, delta2)
+
+# Turn off printout of iteration number.
+niFit.clearFitHooks()
+
+# We can now execute the fit using scipy's least square optimizer.
+print("Refine X-ray and neutron PDFs using scipy's least-squares optimizer:")
+print("  variables:", niFit.names)
+print("  initial values:", niFit.values)
+leastsq(niFit.residual, niFit.values)
+print("  final values:", niFit.values)
+print()
+
+# Obtain and display the fit results.
+niResults = FitResults(niFit)
+print("FIT RESULTS\n")
+print(niResults)
+
+# The counts show how often the pairs were found again, updated for new
+# displacement parameters or reused by the second contribution.
+print("Shared pair list usage:", pairs.counts)
+
+# Plot the observed and refined PDFs for both datasets.
+plt.figure()
+for i, con in enumerate((xrayPDF, neutronPDF)):
+    r = con.profile.x
+    gobs = con.profile.y
+    gcalc = con.evaluate()
+    gdiff = gobs - gcalc
+    baseline = 1.1 * gobs.min()
+    plt.subplot(2, 1, i + 1)
+    plt.plot(r, gobs, 'bo', label="G(r) %s data" % con.name,
+             markerfacecolor='none', markeredgecolor='b')
+    plt.plot(r, gcalc, 'r-', label="G(r) fit")
+    plt.plot(r, gdiff + baseline, 'g-', label="G(r) diff")
+    plt.plot(r, np.zeros_like(r) + baseline, 'k:')
+    plt.ylabel(r"G ($\AA^{-2}$)")
+    plt.legend()
+plt.xlabel(r"r ($\AA$)")
+
+plt.show()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+"""Profile functions evaluated over arrays of points.
+
+PDFCalculator evaluates the peak profile one grid point at a time.  For
+profiles defined in Python this means one Python call per point of every
+atom pair, which makes the calculation very slow.  ArrayPeakProfile
+subclasses define an evaluate(x, fwhm) method that works with numpy
+arrays.  They remain regular PeakProfile objects and can be still used
+with PDFCalculator, but ArrayPDFCalculator evaluates them for all pairs
+at once with a few numpy calls.
+"""
+
+import numpy
+from diffpy.srreal.peakprofile import PeakProfile
+from cmi_plugins.pdfpeaks import (collectPairs, rippleExtension,
+                                  terminatePDF, sumPeaks)
+
+
+class ArrayPeakProfile(PeakProfile):
+    """Base class for profile functions that are evaluated over arrays.
+
+    Derived classes must define evaluate and the PeakProfile methods
+    clone, create, type, xboundlo and xboundhi.
+    """
+
+    def evaluate(self, x, fwhm):
+        """Evaluate profile function centered at zero.
+
+        x    -- numpy array of points to calculate the profile at
+        fwhm -- profile width, either a scalar or an array
+                of the same shape as x
+
+        Return numpy array of profile values at x.
+        """
+        raise NotImplementedError("evaluate must be defined in a subclass.")
+
+    # overload functions from the base class
+
+    def __call__(self, x, fwhm):
+        """Evaluate profile at a single point x.
+
+        This is used by the PDFCalculator.  The conversion from and to
+        numpy arrays is slow for a single point, derived classes should
+        override this with a plain Python expression.
+        """
+        return float(self.evaluate(numpy.float64(x), fwhm))
+
+# end of class ArrayPeakProfile
+
+
+class ArrayPDFCalculator(object):
+    """Calculate PDF with ArrayPeakProfile evaluated over numpy arrays.
+
+    The attributes have the same meaning as in the PDFCalculator.  Peak
+    widths follow the "jeong" peak width model, which is the same as the
+    "debye-waller" model for zero delta1, delta2 and qbroad.  Peaks are
+    scaled with the scattering factors at Q=0.  The PDF is terminated at
+    qmin and qmax and the scale and qdamp envelopes are applied.
+
+    peakprofile -- ArrayPeakProfile instance
+    rmin, rmax, rstep -- r-grid of the calculated PDF.  The grid points
+                    are integer multiples of rstep like in PDFCalculator.
+    qmin, qmax  -- Q-range of the termination.  The PDF is evaluated
+                    over an r-grid extended by 10 termination ripples and
+                    the Q-components outside of the range are removed.
+    scale       -- scale factor of the PDF
+    qdamp       -- Gaussian damping of the PDF due to Q-resolution
+    delta1, delta2 -- coefficients of the 1/r and 1/r**2 sharpening
+                    of the correlated motion
+    qbroad      -- peak broadening due to Q-resolution
+    scatteringfactortable -- type of ScatteringFactorTable, e.g., "xray"
+                    or "neutron"
+    chunksize   -- maximum number of profile values evaluated in one
+                    numpy call
+    """
+
+    def __init__(self, peakprofile, **kwargs):
+        self.peakprofile = peakprofile
+        self.rmin = 0.0
+        self.rmax = 10.0
+        self.rstep = 0.01
+        self.qmin = 0.0
+        self.qmax = 100.0
+        self.scale = 1.0
+        self.qdamp = 0.0
+        self.delta1 = 0.0
+        self.delta2 = 0.0
+        self.qbroad = 0.0
+        self.scatteringfactortable = 'xray'
+        self.chunksize = 2**20
+        for n, v in kwargs.items():
+            if not hasattr(self, n):
+                emsg = "Invalid keyword argument %r." % n
+                raise TypeError(emsg)
+            setattr(self, n, v)
+        return
+
+
+    @property
+    def rgrid(self):
+        "Numpy array of r-points where the PDF is calculated."
+        i0 = int(numpy.ceil(self.rmin / self.rstep))
+        i1 = int(numpy.ceil(self.rmax / self.rstep))
+        return self.rstep * numpy.arange(max(0, i0), i1)
+
+
+    def __call__(self, stru):
+        """Calculate PDF for the specified structure.
+
+        stru -- structure object that can be converted to
+                the srreal StructureAdapter
+
+        Return a tuple of (r, G) numpy arrays.
+        """
+        from diffpy.srreal.structureadapter import createStructureAdapter
+        from diffpy.srreal.scatteringfactortable import ScatteringFactorTable
+        adpt = createStructureAdapter(stru)
+        r = self.rgrid
+        nsites = adpt.countSites()
+        sft = ScatteringFactorTable.createByType(self.scatteringfactortable)
+        sf = numpy.array([sft.lookup(adpt.siteAtomType(i))
+                          for i in range(nsites)])
+        occ = numpy.array([adpt.siteOccupancy(i) for i in range(nsites)])
+        mult = numpy.array([adpt.siteMultiplicity(i) for i in range(nsites)])
+        uij = numpy.array([adpt.siteCartesianUij(i) for i in range(nsites)])
+        # evaluate on a grid from zero with the ripple extension
+        dr = self.rstep
+        terminate = len(r) and (self.qmax < numpy.pi / dr or self.qmin > 0)
+        rcalc = r
+        if terminate:
+            rext = rippleExtension(self.qmax, dr)
+            rcalc = dr * numpy.arange(int(numpy.ceil((r[-1] + rext) / dr)) + 1)
+        # get all pairs that can contribute to the r-grid
+        i0, i1, d, msd, pairscale = self._getPairs(adpt, uij, rcalc)
+        fwhm = self._peakWidth(d, msd)
+        weight = pairscale * occ[i0] * occ[i1] * sf[i0] * sf[i1]
+        rdf = self._sumPeaks(rcalc, d, fwhm, weight)
+        totocc = numpy.sum(mult * occ)
+        sfavg = numpy.sum(mult * occ * sf) / totocc
+        rdf /= totocc * sfavg**2
+        g = numpy.zeros_like(rcalc)
+        rpos = rcalc > 0
+        g[rpos] = rdf[rpos] / rcalc[rpos]
+        g -= 4 * numpy.pi * adpt.numberDensity() * rcalc
+        if terminate:
+            g = terminatePDF(g, dr, self.qmin, self.qmax)
+            g = g[numpy.round(r / dr).astype(int)]
+        g *= self.scale * numpy.exp(-0.5 * (self.qdamp * r)**2)
+        return r, g
+
+
+    def _getPairs(self, adpt, uij, r):
+        """Return pairs with peaks that overlap with the r-grid.
+
+        Return a tuple of (sites0, sites1, distances, msd, pairscale)
+        arrays, where msd is the mean square displacement along the pair
+        and pairscale the summation scale times the site0 multiplicity.
+        """
+        rhi = r[-1] if len(r) else self.rmax
+        # upper estimate of the peak width at rhi
+        msdmax = 2 * max([numpy.trace(u) for u in uij] + [0.0])
+        fwmax = self._peakWidth(numpy.array([rhi]), numpy.array([msdmax]))[0]
+        fwmax = max(fwmax, self.rstep)
+        rext = max(-self.peakprofile.xboundlo(fwmax),
+                   self.peakprofile.xboundhi(fwmax))
+        pairs = collectPairs(adpt, rhi + rext)
+        pairscale = pairs.sumscale * pairs.multiplicities
+        return (pairs.sites0, pairs.sites1, pairs.distances, pairs.msd(),
+                pairscale)
+
+
+    def _peakWidth(self, d, msd):
+        """Peak widths from pair distances and mean square displacements.
+        """
+        corr = (1.0 - self.delta1 / d - self.delta2 / d**2 +
+                self.qbroad**2 * d**2)
+        fwhm = numpy.sqrt(8 * numpy.log(2) * msd * numpy.maximum(corr, 0.0))
+        return fwhm
+
+
+    def _sumPeaks(self, r, d, fwhm, weight):
+        """Sum weighted profiles centered at d over the r-grid.
+        """
+        if not len(d):
+            return numpy.zeros_like(r)
+        # the profile bounds are evaluated once per distinct width
+        fwu, iu = numpy.unique(fwhm, return_inverse=True)
+        xlo = numpy.array([self.peakprofile.xboundlo(w) for w in fwu])[iu]
+        xhi = numpy.array([self.peakprofile.xboundhi(w) for w in fwu])[iu]
+        profile = lambda x, k: self.peakprofile.evaluate(x, fwhm[k])
+        return sumPeaks(r, d, xlo, xhi, weight, profile, self.chunksize)
+
+# end of class ArrayPDFCalculator
@@ -3,11 +3,15 @@
 """Demonstrate user-defined profile function for PDF calculation.
 """
 
-from diffpy.srreal.peakprofile import PeakProfile
+import numpy
+from arrayprofile import ArrayPeakProfile
 
 
-class RectangleProfile(PeakProfile):
+class RectangleProfile(ArrayPeakProfile):
     """Rectangle profile function with a unit area.
+
+    The profile is evaluated over numpy arrays so it can be used
+    with the fast ArrayPDFCalculator as well as with PDFCalculator.
     """
 
     # overload functions from the base class
@@ -20,7 +24,8 @@ class RectangleProfile(PeakProfile):
                 this is determined from displacement parameters of
                 each contributing pair of atoms.
 
-        Return the profile function at x.
+        Return the profile function at x.  This scalar version is
+        used by PDFCalculator, which calls the profile for every point.
         """
         y = 0.0
         if -fwhm/2.0 < x < +fwhm/2.0:
@@ -28,6 +33,23 @@ class RectangleProfile(PeakProfile):
         return y
 
 
+    def evaluate(self, x, fwhm):
+        """Evaluate rectangle function centered at zero.
+
+        x    -- numpy array of points to calculate the profile at
+        fwhm -- width of the rectangle profile.  In PDF simulation
+                this is determined from displacement parameters of
+                each contributing pair of atoms.
+
+        Return numpy array of the profile function at x.  This is used
+        by ArrayPDFCalculator.
+        """
+        fwhm = numpy.asarray(fwhm, dtype=float)
+        inside = numpy.fabs(x) < 0.5 * fwhm
+        y = numpy.where(inside, 1.0 / numpy.where(inside, fwhm, 1.0), 0.0)
+        return y
+
+
     def clone(self):
         "Return a copy of this profile object."
         import copy
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+"""Peak profile tabulated from an arbitrary shape function.
+
+The profile is fast only in ArrayPDFCalculator, which evaluates it over
+numpy arrays for all atom pairs at once.  PDFCalculator calls the profile
+from C++ once per grid point, so it still pays the Python call overhead
+for every point and is not faster than other Python profiles.
+
+Example of a Lorentzian profile usable with both calculators:
+
+    from tabulatedprofile import TabulatedProfile
+    def lorentzian(u):
+        return 1.0 / (1.0 + 4 * u**2)
+    lp = TabulatedProfile(lorentzian, 'lorentzian', xlo=-20, xhi=20)
+    lp._registerThisType()
+    pc.peakprofile = 'lorentzian'
+"""
+
+import copy
+import numpy
+from arrayprofile import ArrayPeakProfile
+
+
+class TabulatedProfile(ArrayPeakProfile):
+    """Profile function interpolated from a table in units of fwhm.
+
+    The shape function is sampled once when the profile is created.
+    Copies made by clone and create share the same table, which is
+    never modified.  The tabulated shape is scaled to a unit area.
+
+    shape    -- function of a numpy array u = x / fwhm that returns
+                the profile shape.  It does not need to be normalized.
+    name     -- string identifier of this profile type
+    xlo, xhi -- bounds of the tabulated profile in units of fwhm.
+                The profile is zero outside of these bounds.
+    npoints  -- number of tabulated points
+    """
+
+    def __init__(self, shape, name, xlo=-5.0, xhi=5.0, npoints=2001):
+        ArrayPeakProfile.__init__(self)
+        if not xlo < xhi:
+            raise ValueError("xlo must be smaller than xhi.")
+        if npoints < 2:
+            raise ValueError("npoints must be at least 2.")
+        u = numpy.linspace(xlo, xhi, npoints)
+        table = numpy.asarray(shape(u), dtype=float)
+        du = u[1] - u[0]
+        area = numpy.sum(table[1:] + table[:-1]) * du / 2.0
+        if not area > 0:
+            raise ValueError("Shape function must have a positive area.")
+        self._name = name
+        self._xlo = float(xlo)
+        self._xhi = float(xhi)
+        self._du = float(du)
+        self._ugrid = u
+        self._table = table / area
+        self._table.setflags(write=False)
+        self._tablelist = self._table.tolist()
+        return
+
+
+    def evaluate(self, x, fwhm):
+        """Evaluate tabulated profile centered at zero.
+
+        x    -- numpy array of points to calculate the profile at
+        fwhm -- profile width, either a scalar or an array
+                of the same shape as x
+
+        Return numpy array of profile values at x.
+        """
+        fwhm = numpy.asarray(fwhm, dtype=float)
+        valid = fwhm > 0
+        fw = numpy.where(valid, fwhm, 1.0)
+        y = numpy.interp(x / fw, self._ugrid, self._table,
+                         left=0.0, right=0.0) / fw
+        return numpy.where(valid, y, 0.0)
+
+    # overload functions from the base class
+
+    def __call__(self, x, fwhm):
+        """Evaluate profile at a single point x.
+
+        This is used by the PDFCalculator, which calls it for every
+        grid point.  Use ArrayPDFCalculator for fast evaluation.
+        """
+        if not fwhm > 0:
+            return 0.0
+        t = (x / fwhm - self._xlo) / self._du
+        i = int(t)
+        if t < 0 or i >= len(self._tablelist) - 1:
+            return 0.0
+        y0 = self._tablelist[i]
+        y1 = self._tablelist[i + 1]
+        return (y0 + (t - i) * (y1 - y0)) / fwhm
+
+
+    def clone(self):
+        "Return a copy of this profile object."
+        return copy.copy(self)
+
+
+    def create(self):
+        "Return new instance of this profile type."
+        return copy.copy(self)
+
+
+    def type(self):
+        "Return unique string identifier for this profile type."
+        return self._name
+
+
+    def xboundhi(self, fwhm):
+        """Upper bound where the tabulated profile ends."""
+        return self._xhi * fwhm
+
+
+    def xboundlo(self, fwhm):
+        """Lower bound where the tabulated profile starts."""
+        return self._xlo * fwhm
+
+# end of class TabulatedProfile
+
+
+def gaussianShape(u):
+    """Gaussian shape with unit full width at half maximum.
+    """
+    return numpy.exp(-4 * numpy.log(2) * u**2)
+
+# Register tabulated Gaussian so it can be assigned by its string type.
+TabulatedProfile(gaussianShape, 'tabulatedgaussian')._registerThisType()